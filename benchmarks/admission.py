@@ -0,0 +1,189 @@
+"""Burst of popular questions against a rate-limited upstream, by admission setting.
+
+Sends ``--requests`` concurrent ``graph.ainvoke`` calls drawn from a handful of
+popular questions. The fake upstream accepts ``--capacity`` concurrent
+completions and rejects the rest like a 429 response. The client retries a
+rejected call with exponential backoff, like the OpenAI client's ``max_retries``,
+and gives up after ``--max-retries``. The burst runs once per admission setting:
+none, single-flight coalescing only, a per-model concurrency limit and token
+bucket only, and both. Reports completed and failed requests, upstream attempts
+and rejections, and latency percentiles.
+
+Usage:
+    PYTHONPATH=src python -m benchmarks.admission --requests 200 --capacity 8
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import tempfile
+import time
+from typing import Any
+
+from langchain_core.messages import HumanMessage
+
+from agent.admission import AdmissionPolicy
+from agent.graph import build_graph
+from agent.metrics import MetricsRegistry, set_metrics
+from agent.resources import set_registry
+from benchmarks.fakes import (
+    FakeChatModel,
+    FakeEmbeddings,
+    build_synthetic_store,
+    fake_registry,
+)
+
+POPULAR_QUESTIONS = (
+    "How do I configure AWS Lambda concurrency?",
+    "How do I encrypt an S3 bucket?",
+    "Which EC2 instance types support EBS optimisation?",
+    "How do I rotate IAM access keys?",
+    "How do CloudWatch alarms work?",
+)
+
+
+class RateLimitError(Exception):
+    """The fake upstream rejected a request."""
+
+
+class Upstream:
+    """Shared state of the fake provider: capacity and request counts."""
+
+    def __init__(self, capacity: int, max_retries: int, retry_delay: float) -> None:
+        """Create a provider serving ``capacity`` completions at once."""
+        self.capacity = capacity
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.in_flight = 0
+        self.attempts = 0
+        self.rejected = 0
+
+    async def admit(self) -> None:
+        """Take a slot, retrying rejected attempts with exponential backoff."""
+        for attempt in range(self.max_retries + 1):
+            self.attempts += 1
+            if self.in_flight < self.capacity:
+                self.in_flight += 1
+                return
+            self.rejected += 1
+            if attempt < self.max_retries:
+                delay = self.retry_delay * 2**attempt
+                await asyncio.sleep(delay * (1 + random.random()))
+        raise RateLimitError("rate limit exceeded")
+
+
+class RateLimitedChatModel(FakeChatModel):
+    """Fake chat model behind an :class:`Upstream` with limited capacity."""
+
+    upstream: Any = None
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        await self.upstream.admit()
+        try:
+            async for chunk in super()._astream(messages, stop, run_manager, **kwargs):
+                yield chunk
+        finally:
+            self.upstream.in_flight -= 1
+
+
+async def burst(
+    requests: int, admission: AdmissionPolicy | None, args: argparse.Namespace
+) -> dict[str, Any]:
+    """Send ``requests`` concurrent questions through a graph with ``admission``."""
+    upstream = Upstream(args.capacity, args.max_retries, args.retry_delay)
+    registry = fake_registry(
+        args.persist_directory,
+        llm_latency=args.llm_latency,
+        token_latency=args.token_latency,
+        chat_model_factory=lambda latency: RateLimitedChatModel(
+            latency=latency, token_latency=args.token_latency, upstream=upstream
+        ),
+        admission=admission,
+    )
+    previous_registry = set_registry(registry)
+    previous_metrics = set_metrics(MetricsRegistry())
+    rng = random.Random(0)
+    questions = [rng.choice(POPULAR_QUESTIONS) for _ in range(requests)]
+    compiled = build_graph()
+
+    async def ask(question: str) -> float | None:
+        start = time.perf_counter()
+        try:
+            await compiled.ainvoke({"messages": [HumanMessage(content=question)]})
+        except RateLimitError:
+            return None
+        return time.perf_counter() - start
+
+    try:
+        start = time.perf_counter()
+        latencies = await asyncio.gather(*(ask(q) for q in questions))
+        seconds = time.perf_counter() - start
+    finally:
+        set_registry(previous_registry)
+        set_metrics(previous_metrics)
+
+    done = sorted(latency for latency in latencies if latency is not None)
+    percentiles = statistics.quantiles(done, n=20) if len(done) > 1 else [0] * 19
+    return {
+        "completed": len(done),
+        "failed": requests - len(done),
+        "upstream_attempts": upstream.attempts,
+        "rejected": upstream.rejected,
+        "seconds": round(seconds, 3),
+        "p50_ms": round(1000 * statistics.median(done), 1) if done else None,
+        "p95_ms": round(1000 * percentiles[-1], 1) if done else None,
+    }
+
+
+async def run(args: argparse.Namespace) -> list[dict[str, Any]]:
+    """Run the burst under every admission setting."""
+    limits = {
+        "max_concurrency": args.capacity,
+        "requests_per_second": args.requests_per_second,
+    }
+    settings = {
+        "none": None,
+        "coalesce": AdmissionPolicy(),
+        "limit": AdmissionPolicy(**limits, coalesce=False),
+        "both": AdmissionPolicy(**limits),
+    }
+    results = []
+    for name, admission in settings.items():
+        row = {"admission": name, **await burst(args.requests, admission, args)}
+        results.append(row)
+        print(  # noqa: T201
+            f"{name:<9} completed={row['completed']:4d} failed={row['failed']:4d}  "
+            f"upstream attempts={row['upstream_attempts']:4d} "
+            f"rejected={row['rejected']:4d}  p50={row['p50_ms']}ms "
+            f"p95={row['p95_ms']}ms  wall={row['seconds']:.2f}s"
+        )
+    return results
+
+
+def main() -> None:
+    """Parse arguments and run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--capacity", type=int, default=8)
+    parser.add_argument("--requests-per-second", type=float, default=200.0)
+    parser.add_argument("--max-retries", type=int, default=2)
+    parser.add_argument("--retry-delay", type=float, default=0.05)
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    parser.add_argument("--token-latency", type=float, default=0.002)
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as persist_directory:
+        build_synthetic_store(persist_directory, FakeEmbeddings())
+        args.persist_directory = persist_directory
+        results = asyncio.run(run(args))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
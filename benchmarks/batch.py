@@ -0,0 +1,120 @@
+"""Batch API against a loop over ``graph.ainvoke``, on fake models.
+
+Answers the routing question set (``--repeat`` times over) once by invoking the
+graph for one question after another, as bulk jobs used to, and once with
+:func:`agent.batch.abatch_answer`. The fake chat model and embeddings sleep for a
+simulated latency per request, so the difference shows how many upstream round
+trips each approach waits for. Reports wall time, questions per second and the
+time until the first result arrived.
+
+Usage:
+    PYTHONPATH=src python -m benchmarks.batch --repeat 2 --max-concurrency 8
+"""
+
+import argparse
+import asyncio
+import json
+import tempfile
+import time
+from typing import Any
+
+from langchain_core.messages import HumanMessage
+
+from agent.batch import abatch_answer
+from agent.graph import build_graph
+from agent.resources import set_registry
+from benchmarks.fakes import FakeEmbeddings, build_synthetic_store, fake_registry
+from benchmarks.load import DEFAULT_QUESTIONS, load_questions
+
+
+async def run_loop(questions: list[str]) -> dict[str, Any]:
+    """Answer ``questions`` one ``graph.ainvoke`` at a time."""
+    compiled = build_graph()
+    start = time.perf_counter()
+    first = None
+    errors = 0
+    for question in questions:
+        try:
+            await compiled.ainvoke({"messages": [HumanMessage(content=question)]})
+        except Exception:
+            errors += 1
+        first = first or time.perf_counter() - start
+    return _summary("loop", len(questions), time.perf_counter() - start, first, errors)
+
+
+async def run_batch(questions: list[str], max_concurrency: int) -> dict[str, Any]:
+    """Answer ``questions`` with the batch API."""
+    start = time.perf_counter()
+    first = None
+    errors = 0
+    async for result in abatch_answer(questions, max_concurrency=max_concurrency):
+        errors += not result.ok
+        first = first or time.perf_counter() - start
+    return _summary("batch", len(questions), time.perf_counter() - start, first, errors)
+
+
+def _summary(
+    mode: str, count: int, seconds: float, first: float | None, errors: int
+) -> dict[str, Any]:
+    return {
+        "mode": mode,
+        "questions": count,
+        "errors": errors,
+        "seconds": round(seconds, 3),
+        "questions_per_second": round(count / seconds, 1),
+        "first_result_ms": round(1000 * (first or 0), 1),
+    }
+
+
+async def run(args: argparse.Namespace) -> list[dict[str, Any]]:
+    """Build the corpus and time both approaches on the same questions."""
+    questions = load_questions(args.questions) * args.repeat
+    with tempfile.TemporaryDirectory() as persist_directory:
+        build_synthetic_store(persist_directory, FakeEmbeddings())
+        previous = set_registry(
+            fake_registry(
+                persist_directory,
+                llm_latency=args.llm_latency,
+                embedding_latency=args.embedding_latency,
+            )
+        )
+        try:
+            # Build the shared resources outside the measurement
+            await run_batch(questions[:2], args.max_concurrency)
+            results = [
+                await run_loop(questions),
+                await run_batch(questions, args.max_concurrency),
+            ]
+        finally:
+            set_registry(previous)
+
+    for row in results:
+        print(  # noqa: T201
+            f"{row['mode']:<6} {row['questions']} questions in {row['seconds']:7.2f}s  "
+            f"{row['questions_per_second']:7.1f} q/s  "
+            f"first result {row['first_result_ms']:7.1f}ms  errors={row['errors']}"
+        )
+    speedup = results[0]["seconds"] / results[1]["seconds"]
+    print(f"batch speedup: {speedup:.1f}x")  # noqa: T201
+    return results
+
+
+def main() -> None:
+    """Parse arguments and run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--questions", default=DEFAULT_QUESTIONS)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--max-concurrency", type=int, default=8)
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    parser.add_argument("--embedding-latency", type=float, default=0.02)
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
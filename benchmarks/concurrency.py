@@ -0,0 +1,121 @@
+"""Concurrency benchmark for the agent graph against fake models.
+
+Runs the same question mix through two compilations of the RAG workflow: one whose
+nodes are the native async implementations, and one with only the sync nodes, which
+``ainvoke`` has to run on the default thread pool. Throughput is reported in
+requests per second for each number of concurrent in-flight conversations.
+
+Usage:
+    PYTHONPATH=src python -m benchmarks.concurrency --levels 1 16 128
+"""
+
+import argparse
+import asyncio
+import json
+import tempfile
+import time
+
+from langchain_core.messages import HumanMessage
+from langgraph.graph import END, START, StateGraph
+from langgraph.pregel import Pregel
+
+from agent.graph import (
+    decide_route,
+    direct_response,
+    generate_response,
+    graph,
+    retrieve_documents,
+    route_question,
+)
+from agent.resources import set_registry
+from agent.state import AgentState
+from benchmarks.fakes import FakeEmbeddings, build_synthetic_store, fake_registry
+
+QUESTIONS = [
+    "What is AWS Lambda?",
+    "How do I configure an S3 bucket lifecycle rule?",
+    "Which EC2 instance type should I use?",
+    "How do IAM roles work?",
+    "What is the capital of France?",
+    "Explain recursion in Python.",
+]
+
+
+def build_sync_graph() -> Pregel:
+    """Compile the RAG workflow using only the sync node implementations."""
+    workflow = StateGraph(AgentState)
+    workflow.add_node("route_question", route_question)
+    workflow.add_node("retrieve_documents", retrieve_documents)
+    workflow.add_node("generate_response", generate_response)
+    workflow.add_node("direct_response", direct_response)
+    workflow.add_edge(START, "route_question")
+    workflow.add_conditional_edges("route_question", decide_route)
+    workflow.add_edge("retrieve_documents", "generate_response")
+    workflow.add_edge("generate_response", END)
+    workflow.add_edge("direct_response", END)
+    return workflow.compile()
+
+
+async def measure(graph: Pregel, concurrency: int, requests: int) -> float:
+    """Return requests per second for ``requests`` runs at ``concurrency``."""
+    queue: asyncio.Queue[str] = asyncio.Queue()
+    for i in range(requests):
+        queue.put_nowait(QUESTIONS[i % len(QUESTIONS)])
+
+    async def worker() -> None:
+        while not queue.empty():
+            question = queue.get_nowait()
+            await graph.ainvoke({"messages": [HumanMessage(content=question)]})
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return requests / (time.perf_counter() - start)
+
+
+async def run(args: argparse.Namespace) -> list[dict[str, float | int | str]]:
+    """Run the benchmark for every concurrency level and graph variant."""
+    results = []
+    with tempfile.TemporaryDirectory() as persist_directory:
+        build_synthetic_store(persist_directory, FakeEmbeddings())
+        set_registry(
+            fake_registry(
+                persist_directory,
+                llm_latency=args.llm_latency,
+                embedding_latency=args.embedding_latency,
+            )
+        )
+        variants = {"async": graph, "sync": build_sync_graph()}
+        for concurrency in args.levels:
+            requests = max(args.min_requests, concurrency * 2)
+            for name, compiled in variants.items():
+                rps = await measure(compiled, concurrency, requests)
+                results.append(
+                    {
+                        "variant": name,
+                        "concurrency": concurrency,
+                        "requests": requests,
+                        "requests_per_second": round(rps, 2),
+                    }
+                )
+                print(f"{name:>5}  concurrency={concurrency:<4} {rps:8.1f} req/s")  # noqa: T201
+    return results
+
+
+def main() -> None:
+    """Parse arguments and run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 16, 128])
+    parser.add_argument("--min-requests", type=int, default=32)
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    parser.add_argument("--embedding-latency", type=float, default=0.02)
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,339 @@
+"""Deterministic fake models for benchmarking the agent graph offline.
+
+The fakes stand in for the OpenAI chat model and embeddings behind the resource
+registry. They sleep for a configurable simulated latency (``time.sleep`` on the
+sync path, ``asyncio.sleep`` on the async path) so benchmarks measure how the graph
+schedules upstream calls rather than how fast a real API happens to be that day.
+"""
+
+import asyncio
+import hashlib
+import math
+import re
+import time
+from collections.abc import AsyncIterator, Callable, Iterator
+from typing import Any
+
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import (
+    AIMessage,
+    AIMessageChunk,
+    BaseMessage,
+    HumanMessage,
+)
+from langchain_core.messages.ai import UsageMetadata
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import Runnable, RunnableLambda
+from pydantic import BaseModel
+
+from agent.admission import AdmissionPolicy
+from agent.context import ApproximateTokenCounter
+from agent.resources import ResourceRegistry
+
+AWS_KEYWORDS = (
+    "aws",
+    "amazon",
+    "ec2",
+    "lambda",
+    "s3",
+    "rds",
+    "vpc",
+    "iam",
+    "cloudwatch",
+    "cloudformation",
+    "bucket",
+    "instance",
+)
+
+MAX_ECHO_WORDS = 64
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+_NUMBERED_LINE = re.compile(r"^\d+\. (.*)$", re.MULTILINE)
+
+
+def _last_human_text(messages: list[BaseMessage]) -> str:
+    for message in reversed(messages):
+        if isinstance(message, HumanMessage):
+            return str(message.content)
+    return str(messages[-1].content) if messages else ""
+
+
+def is_aws_question(question: str) -> bool:
+    """Return whether the fake router would send ``question`` to ``aws_docs``."""
+    tokens = set(_TOKEN_PATTERN.findall(question.lower()))
+    return any(keyword in tokens for keyword in AWS_KEYWORDS)
+
+
+class FakeChatModel(BaseChatModel):
+    """Chat model that answers after a fixed simulated latency.
+
+    The reply echoes the question word by word. ``latency`` is the time to the
+    first token and ``token_latency`` the gap between later tokens, so streaming
+    and non-streaming calls take the same total time. ``with_structured_output``
+    returns a keyword-based router so the routing node works unchanged.
+    """
+
+    latency: float = 0.0
+    """Seconds before the first token."""
+
+    token_latency: float = 0.0
+    """Seconds between consecutive tokens."""
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _tokens(self, messages: list[BaseMessage]) -> list[str]:
+        # Long prompts (e.g. history summaries) are cut so replies stay bounded
+        words = _last_human_text(messages).split(" ")[:MAX_ECHO_WORDS]
+        return re.split(r"(?<= )", f"Answer to: {' '.join(words)}")
+
+    def _usage(self, messages: list[BaseMessage], tokens: list[str]) -> UsageMetadata:
+        prompt = sum(len(str(message.content).split()) for message in messages)
+        return UsageMetadata(
+            input_tokens=prompt,
+            output_tokens=len(tokens),
+            total_tokens=prompt + len(tokens),
+        )
+
+    def _total_latency(self, tokens: list[str]) -> float:
+        return self.latency + self.token_latency * (len(tokens) - 1)
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        tokens = self._tokens(messages)
+        time.sleep(self._total_latency(tokens))
+        message = AIMessage(
+            content="".join(tokens), usage_metadata=self._usage(messages, tokens)
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        tokens = self._tokens(messages)
+        await asyncio.sleep(self._total_latency(tokens))
+        message = AIMessage(
+            content="".join(tokens), usage_metadata=self._usage(messages, tokens)
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        tokens = self._tokens(messages)
+        for i, token in enumerate(tokens):
+            time.sleep(self.latency if i == 0 else self.token_latency)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+        # Like OpenAI's stream_usage, token usage arrives in a final empty chunk
+        yield ChatGenerationChunk(
+            message=AIMessageChunk(
+                content="", usage_metadata=self._usage(messages, tokens)
+            )
+        )
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        tokens = self._tokens(messages)
+        for i, token in enumerate(tokens):
+            await asyncio.sleep(self.latency if i == 0 else self.token_latency)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+        yield ChatGenerationChunk(
+            message=AIMessageChunk(
+                content="", usage_metadata=self._usage(messages, tokens)
+            )
+        )
+
+    def with_structured_output(  # type: ignore[override]
+        self, schema: Any, **kwargs: Any
+    ) -> Runnable:
+        """Return a runnable that fills ``schema.decision`` from question keywords.
+
+        Schemas with a ``decisions`` list get one decision per numbered line of the
+        prompt, like the batch router expects.
+        """
+
+        def _route_one(question: str) -> str:
+            return "aws_docs" if is_aws_question(question) else "direct_response"
+
+        def _decide(messages: list[BaseMessage]) -> BaseModel:
+            question = _last_human_text(messages)
+            if "decisions" in schema.model_fields:
+                questions = _NUMBERED_LINE.findall(question)
+                return schema(decisions=[_route_one(line) for line in questions])
+            return schema(decision=_route_one(question))
+
+        def _route(messages: list[BaseMessage]) -> BaseModel:
+            time.sleep(self.latency)
+            return _decide(messages)
+
+        async def _aroute(messages: list[BaseMessage]) -> BaseModel:
+            await asyncio.sleep(self.latency)
+            return _decide(messages)
+
+        return RunnableLambda(_route, afunc=_aroute)
+
+
+class FakeEmbeddings(Embeddings):
+    """Hashed bag-of-words embeddings with a simulated per-request latency.
+
+    Texts sharing words get similar vectors, so retrieval over a synthetic corpus
+    behaves plausibly, and the same text always maps to the same vector.
+    """
+
+    def __init__(self, size: int = 256, latency: float = 0.0) -> None:
+        """Create embeddings of dimension ``size`` that take ``latency`` seconds."""
+        self.size = size
+        self.latency = latency
+
+    def _embed(self, text: str) -> list[float]:
+        vector = [0.0] * self.size
+        for token in _TOKEN_PATTERN.findall(text.lower()):
+            digest = hashlib.blake2b(token.encode(), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.size
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        """Embed ``texts`` after one simulated request."""
+        time.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        """Embed a single query after one simulated request."""
+        time.sleep(self.latency)
+        return self._embed(text)
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        """Async variant of :meth:`embed_documents`."""
+        await asyncio.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    async def aembed_query(self, text: str) -> list[float]:
+        """Async variant of :meth:`embed_query`."""
+        await asyncio.sleep(self.latency)
+        return self._embed(text)
+
+
+SERVICES = {
+    "EC2": "instances, AMIs, instance types such as m7g.large and security groups",
+    "Lambda": "functions, event sources, concurrency and cold starts",
+    "S3": "buckets, objects, storage classes and lifecycle rules",
+    "RDS": "database instances, snapshots, read replicas and Multi-AZ",
+    "VPC": "subnets, route tables, internet gateways and NAT gateways",
+    "IAM": "users, roles, policies and actions such as s3:GetObject",
+    "CloudWatch": "metrics, alarms, dashboards and log groups",
+    "CloudFormation": "templates, stacks, change sets and drift detection",
+}
+
+
+def synthetic_documents(count: int, chunk_chars: int = 0) -> list[Document]:
+    """Generate ``count`` deterministic AWS-flavoured document chunks.
+
+    Args:
+        count: Number of chunks
+        chunk_chars: Pad each chunk with filler text to about this many
+            characters, e.g. 4800 for the indexer's 1200-token chunks
+    """
+    services = list(SERVICES.items())
+    documents = []
+    for i in range(count):
+        service, topics = services[i % len(services)]
+        source = f"https://docs.aws.amazon.com/{service.lower()}/page-{i // 4}.html"
+        content = (
+            f"Amazon {service} guide section {i}. This section covers {topics}. "
+            f"It explains how to configure {service} for production workloads."
+        )
+        filler = f" Further details on {service} {topics}."
+        while len(content) < chunk_chars:
+            content += filler
+        documents.append(
+            Document(
+                page_content=content,
+                metadata={
+                    "source": source,
+                    "title": f"{service} guide {i // 4}",
+                    "start_index": (i % 4) * 1000,
+                },
+            )
+        )
+    return documents
+
+
+def build_synthetic_store(
+    persist_directory: str,
+    embeddings: Embeddings,
+    count: int = 400,
+    collection_name: str = "rag-chroma",
+    chunk_chars: int = 0,
+) -> Chroma:
+    """Create a Chroma collection filled with :func:`synthetic_documents`."""
+    vector_store = Chroma(
+        collection_name=collection_name,
+        embedding_function=embeddings,
+        persist_directory=persist_directory,
+    )
+    documents = synthetic_documents(count, chunk_chars)
+    for i in range(0, len(documents), 100):
+        vector_store.add_documents(documents[i : i + 100])
+    return vector_store
+
+
+def fake_registry(
+    persist_directory: str,
+    llm_latency: float = 0.0,
+    embedding_latency: float = 0.0,
+    token_latency: float = 0.0,
+    chat_model_factory: Callable[[float], BaseChatModel] | None = None,
+    admission: AdmissionPolicy | None = None,
+) -> ResourceRegistry:
+    """Build a resource registry serving fakes and a Chroma store at ``persist_directory``.
+
+    The store must already exist, e.g. from :func:`build_synthetic_store`.
+    ``admission`` applies to both the chat model and the embeddings.
+    """
+    embeddings = FakeEmbeddings(latency=embedding_latency)
+    make_chat_model = chat_model_factory or (
+        lambda latency: FakeChatModel(latency=latency, token_latency=token_latency)
+    )
+
+    return ResourceRegistry(
+        chat_model_factory=lambda model, temperature: make_chat_model(llm_latency),
+        embeddings_factory=lambda model: embeddings,
+        vector_store_factory=lambda collection_name, embedding_function, _: Chroma(
+            collection_name=collection_name,
+            embedding_function=embedding_function,
+            persist_directory=persist_directory,
+        ),
+        token_counter_factory=lambda model: ApproximateTokenCounter(),
+        llm_admission=admission,
+        embedding_admission=admission,
+    )
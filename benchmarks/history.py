@@ -0,0 +1,107 @@
+"""Checkpoint growth benchmark of long conversation threads.
+
+Runs one thread of ``--turns`` questions through the graph with an in-memory
+checkpointer, once keeping every message (``history_max_messages=0``) and once
+with the history window, on the fake models from :mod:`benchmarks.fakes`. After
+selected turns it reports the number of messages in the thread state, the size of
+the serialised checkpoint and the time the checkpoint serialiser takes, which is
+what a Postgres checkpointer pays on every step.
+
+Usage:
+    PYTHONPATH=src python -m benchmarks.history --turns 100 --window 20
+"""
+
+import argparse
+import json
+import tempfile
+import time
+from dataclasses import replace
+
+from langchain_core.messages import HumanMessage
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+from agent.configuration import default_configuration
+from agent.graph import build_graph
+from agent.resources import set_registry
+from benchmarks.fakes import FakeEmbeddings, build_synthetic_store, fake_registry
+
+QUESTIONS = (
+    "What is AWS Lambda?",
+    "How is it priced?",
+    "Can it run inside a VPC?",
+    "How do I give it access to an S3 bucket?",
+    "What about its timeout limits?",
+)
+
+
+def checkpoint_cost(
+    saver: InMemorySaver, config: dict, serde: JsonPlusSerializer
+) -> tuple[int, float]:
+    """Return the serialised size in bytes and serialisation time of a thread."""
+    checkpoint = saver.get_tuple(config)
+    assert checkpoint is not None
+    start = time.perf_counter()
+    _, data = serde.dumps_typed(checkpoint.checkpoint)
+    return len(data), time.perf_counter() - start
+
+
+def measure(window: int, turns: int, report: set[int]) -> list[dict[str, float]]:
+    """Run one thread and return the checkpoint cost after the reported turns."""
+    saver = InMemorySaver()
+    serde = JsonPlusSerializer()
+    compiled = build_graph(
+        replace(default_configuration(), history_max_messages=window),
+        checkpointer=saver,
+    )
+    config = {"configurable": {"thread_id": f"window-{window}"}}
+
+    rows = []
+    for turn in range(1, turns + 1):
+        question = QUESTIONS[(turn - 1) % len(QUESTIONS)]
+        state = compiled.invoke({"messages": [HumanMessage(content=question)]}, config)
+        if turn in report:
+            size, seconds = checkpoint_cost(saver, config, serde)
+            rows.append(
+                {
+                    "window": window,
+                    "turn": turn,
+                    "messages": len(state["messages"]),
+                    "checkpoint_kib": round(size / 1024, 1),
+                    "serialise_ms": round(seconds * 1000, 3),
+                }
+            )
+            print(  # noqa: T201
+                f"window={window:<4} turn={turn:<5} messages={rows[-1]['messages']:<5} "
+                f"checkpoint={rows[-1]['checkpoint_kib']:8.1f}KiB "
+                f"serialise={rows[-1]['serialise_ms']:7.3f}ms"
+            )
+    return rows
+
+
+def main() -> None:
+    """Parse arguments and run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=100)
+    parser.add_argument("--window", type=int, default=20)
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    report = {1, 10, 25, 50, 100, 200, 500, args.turns}
+    results = []
+    with tempfile.TemporaryDirectory() as persist_directory:
+        build_synthetic_store(persist_directory, FakeEmbeddings())
+        previous = set_registry(fake_registry(persist_directory))
+        try:
+            for window in (0, args.window):
+                results.extend(measure(window, args.turns, report))
+        finally:
+            set_registry(previous)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
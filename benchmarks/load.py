@@ -0,0 +1,255 @@
+"""Offline load test of the agent graph with fake models and a synthetic corpus.
+
+Builds the graph with :func:`agent.graph.create_workflow`, so the topology flags
+match production, on top of the fake chat model and embeddings from
+:mod:`benchmarks.fakes` (with configurable simulated latency) and a generated
+Chroma corpus. A question set is then replayed by a fixed number of concurrent
+clients at each concurrency level, and for each level the harness reports:
+
+* throughput in requests per second and the number of failed requests,
+* p50/p95/p99 latency overall and per route,
+* p50/p95 wall time per graph node, from ``agent.metrics``,
+* peak RSS of the process and, with ``--trace-memory``, the peak Python heap.
+
+Results are written as JSON together with the run's parameters, so runs can be
+compared; ``--baseline`` prints the change against an earlier result file.
+
+Usage:
+    PYTHONPATH=src python -m benchmarks.load --levels 1 8 32 --output load.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import Any
+
+from langchain_core.messages import HumanMessage
+from langgraph.pregel import Pregel
+
+from agent.graph import create_workflow
+from agent.metrics import LogExporter, MetricsRegistry, set_metrics
+from agent.resources import set_registry
+from benchmarks.fakes import FakeEmbeddings, build_synthetic_store, fake_registry
+
+DEFAULT_QUESTIONS = Path(__file__).parent / "data" / "routing_questions.jsonl"
+PERCENTILES = (50, 95, 99)
+
+
+def load_questions(path: str | Path) -> list[str]:
+    """Read the ``question`` field of every JSON line in ``path``."""
+    with open(path) as f:
+        return [json.loads(line)["question"] for line in f if line.strip()]
+
+
+def percentiles(values: list[float]) -> dict[str, float]:
+    """Return the p50/p95/p99 of ``values`` in milliseconds."""
+    if not values:
+        return {}
+    if len(values) == 1:
+        return {f"p{q}_ms": round(1000 * values[0], 2) for q in PERCENTILES}
+    quantiles = statistics.quantiles(values, n=100, method="inclusive")
+    return {f"p{q}_ms": round(1000 * quantiles[q - 1], 2) for q in PERCENTILES}
+
+
+def peak_rss_mb() -> float:
+    """Return the peak resident set size of the process in MiB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def node_latencies(metrics: MetricsRegistry) -> dict[str, dict[str, float]]:
+    """Return the p50/p95 wall time per node recorded in ``metrics``."""
+    nodes = {}
+    for family in LogExporter().families(metrics):
+        if family["metric"] != "agent_node_duration_seconds":
+            continue
+        for series in family["series"]:
+            nodes[series["labels"]["node"]] = {
+                "runs": series["count"],
+                "p50_ms": round(1000 * series["p50"], 2),
+                "p95_ms": round(1000 * series["p95"], 2),
+            }
+    return nodes
+
+
+async def replay(
+    compiled: Pregel, questions: list[str], concurrency: int, requests: int
+) -> dict[str, Any]:
+    """Send ``requests`` questions from ``concurrency`` concurrent clients."""
+    pending = iter(range(requests))
+    latencies: dict[str, list[float]] = {}
+    errors: dict[str, int] = {}
+
+    async def client() -> None:
+        for i in pending:
+            question = questions[i % len(questions)]
+            start = time.perf_counter()
+            try:
+                result = await compiled.ainvoke(
+                    {"messages": [HumanMessage(content=question)]}
+                )
+            except Exception as e:
+                errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+                continue
+            route = "cache_hit" if result.get("cache_hit") else result["route_decision"]
+            latencies.setdefault(route, []).append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    seconds = time.perf_counter() - start
+
+    completed = [value for values in latencies.values() for value in values]
+    return {
+        "requests": requests,
+        "errors": errors,
+        "seconds": round(seconds, 3),
+        "requests_per_second": round(len(completed) / seconds, 2),
+        "latency": percentiles(completed),
+        "routes": {
+            route: {"requests": len(values), **percentiles(values)}
+            for route, values in sorted(latencies.items())
+        },
+    }
+
+
+async def run(args: argparse.Namespace) -> dict[str, Any]:
+    """Build the corpus and graph, then replay the questions at every level."""
+    questions = load_questions(args.questions)
+    levels = []
+    with tempfile.TemporaryDirectory() as persist_directory:
+        build_synthetic_store(persist_directory, FakeEmbeddings(), args.corpus_size)
+        previous = set_registry(
+            fake_registry(
+                persist_directory,
+                llm_latency=args.llm_latency,
+                embedding_latency=args.embedding_latency,
+                token_latency=args.token_latency,
+            )
+        )
+        compiled = create_workflow(
+            answer_cache=args.answer_cache,
+            speculative_retrieval=args.speculative,
+            rerank=args.rerank,
+        ).compile()
+        try:
+            # Warm up lazily built resources outside the measurement
+            await compiled.ainvoke({"messages": [HumanMessage(content=questions[0])]})
+            for concurrency in args.levels:
+                metrics = MetricsRegistry()
+                previous_metrics = set_metrics(metrics)
+                if args.trace_memory:
+                    tracemalloc.start()
+                try:
+                    requests = max(args.requests, 2 * concurrency)
+                    level = await replay(compiled, questions, concurrency, requests)
+                    level["nodes"] = node_latencies(metrics)
+                    if args.trace_memory:
+                        level["peak_heap_mb"] = round(
+                            tracemalloc.get_traced_memory()[1] / 2**20, 1
+                        )
+                finally:
+                    if args.trace_memory:
+                        tracemalloc.stop()
+                    set_metrics(previous_metrics)
+                level["peak_rss_mb"] = peak_rss_mb()
+                levels.append({"concurrency": concurrency, **level})
+                _print_level(levels[-1])
+        finally:
+            set_registry(previous)
+
+    return {
+        "benchmark": "load",
+        "timestamp": datetime.now(UTC).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "parameters": {
+            key: str(value) if isinstance(value, Path) else value
+            for key, value in vars(args).items()
+            if key not in ("output", "baseline")
+        },
+        "levels": levels,
+    }
+
+
+def _print_level(level: dict[str, Any]) -> None:
+    latency = level["latency"]
+    print(  # noqa: T201
+        f"concurrency={level['concurrency']:<4} "
+        f"{level['requests_per_second']:8.1f} req/s  "
+        f"p50={latency.get('p50_ms', 0):7.1f}ms p95={latency.get('p95_ms', 0):7.1f}ms "
+        f"p99={latency.get('p99_ms', 0):7.1f}ms  errors={sum(level['errors'].values())} "
+        f"rss={level['peak_rss_mb']}MiB"
+    )
+    for route, summary in level["routes"].items():
+        print(  # noqa: T201
+            f"    {route:<16} n={summary['requests']:<5} "
+            f"p50={summary['p50_ms']:7.1f}ms p95={summary['p95_ms']:7.1f}ms "
+            f"p99={summary['p99_ms']:7.1f}ms"
+        )
+
+
+def compare(results: dict[str, Any], baseline: dict[str, Any]) -> None:
+    """Print the throughput and latency change of each level against ``baseline``."""
+    previous = {level["concurrency"]: level for level in baseline["levels"]}
+    for level in results["levels"]:
+        before = previous.get(level["concurrency"])
+        if before is None:
+            continue
+        changes = [
+            f"{key}={(level[key] / before[key] - 1) * 100:+.1f}%"
+            for key in ("requests_per_second",)
+            if before[key]
+        ] + [
+            f"{key}={(level['latency'][key] / before['latency'][key] - 1) * 100:+.1f}%"
+            for key in ("p50_ms", "p95_ms", "p99_ms")
+            if before["latency"].get(key)
+        ]
+        print(f"vs baseline concurrency={level['concurrency']:<4} {' '.join(changes)}")  # noqa: T201
+
+
+def main() -> None:
+    """Parse arguments and run the load test."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument(
+        "--requests", type=int, default=64, help="Minimum requests per level"
+    )
+    parser.add_argument("--questions", type=Path, default=DEFAULT_QUESTIONS)
+    parser.add_argument("--corpus-size", type=int, default=400)
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    parser.add_argument("--token-latency", type=float, default=0.0)
+    parser.add_argument("--embedding-latency", type=float, default=0.02)
+    parser.add_argument("--answer-cache", action="store_true")
+    parser.add_argument("--speculative", action="store_true")
+    parser.add_argument("--rerank", action="store_true")
+    parser.add_argument(
+        "--trace-memory",
+        action="store_true",
+        help="Track the peak Python heap with tracemalloc (slows the run)",
+    )
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    parser.add_argument("--baseline", help="Compare against an earlier JSON result")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(results, json.load(f))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
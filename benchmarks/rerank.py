@@ -0,0 +1,113 @@
+"""Cost and quality benchmark of the rerank stage.
+
+Uses the needle corpus of :mod:`benchmarks.retrieval`: for every question the
+dense search returns ``--candidates`` chunks, which the reranker scores and cuts
+to the top 10. Reports, per candidate count, the rerank latency per query
+(p50/p95/max), how often the latency bound was hit, and recall@1/3/10 of the
+needle before and after reranking.
+
+Pass ``--model`` to benchmark a sentence-transformers cross-encoder instead of the
+default lexical scorer.
+
+Usage:
+    PYTHONPATH=src python -m benchmarks.rerank --candidates 20 50 100
+"""
+
+import argparse
+import json
+import statistics
+import tempfile
+import time
+
+from langchain_chroma import Chroma
+
+from agent.rerank import BoundedReranker, create_reranker
+from benchmarks.fakes import FakeEmbeddings, synthetic_documents
+from benchmarks.retrieval import needle_corpus
+
+TOP_N = 10
+K_VALUES = (1, 3, 10)
+
+
+def _recall(ranked: list[str], needle: str) -> dict[int, bool]:
+    return {k: needle in ranked[:k] for k in K_VALUES}
+
+
+def run(args: argparse.Namespace) -> dict[str, dict[str, float]]:
+    """Index the corpus and rerank each question's candidates."""
+    needles, questions = needle_corpus()
+    distractors = synthetic_documents(args.distractors)
+    for i, document in enumerate(distractors):
+        document.id = f"distractor-{i}"
+    documents = needles + distractors
+    reranker = BoundedReranker(create_reranker(args.model), args.timeout_ms / 1000)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as persist_directory:
+        vector_store = Chroma(
+            collection_name="rerank-benchmark",
+            embedding_function=FakeEmbeddings(),
+            persist_directory=persist_directory,
+        )
+        for i in range(0, len(documents), 100):
+            vector_store.add_documents(documents[i : i + 100])
+
+        for candidates in args.candidates:
+            before = dict.fromkeys(K_VALUES, 0)
+            after = dict.fromkeys(K_VALUES, 0)
+            latencies = []
+            fallbacks = reranker.stats.fallbacks
+            for question, needle in questions:
+                retrieved = vector_store.similarity_search(question, k=candidates)
+                start = time.perf_counter()
+                kept = reranker.rerank(question, retrieved, TOP_N)
+                latencies.append(time.perf_counter() - start)
+                for k, hit in _recall([str(d.id) for d in retrieved], needle).items():
+                    before[k] += hit
+                for k, hit in _recall([str(d.id) for d in kept], needle).items():
+                    after[k] += hit
+
+            summary = {
+                "p50_ms": 1000 * statistics.median(latencies),
+                "p95_ms": 1000 * statistics.quantiles(latencies, n=20)[-1],
+                "max_ms": 1000 * max(latencies),
+                "fallbacks": reranker.stats.fallbacks - fallbacks,
+            }
+            for k in K_VALUES:
+                summary[f"dense_recall@{k}"] = before[k] / len(questions)
+                summary[f"reranked_recall@{k}"] = after[k] / len(questions)
+            results[str(candidates)] = summary
+    reranker.close()
+
+    for candidates, summary in results.items():
+        recalls = " ".join(
+            f"@{k}={summary[f'dense_recall@{k}']:.2f}->"
+            f"{summary[f'reranked_recall@{k}']:.2f}"
+            for k in K_VALUES
+        )
+        print(  # noqa: T201
+            f"candidates={candidates:>4} p50={summary['p50_ms']:.2f}ms "
+            f"p95={summary['p95_ms']:.2f}ms max={summary['max_ms']:.2f}ms "
+            f"fallbacks={summary['fallbacks']:.0f}  recall {recalls}"
+        )
+    return results
+
+
+def main() -> None:
+    """Parse arguments and run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--candidates", type=int, nargs="+", default=[20, 50, 100])
+    parser.add_argument("--distractors", type=int, default=400)
+    parser.add_argument("--model", help="sentence-transformers cross-encoder model")
+    parser.add_argument("--timeout-ms", type=float, default=100)
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    results = run(args)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""Recall@k and latency benchmark of dense, lexical and hybrid retrieval.
+
+Builds a corpus of "needle" chunks that each name one exact token (an EC2
+instance type such as ``m7g.2xlarge`` or an IAM action such as ``s3:GetObject``)
+among the usual synthetic distractors, asks one question per needle, and reports
+for each retriever how often the needle is in the top ``k`` and how long a search
+takes. Hybrid retrieval is what the graph does: dense and BM25 results fused with
+reciprocal-rank fusion.
+
+By default the dense side uses the deterministic fake embeddings. Pass
+``--embeddings openai`` (with ``OPENAI_API_KEY`` set) to measure it on the real
+embedding model, which is where exact tokens are weakest.
+
+Usage:
+    PYTHONPATH=src python -m benchmarks.retrieval --distractors 400
+"""
+
+import argparse
+import json
+import statistics
+import tempfile
+import time
+from collections.abc import Callable
+
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from agent.lexical import BM25Index, fuse_results
+from benchmarks.fakes import FakeEmbeddings, synthetic_documents
+
+FAMILIES = ("m7g", "c7g", "r7g", "m6i", "c6i", "r6i", "t4g", "i4i", "x2idn", "g5")
+SIZES = ("medium", "large", "xlarge", "2xlarge", "4xlarge", "8xlarge")
+ACTIONS = (
+    ("s3", "GetObject"),
+    ("s3", "PutObject"),
+    ("s3", "DeleteBucket"),
+    ("ec2", "DescribeInstances"),
+    ("ec2", "RunInstances"),
+    ("iam", "PassRole"),
+    ("iam", "CreateRole"),
+    ("lambda", "InvokeFunction"),
+    ("dynamodb", "Query"),
+    ("sqs", "SendMessage"),
+    ("kms", "Decrypt"),
+    ("sts", "AssumeRole"),
+)
+K_VALUES = (1, 3, 5, 10)
+
+
+def needle_corpus() -> tuple[list[Document], list[tuple[str, str]]]:
+    """Return needle chunks and ``(question, needle id)`` pairs."""
+    documents = []
+    questions = []
+    for i, (family, size) in enumerate(
+        (family, size) for family in FAMILIES for size in SIZES
+    ):
+        instance_type = f"{family}.{size}"
+        chunk_id = f"instance-{instance_type}"
+        documents.append(
+            Document(
+                id=chunk_id,
+                page_content=(
+                    f"Amazon EC2 instance types guide. The {instance_type} instance "
+                    f"provides {2 ** (i % 6 + 1)} vCPUs and {4 * (i % 7 + 1)} GiB of "
+                    "memory, with network bandwidth for production workloads."
+                ),
+                metadata={"source": "https://docs.aws.amazon.com/ec2/types.html"},
+            )
+        )
+        questions.append(
+            (f"How many vCPUs does the {instance_type} instance have?", chunk_id)
+        )
+    for service, action in ACTIONS:
+        chunk_id = f"action-{service}:{action}"
+        documents.append(
+            Document(
+                id=chunk_id,
+                page_content=(
+                    f"IAM policy reference. The {service}:{action} action controls "
+                    f"whether a principal may call {action}. Grant it in a policy "
+                    "statement with the resources it applies to."
+                ),
+                metadata={"source": "https://docs.aws.amazon.com/iam/actions.html"},
+            )
+        )
+        questions.append(
+            (f"What does the {service}:{action} permission allow?", chunk_id)
+        )
+    return documents, questions
+
+
+def evaluate(
+    search: Callable[[str, int], list[str]], questions: list[tuple[str, str]]
+) -> dict[str, float]:
+    """Return recall@k for each k and the latency of a top-10 search."""
+    hits = dict.fromkeys(K_VALUES, 0)
+    latencies = []
+    for question, needle in questions:
+        start = time.perf_counter()
+        ranked = search(question, max(K_VALUES))
+        latencies.append(time.perf_counter() - start)
+        for k in K_VALUES:
+            hits[k] += needle in ranked[:k]
+    summary = {f"recall@{k}": hits[k] / len(questions) for k in K_VALUES}
+    summary["p50_ms"] = 1000 * statistics.median(latencies)
+    summary["p95_ms"] = 1000 * statistics.quantiles(latencies, n=20)[-1]
+    return summary
+
+
+def run(args: argparse.Namespace) -> dict[str, dict[str, float]]:
+    """Index the corpus and evaluate every retriever."""
+    embeddings: Embeddings
+    if args.embeddings == "openai":
+        from langchain_openai import OpenAIEmbeddings
+
+        embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
+    else:
+        embeddings = FakeEmbeddings()
+
+    needles, questions = needle_corpus()
+    distractors = synthetic_documents(args.distractors)
+    for i, document in enumerate(distractors):
+        document.id = f"distractor-{i}"
+    documents = needles + distractors
+
+    with tempfile.TemporaryDirectory() as persist_directory:
+        vector_store = Chroma(
+            collection_name="retrieval-benchmark",
+            embedding_function=embeddings,
+            persist_directory=persist_directory,
+        )
+        for i in range(0, len(documents), 100):
+            vector_store.add_documents(documents[i : i + 100])
+        index = BM25Index.build((str(d.id), d.page_content) for d in documents)
+
+        def dense(question: str, k: int) -> list[str]:
+            return [str(d.id) for d in vector_store.similarity_search(question, k=k)]
+
+        def lexical(question: str, k: int) -> list[str]:
+            return [chunk_id for chunk_id, _ in index.search(question, k=k)]
+
+        def hybrid(question: str, k: int) -> list[str]:
+            fused = fuse_results(
+                vector_store,
+                vector_store.similarity_search(question, k=k),
+                index.search(question, k=k),
+                k,
+            )
+            return [str(d.id) for d in fused]
+
+        results = {
+            name: evaluate(search, questions)
+            for name, search in (
+                ("dense", dense),
+                ("lexical", lexical),
+                ("hybrid", hybrid),
+            )
+        }
+
+    for name, summary in results.items():
+        recalls = " ".join(f"@{k}={summary[f'recall@{k}']:.2f}" for k in K_VALUES)
+        print(  # noqa: T201
+            f"{name:<8} recall {recalls}  "
+            f"p50={summary['p50_ms']:.2f}ms p95={summary['p95_ms']:.2f}ms"
+        )
+    return results
+
+
+def main() -> None:
+    """Parse arguments and run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--embeddings", choices=["fake", "openai"], default="fake")
+    parser.add_argument("--distractors", type=int, default=400)
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    results = run(args)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
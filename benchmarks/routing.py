@@ -0,0 +1,126 @@
+"""Offline accuracy and latency benchmark for the local routing tier.
+
+Replays the labelled questions in ``benchmarks/data/routing_questions.jsonl``
+through :class:`agent.router.LocalRouter` and reports, per tier, how many questions
+it decided, how accurate those decisions were and how long they took. Questions the
+local tier abstains on are counted as LLM fallbacks, charged the simulated LLM
+router latency, and assumed to be routed correctly.
+
+The questions do not overlap the classifier's seed examples. Routing quality is
+only meaningful with ``--embeddings openai`` (with ``OPENAI_API_KEY`` set). By
+default the classifier runs on the deterministic fake hash embeddings, which
+exercises the tiers and their latency as a smoke run only; the result is then
+marked ``"smoke_run": true`` and its centroid accuracy says nothing about real
+routing quality.
+
+Usage:
+    PYTHONPATH=src python -m benchmarks.routing --llm-latency 0.4
+"""
+
+import argparse
+import json
+import os
+import statistics
+import time
+from collections import Counter
+
+from langchain_core.embeddings import Embeddings
+
+from agent.router import CentroidClassifier, LocalRouter
+from benchmarks.fakes import FakeEmbeddings
+
+QUESTIONS_PATH = os.path.join(
+    os.path.dirname(__file__), "data", "routing_questions.jsonl"
+)
+
+
+def load_questions(path: str = QUESTIONS_PATH) -> list[dict[str, str]]:
+    """Return the labelled routing questions."""
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def evaluate(
+    router: LocalRouter, questions: list[dict[str, str]], llm_latency: float
+) -> dict[str, object]:
+    """Route every question locally and summarise accuracy and latency."""
+    decided: Counter[str] = Counter()
+    correct: Counter[str] = Counter()
+    latencies = []
+    for item in questions:
+        start = time.perf_counter()
+        decision, tier = router.route(item["question"])
+        elapsed = time.perf_counter() - start
+        if decision is None:
+            elapsed += llm_latency
+            decision = item["route"]
+        router.stats.record(tier, elapsed)
+        latencies.append(elapsed)
+        decided[tier] += 1
+        correct[tier] += decision == item["route"]
+
+    local = decided["keyword"] + decided["centroid"]
+    return {
+        "questions": len(questions),
+        "decided_by_tier": dict(decided),
+        "accuracy_by_tier": {
+            tier: correct[tier] / decided[tier] for tier in decided if decided[tier]
+        },
+        "local_accuracy": (
+            (correct["keyword"] + correct["centroid"]) / local if local else 0.0
+        ),
+        "fallback_rate": router.stats.fallback_rate,
+        "mean_local_latency_ms": 1000
+        * (
+            (router.stats.latency["keyword"] + router.stats.latency["centroid"]) / local
+            if local
+            else 0.0
+        ),
+        "p50_latency_ms": 1000 * statistics.median(latencies),
+        "mean_latency_ms": 1000 * router.stats.mean_latency(),
+        "llm_only_mean_latency_ms": 1000 * llm_latency,
+    }
+
+
+def main() -> None:
+    """Parse arguments and run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--embeddings", choices=["fake", "openai"], default="fake")
+    parser.add_argument("--min-margin", type=float, default=0.05)
+    parser.add_argument("--llm-latency", type=float, default=0.4)
+    parser.add_argument("--questions", default=QUESTIONS_PATH)
+    parser.add_argument("--output", help="Write the summary as JSON to this path")
+    args = parser.parse_args()
+
+    embeddings: Embeddings
+    if args.embeddings == "openai":
+        from langchain_openai import OpenAIEmbeddings
+
+        embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
+    else:
+        embeddings = FakeEmbeddings()
+
+    classifier = CentroidClassifier(embeddings, min_margin=args.min_margin)
+    classifier.centroids()
+    summary = evaluate(
+        LocalRouter(classifier), load_questions(args.questions), args.llm_latency
+    )
+    summary = {
+        "embeddings": args.embeddings,
+        "smoke_run": args.embeddings == "fake",
+        **summary,
+    }
+    if summary["smoke_run"]:
+        print(  # noqa: T201
+            "Smoke run on fake embeddings: accuracy does not reflect real routing; "
+            "pass --embeddings openai to measure it"
+        )
+
+    print(json.dumps(summary, indent=2))  # noqa: T201
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""A/B latency benchmark of sequential vs speculative retrieval.
+
+Runs the same question mix (mostly AWS questions, like production traffic) through
+the default topology, where retrieval waits for the router, and through the
+speculative one, where retrieval runs alongside routing. The local routing tier is
+switched off so every question pays the simulated LLM routing round trip that
+speculation is meant to hide.
+
+Usage:
+    PYTHONPATH=src python -m benchmarks.speculative --runs 40
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import tempfile
+import time
+from dataclasses import replace
+
+from langchain_core.messages import HumanMessage
+from langgraph.pregel import Pregel
+
+from agent.configuration import default_configuration
+from agent.graph import build_graph
+from agent.resources import set_registry
+from benchmarks.fakes import FakeEmbeddings, build_synthetic_store, fake_registry
+
+QUESTIONS = [
+    "What is AWS Lambda?",
+    "How do I configure an S3 bucket lifecycle rule?",
+    "Which EC2 instance type should I use?",
+    "How do IAM roles work?",
+    "What is the capital of France?",
+]
+
+
+async def measure(compiled: Pregel, runs: int) -> dict[str, list[float]]:
+    """Return per-route latencies of ``runs`` sequential questions."""
+    latencies: dict[str, list[float]] = {}
+    for i in range(runs):
+        start = time.perf_counter()
+        result = await compiled.ainvoke(
+            {"messages": [HumanMessage(content=QUESTIONS[i % len(QUESTIONS)])]}
+        )
+        latencies.setdefault(result["route_decision"], []).append(
+            time.perf_counter() - start
+        )
+    return latencies
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Return the ``q`` quantile (0-100) of ``values``."""
+    return statistics.quantiles(values, n=100, method="inclusive")[int(q) - 1]
+
+
+async def run(args: argparse.Namespace) -> list[dict[str, object]]:
+    """Measure both topologies and return a summary row per topology and route."""
+    # Force every question through the LLM router
+    configuration = replace(default_configuration(), local_router=False)
+
+    results = []
+    with tempfile.TemporaryDirectory() as persist_directory:
+        build_synthetic_store(persist_directory, FakeEmbeddings())
+        set_registry(
+            fake_registry(
+                persist_directory,
+                llm_latency=args.llm_latency,
+                embedding_latency=args.embedding_latency,
+            )
+        )
+        topologies = {
+            name: build_graph(replace(configuration, speculative_retrieval=speculative))
+            for name, speculative in (("sequential", False), ("speculative", True))
+        }
+        for name, compiled in topologies.items():
+            for route, values in sorted((await measure(compiled, args.runs)).items()):
+                row = {
+                    "topology": name,
+                    "route": route,
+                    "runs": len(values),
+                    "p50_ms": round(1000 * statistics.median(values), 1),
+                    "p95_ms": round(1000 * percentile(values, 95), 1),
+                }
+                results.append(row)
+                print(  # noqa: T201
+                    f"{name:<12} {route:<16} runs={row['runs']:<3} "
+                    f"p50={row['p50_ms']:7.1f}ms p95={row['p95_ms']:7.1f}ms"
+                )
+    return results
+
+
+def main() -> None:
+    """Parse arguments and run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=40)
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--embedding-latency", type=float, default=0.1)
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
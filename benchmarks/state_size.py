@@ -0,0 +1,109 @@
+"""Bytes written to the checkpointer per turn, with and without chunk references.
+
+Runs a thread of AWS questions through the graph on the fake models, over a
+synthetic corpus of indexer-sized chunks (``--chunk-chars``), once storing full
+documents in the state and once storing :class:`~agent.chunks.ChunkRef`s. The
+in-memory checkpointer stores channel blobs, checkpoints and pending writes the
+same way the Postgres one does, so the bytes it serialises per turn are the bytes
+a deployment writes to Postgres (and streams through Redis) per turn.
+
+Usage:
+    PYTHONPATH=src python -m benchmarks.state_size --turns 20
+"""
+
+import argparse
+import json
+import statistics
+import tempfile
+import time
+from dataclasses import replace
+
+from langchain_core.messages import HumanMessage
+from langgraph.checkpoint.memory import InMemorySaver
+
+from agent.configuration import default_configuration
+from agent.graph import build_graph
+from agent.resources import set_registry
+from benchmarks.fakes import FakeEmbeddings, build_synthetic_store, fake_registry
+
+QUESTIONS = (
+    "How do I configure AWS Lambda concurrency?",
+    "How do I encrypt an S3 bucket?",
+    "Which EC2 instance types support EBS optimisation?",
+    "How do I rotate IAM access keys?",
+)
+
+
+def stored_bytes(saver: InMemorySaver) -> int:
+    """Return the bytes of every blob, checkpoint and write in ``saver``."""
+    total = sum(len(data) for _, data in saver.blobs.values())
+    for namespaces in saver.storage.values():
+        for checkpoints in namespaces.values():
+            for checkpoint, metadata, _ in checkpoints.values():
+                total += len(checkpoint[1]) + len(metadata[1])
+    for writes in saver.writes.values():
+        total += sum(len(value[1]) for _, _, value, _ in writes.values())
+    return total
+
+
+def measure(chunk_refs: bool, turns: int) -> dict[str, float]:
+    """Run one thread and return the bytes written and time per turn."""
+    saver = InMemorySaver()
+    compiled = build_graph(
+        replace(default_configuration(), chunk_refs=chunk_refs),
+        checkpointer=saver,
+    )
+    config = {"configurable": {"thread_id": f"refs-{chunk_refs}"}}
+
+    written = []
+    latencies = []
+    for turn in range(turns):
+        before = stored_bytes(saver)
+        start = time.perf_counter()
+        compiled.invoke(
+            {"messages": [HumanMessage(content=QUESTIONS[turn % len(QUESTIONS)])]},
+            config,
+        )
+        latencies.append(time.perf_counter() - start)
+        written.append(stored_bytes(saver) - before)
+
+    return {
+        "chunk_refs": chunk_refs,
+        "turns": turns,
+        "kib_per_turn": round(statistics.mean(written) / 1024, 1),
+        "p50_turn_ms": round(1000 * statistics.median(latencies), 2),
+    }
+
+
+def main() -> None:
+    """Parse arguments and run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--chunk-chars", type=int, default=4800)
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as persist_directory:
+        build_synthetic_store(
+            persist_directory, FakeEmbeddings(), chunk_chars=args.chunk_chars
+        )
+        previous = set_registry(fake_registry(persist_directory))
+        try:
+            for chunk_refs in (False, True):
+                results.append(measure(chunk_refs, args.turns))
+                print(  # noqa: T201
+                    f"chunk_refs={str(chunk_refs):<6} "
+                    f"{results[-1]['kib_per_turn']:8.1f} KiB written/turn  "
+                    f"p50={results[-1]['p50_turn_ms']:.1f}ms/turn"
+                )
+        finally:
+            set_registry(previous)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
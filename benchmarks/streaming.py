@@ -0,0 +1,123 @@
+"""Time-to-first-token benchmark for the agent graph against fake models.
+
+Streams each question through ``graph.astream(..., stream_mode=["messages",
+"updates"])`` and records, per route, the time until the first answer token
+arrives and the time until the run finishes. With streaming answer nodes the first
+token arrives one model latency after generation starts, well before the total.
+
+Usage:
+    PYTHONPATH=src python -m benchmarks.streaming --runs 20
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+
+from langchain_core.messages import HumanMessage
+from langgraph.pregel import Pregel
+
+from agent.graph import graph
+from agent.resources import set_registry
+from benchmarks.fakes import FakeEmbeddings, build_synthetic_store, fake_registry
+
+ANSWER_NODES = ("generate_response", "direct_response")
+
+QUESTIONS = [
+    "What is AWS Lambda?",
+    "How do I configure an S3 bucket lifecycle rule?",
+    "What is the capital of France?",
+    "Explain recursion in Python.",
+]
+
+
+@dataclass
+class StreamTiming:
+    """Latency of one streamed run."""
+
+    route: str
+    time_to_first_token: float
+    total_latency: float
+
+
+async def measure_stream(compiled: Pregel, question: str) -> StreamTiming:
+    """Stream one question and time its first answer token and completion."""
+    start = time.perf_counter()
+    first_token = None
+    route = "unknown"
+    async for mode, payload in compiled.astream(
+        {"messages": [HumanMessage(content=question)]},
+        stream_mode=["messages", "updates"],
+    ):
+        if mode == "updates":
+            for update in payload.values():
+                if update and update.get("route_decision"):
+                    route = update["route_decision"]
+        elif first_token is None:
+            message, metadata = payload
+            if metadata.get("langgraph_node") in ANSWER_NODES and message.content:
+                first_token = time.perf_counter() - start
+    total = time.perf_counter() - start
+    return StreamTiming(route, first_token if first_token is not None else total, total)
+
+
+def summarise(timings: list[StreamTiming]) -> dict[str, dict[str, float]]:
+    """Return median time to first token and total latency per route."""
+    summary = {}
+    for route in sorted({timing.route for timing in timings}):
+        runs = [timing for timing in timings if timing.route == route]
+        summary[route] = {
+            "runs": len(runs),
+            "p50_time_to_first_token": statistics.median(
+                timing.time_to_first_token for timing in runs
+            ),
+            "p50_total_latency": statistics.median(
+                timing.total_latency for timing in runs
+            ),
+        }
+    return summary
+
+
+async def run(args: argparse.Namespace) -> list[StreamTiming]:
+    """Stream ``args.runs`` questions one after another and collect timings."""
+    with tempfile.TemporaryDirectory() as persist_directory:
+        build_synthetic_store(persist_directory, FakeEmbeddings())
+        set_registry(
+            fake_registry(
+                persist_directory,
+                llm_latency=args.llm_latency,
+                token_latency=args.token_latency,
+            )
+        )
+        return [
+            await measure_stream(graph, QUESTIONS[i % len(QUESTIONS)])
+            for i in range(args.runs)
+        ]
+
+
+def main() -> None:
+    """Parse arguments and run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--llm-latency", type=float, default=0.1)
+    parser.add_argument("--token-latency", type=float, default=0.02)
+    parser.add_argument("--output", help="Write per-run timings as JSON to this path")
+    args = parser.parse_args()
+
+    timings = asyncio.run(run(args))
+    for route, stats in summarise(timings).items():
+        print(  # noqa: T201
+            f"{route:<16} runs={stats['runs']:<3} "
+            f"ttft={stats['p50_time_to_first_token'] * 1000:7.1f}ms "
+            f"total={stats['p50_total_latency'] * 1000:7.1f}ms"
+        )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump([asdict(timing) for timing in timings], f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""Chroma against the memory-mapped vector store: latency, recall and startup.
+
+Fills a Chroma collection with ``--count`` clustered random unit vectors (standing
+in for embedded documentation chunks), exports it with
+:func:`agent.mmap_store.export_chroma`, and runs the same ``--queries`` searches
+for the ``k`` nearest chunks against Chroma, the exact memory-mapped search and
+the IVF search at several ``nprobe`` values. Recall@k is measured against the
+exact nearest neighbours. Startup is the time a fresh process takes to open the
+store and answer its first query, which is what a new API replica pays.
+
+Usage:
+    PYTHONPATH=src python -m benchmarks.vector_store --count 50000
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections.abc import Callable
+from typing import Any
+
+import numpy as np
+from langchain_chroma import Chroma
+
+from agent.mmap_store import MmapVectorStore, export_chroma, mmap_store_path
+from benchmarks.fakes import FakeEmbeddings
+
+COLLECTION_NAME = "rag-chroma"
+
+
+def clustered_vectors(
+    count: int, dimension: int, clusters: int, rng: np.random.Generator
+) -> np.ndarray:
+    """Return ``count`` unit vectors scattered around ``clusters`` centres."""
+    centres = rng.standard_normal((clusters, dimension))
+    vectors = centres[rng.integers(clusters, size=count)]
+    vectors += 0.6 * rng.standard_normal((count, dimension))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+def build_chroma(persist_directory: str, vectors: np.ndarray) -> Chroma:
+    """Create a Chroma collection of ``vectors`` with short texts."""
+    vector_store = Chroma(
+        collection_name=COLLECTION_NAME,
+        embedding_function=FakeEmbeddings(vectors.shape[1]),
+        persist_directory=persist_directory,
+        collection_metadata={"hnsw:space": "cosine"},
+    )
+    for start in range(0, len(vectors), 5000):
+        rows = range(start, min(start + 5000, len(vectors)))
+        vector_store._collection.add(
+            ids=[f"chunk-{i}" for i in rows],
+            embeddings=vectors[rows.start : rows.stop],  # type: ignore[arg-type]
+            documents=[f"Synthetic chunk {i}" for i in rows],
+            metadatas=[{"source": f"https://example.com/{i // 8}"} for i in rows],
+        )
+    return vector_store
+
+
+def measure(
+    name: str,
+    search: Callable[[list[float]], list[Any]],
+    queries: np.ndarray,
+    truth: list[set[str]],
+) -> dict[str, Any]:
+    """Time ``search`` over ``queries`` and compare its results with ``truth``."""
+    latencies = []
+    recalls = []
+    for query, expected in zip(queries, truth, strict=True):
+        start = time.perf_counter()
+        documents = search(query.tolist())
+        latencies.append(time.perf_counter() - start)
+        recalls.append(len(expected & {doc.id for doc in documents}) / len(expected))
+    return {
+        "store": name,
+        "p50_ms": round(1000 * statistics.median(latencies), 3),
+        "p95_ms": round(1000 * statistics.quantiles(latencies, n=20)[-1], 3),
+        "recall": round(statistics.mean(recalls), 4),
+    }
+
+
+def startup_seconds(backend: str, persist_directory: str, dimension: int) -> float:
+    """Return the seconds a new process takes to open a store and query it once."""
+    output = subprocess.run(
+        [
+            sys.executable,
+            "-m",
+            "benchmarks.vector_store",
+            "--open",
+            backend,
+            "--persist-directory",
+            persist_directory,
+            "--dimension",
+            str(dimension),
+        ],
+        capture_output=True,
+        check=True,
+        text=True,
+        env={**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)},
+    )
+    return float(output.stdout.strip().splitlines()[-1])
+
+
+def open_and_query(backend: str, persist_directory: str, dimension: int) -> None:
+    """Open a store, run one query and print the elapsed seconds."""
+    start = time.perf_counter()
+    embeddings = FakeEmbeddings(dimension)
+    if backend == "chroma":
+        vector_store: Any = Chroma(
+            collection_name=COLLECTION_NAME,
+            embedding_function=embeddings,
+            persist_directory=persist_directory,
+        )
+    else:
+        vector_store = MmapVectorStore(
+            mmap_store_path(persist_directory, COLLECTION_NAME), embeddings
+        )
+    vector_store.similarity_search_by_vector([1.0] * dimension, k=10)
+    print(time.perf_counter() - start)  # noqa: T201
+
+
+def run(args: argparse.Namespace) -> list[dict[str, Any]]:
+    """Build both stores and compare them on the same queries."""
+    rng = np.random.default_rng(0)
+    vectors = clustered_vectors(args.count, args.dimension, args.clusters, rng)
+    # Queries near, but not on, indexed chunks
+    queries = vectors[rng.choice(args.count, args.queries, replace=False)]
+    queries = queries + 0.3 * rng.standard_normal(queries.shape).astype(np.float32)
+
+    results = []
+    with tempfile.TemporaryDirectory() as persist_directory:
+        chroma = build_chroma(persist_directory, vectors)
+        start = time.perf_counter()
+        export_chroma(chroma, mmap_store_path(persist_directory, COLLECTION_NAME))
+        export_seconds = time.perf_counter() - start
+
+        store = MmapVectorStore(
+            mmap_store_path(persist_directory, COLLECTION_NAME),
+            FakeEmbeddings(args.dimension),
+            nprobe=0,
+        )
+        truth = [
+            {doc.id for doc in store.similarity_search_by_vector(query, k=args.k)}
+            for query in queries.tolist()
+        ]
+
+        def searcher(vector_store: Any) -> Callable[[list[float]], list[Any]]:
+            return lambda query: vector_store.similarity_search_by_vector(
+                query, k=args.k
+            )
+
+        results.append(measure("chroma", searcher(chroma), queries, truth))
+        results.append(measure("mmap exact", searcher(store), queries, truth))
+        for nprobe in args.nprobe:
+            store.nprobe = nprobe
+            results.append(
+                measure(f"mmap ivf nprobe={nprobe}", searcher(store), queries, truth)
+            )
+
+        startup = {
+            backend: startup_seconds(backend, persist_directory, args.dimension)
+            for backend in ("chroma", "mmap")
+        }
+
+    print(  # noqa: T201
+        f"{args.count} vectors of dimension {args.dimension}, k={args.k}, "
+        f"export {export_seconds:.2f}s, IVF lists {store.manifest['ivf_lists']}"
+    )
+    for row in results:
+        print(  # noqa: T201
+            f"{row['store']:<22} p50={row['p50_ms']:7.3f}ms  "
+            f"p95={row['p95_ms']:7.3f}ms  recall@{args.k}={row['recall']:.3f}"
+        )
+    for backend, seconds in startup.items():
+        print(f"{backend:<6} open + first query in a new process: {seconds:.3f}s")  # noqa: T201
+    return results + [{"startup_seconds": startup, "export_seconds": export_seconds}]
+
+
+def main() -> None:
+    """Parse arguments and run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=20_000)
+    parser.add_argument("--dimension", type=int, default=256)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 8, 16, 32])
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    parser.add_argument("--open", choices=("chroma", "mmap"), help=argparse.SUPPRESS)
+    parser.add_argument("--persist-directory", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.open:
+        open_and_query(args.open, args.persist_directory, args.dimension)
+        return
+    results = run(args)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,677 @@
+"""Admission control and request coalescing for upstream model calls.
+
+When a popular question spikes, many runs send the same routing, embedding and
+generation requests at once, and nothing bounds how many requests a replica has
+in flight against the provider, so bursts end in rate limit errors and retry
+storms. The registry wraps every chat model and embedding client it builds (see
+:class:`AdmittedChatModel` and :class:`AdmittedEmbeddings`) so their calls go
+through the :class:`AdmissionController` of the upstream model, shared by all
+graph nodes:
+
+* :class:`SingleFlight` merges concurrent identical calls into one upstream
+  request whose result, or stream of chunks, every caller receives,
+* :class:`ConcurrencyLimit` bounds the requests in flight per model, queueing
+  the rest in arrival order,
+* :class:`TokenBucket` spaces requests to a sustained rate with bounded bursts.
+
+Queued callers, requests in flight, admission wait times and coalesced calls are
+recorded in ``agent.metrics``. Everything works from both threads and event
+loops, since the graph has sync and async node implementations.
+"""
+
+import asyncio
+import hashlib
+import json
+import math
+import threading
+import time
+from collections import deque
+from collections.abc import AsyncIterator, Awaitable, Callable, Iterator, Sequence
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
+from typing import Any, TypeVar
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import Runnable, RunnableConfig
+from langgraph.constants import TAG_NOSTREAM
+from pydantic import ConfigDict
+
+from agent.metrics import record_coalesced, record_upstream_wait, track_upstream
+
+T = TypeVar("T")
+
+
+class RequestAbandonedError(RuntimeError):
+    """The call a coalesced caller was waiting on stopped before finishing."""
+
+
+@dataclass(frozen=True)
+class AdmissionPolicy:
+    """Limits applied to the calls of each upstream model.
+
+    Attributes:
+        max_concurrency: Requests in flight per model, or ``None`` for no limit
+        requests_per_second: Sustained request rate per model, or ``None`` for
+            no limit
+        burst: Requests allowed at once above the rate, by default one second
+            worth of requests
+        coalesce: Whether concurrent identical calls share one request
+    """
+
+    max_concurrency: int | None = None
+    requests_per_second: float | None = None
+    burst: int | None = None
+    coalesce: bool = True
+
+    @property
+    def active(self) -> bool:
+        """Return whether the policy coalesces or limits anything."""
+        return self != AdmissionPolicy(coalesce=False)
+
+
+class TokenBucket:
+    """Token bucket refilled at ``rate`` tokens per second, holding ``burst``.
+
+    Callers reserve a token and then wait for the returned delay, so waiting
+    callers are served in the order they reserved and no one polls.
+
+    Args:
+        rate: Tokens added per second
+        burst: Capacity of the bucket, one second of tokens by default
+        clock: Monotonic clock, for tests
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        burst: int | None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """Create a full bucket."""
+        self.rate = rate
+        self.burst = burst or max(1, math.ceil(rate))
+        self._clock = clock
+        self._tokens = float(self.burst)
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Take a token and return the seconds to wait before using it."""
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            self._tokens -= 1
+            return max(0.0, -self._tokens / self.rate)
+
+
+class ConcurrencyLimit:
+    """Semaphore usable from threads and from any event loop.
+
+    Waiters are admitted in arrival order. An async waiter cancelled after its
+    slot was granted hands the slot on instead of leaking it.
+
+    Args:
+        limit: Holders allowed at once
+    """
+
+    def __init__(self, limit: int) -> None:
+        """Create a limit with every slot free."""
+        self.limit = limit
+        self.active = 0
+        self._lock = threading.Lock()
+        self._waiters: deque[Callable[[], None]] = deque()
+
+    def _try_acquire(self) -> bool:
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return True
+        return False
+
+    def acquire(self) -> None:
+        """Block until a slot is free."""
+        with self._lock:
+            if self._try_acquire():
+                return
+            event = threading.Event()
+            self._waiters.append(event.set)
+        event.wait()
+
+    async def aacquire(self) -> None:
+        """Wait until a slot is free without blocking the event loop."""
+        loop = asyncio.get_running_loop()
+        future: asyncio.Future[None] = loop.create_future()
+
+        def grant() -> None:
+            loop.call_soon_threadsafe(_resolve, future)
+
+        with self._lock:
+            if self._try_acquire():
+                return
+            self._waiters.append(grant)
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                granted = grant not in self._waiters
+                if not granted:
+                    self._waiters.remove(grant)
+            if granted:
+                self.release()
+            raise
+
+    def release(self) -> None:
+        """Free a slot, handing it to the longest waiter if there is one."""
+        with self._lock:
+            if self._waiters:
+                self._waiters.popleft()()
+            else:
+                self.active -= 1
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class _Flight:
+    """Items of one in-flight call, readable by any number of followers."""
+
+    def __init__(self) -> None:
+        self.items: list[Any] = []
+        self.done = False
+        self.error: BaseException | None = None
+        self._lock = threading.Lock()
+        self._wakers: list[Callable[[], None]] = []
+
+    def _update(self, apply: Callable[[], None]) -> None:
+        with self._lock:
+            apply()
+            wakers, self._wakers = self._wakers, []
+        for wake in wakers:
+            wake()
+
+    def publish(self, item: Any) -> None:
+        self._update(lambda: self.items.append(item))
+
+    def finish(self, error: BaseException | None = None) -> None:
+        if isinstance(error, GeneratorExit | asyncio.CancelledError):
+            error = RequestAbandonedError("The coalesced call was cancelled")
+
+        def apply() -> None:
+            self.done = True
+            self.error = error
+
+        self._update(apply)
+
+    def _ready(self, seen: int) -> bool:
+        return len(self.items) > seen or self.done
+
+    def follow(self) -> Iterator[Any]:
+        seen = 0
+        while True:
+            with self._lock:
+                if not self._ready(seen):
+                    event = threading.Event()
+                    self._wakers.append(event.set)
+                else:
+                    event = None
+            if event is not None:
+                event.wait()
+            with self._lock:
+                items, done, error = self.items[seen:], self.done, self.error
+            yield from items
+            seen += len(items)
+            if done and seen == len(self.items):
+                if error is not None:
+                    raise error
+                return
+
+    async def afollow(self) -> AsyncIterator[Any]:
+        loop = asyncio.get_running_loop()
+        seen = 0
+        while True:
+            future: asyncio.Future[None] | None = None
+            with self._lock:
+                if not self._ready(seen):
+                    future = loop.create_future()
+                    waiting = future
+                    self._wakers.append(
+                        lambda: loop.call_soon_threadsafe(_resolve, waiting)
+                    )
+            if future is not None:
+                await future
+            with self._lock:
+                items, done, error = self.items[seen:], self.done, self.error
+            for item in items:
+                yield item
+            seen += len(items)
+            if done and seen == len(self.items):
+                if error is not None:
+                    raise error
+                return
+
+
+class SingleFlight:
+    """Table of in-flight calls by key.
+
+    The first caller of a key runs the call and publishes what it yields; callers
+    arriving while it runs follow the same items instead of calling again. Items
+    are shared, not copied, so callers must not mutate them. A key is forgotten as
+    soon as its call finishes, so results are never reused after the fact (that is
+    the caches' job).
+    """
+
+    def __init__(self) -> None:
+        """Create an empty table."""
+        self._lock = threading.Lock()
+        self._flights: dict[str, _Flight] = {}
+
+    def __len__(self) -> int:
+        """Return the number of calls in flight."""
+        return len(self._flights)
+
+    def join(self, key: str) -> tuple[_Flight, bool]:
+        """Return the flight of ``key`` and whether the caller leads it."""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                return flight, False
+            flight = self._flights[key] = _Flight()
+            return flight, True
+
+    def land(self, key: str, flight: _Flight, error: BaseException | None) -> None:
+        """Forget the flight of ``key`` and wake its followers."""
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        flight.finish(error)
+
+
+class AdmissionController:
+    """Coalescing, concurrency limit and rate limit of one upstream model.
+
+    Args:
+        kind: ``llm`` or ``embeddings``, for metric labels
+        model: Upstream model name, for metric labels
+        policy: Limits to apply
+    """
+
+    def __init__(self, kind: str, model: str, policy: AdmissionPolicy) -> None:
+        """Create the controller of ``model``."""
+        self.kind = kind
+        self.model = model
+        self.policy = policy
+        self.limit = (
+            ConcurrencyLimit(policy.max_concurrency) if policy.max_concurrency else None
+        )
+        self.bucket = (
+            TokenBucket(policy.requests_per_second, policy.burst)
+            if policy.requests_per_second
+            else None
+        )
+        self.flights = SingleFlight() if policy.coalesce else None
+
+    def _labels(self) -> dict[str, str]:
+        return {"kind": self.kind, "model": self.model}
+
+    @contextmanager
+    def admit(self) -> Iterator[None]:
+        """Hold a slot of the model for one upstream request."""
+        start = time.perf_counter()
+        track_upstream("queued", 1, **self._labels())
+        try:
+            if self.limit is not None:
+                self.limit.acquire()
+            try:
+                if self.bucket is not None:
+                    time.sleep(self.bucket.reserve())
+            except BaseException:
+                if self.limit is not None:
+                    self.limit.release()
+                raise
+        finally:
+            track_upstream("queued", -1, **self._labels())
+        record_upstream_wait(time.perf_counter() - start, **self._labels())
+        track_upstream("in_flight", 1, **self._labels())
+        try:
+            yield
+        finally:
+            track_upstream("in_flight", -1, **self._labels())
+            if self.limit is not None:
+                self.limit.release()
+
+    @asynccontextmanager
+    async def aadmit(self) -> AsyncIterator[None]:
+        """Async variant of :meth:`admit`."""
+        start = time.perf_counter()
+        track_upstream("queued", 1, **self._labels())
+        try:
+            if self.limit is not None:
+                await self.limit.aacquire()
+            try:
+                if self.bucket is not None:
+                    await asyncio.sleep(self.bucket.reserve())
+            except BaseException:
+                if self.limit is not None:
+                    self.limit.release()
+                raise
+        finally:
+            track_upstream("queued", -1, **self._labels())
+        record_upstream_wait(time.perf_counter() - start, **self._labels())
+        track_upstream("in_flight", 1, **self._labels())
+        try:
+            yield
+        finally:
+            track_upstream("in_flight", -1, **self._labels())
+            if self.limit is not None:
+                self.limit.release()
+
+    def stream(
+        self, key: str | None, produce: Callable[[], Iterator[T]]
+    ) -> Iterator[T]:
+        """Yield the items of an upstream call, sharing it with identical callers.
+
+        Args:
+            key: Identity of the call, or ``None`` to never share it
+            produce: Starts the upstream call
+        """
+        if self.flights is None or key is None:
+            with self.admit():
+                yield from produce()
+            return
+
+        flight, leader = self.flights.join(key)
+        if not leader:
+            record_coalesced(**self._labels())
+            yielded = False
+            try:
+                for item in flight.follow():
+                    yielded = True
+                    yield item
+                return
+            except RequestAbandonedError:
+                if yielded:
+                    raise
+            # The leader gave up before producing anything; call upstream instead
+            with self.admit():
+                yield from produce()
+            return
+
+        error: BaseException | None = None
+        try:
+            with self.admit():
+                for item in produce():
+                    flight.publish(item)
+                    yield item
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self.flights.land(key, flight, error)
+
+    async def astream(
+        self, key: str | None, produce: Callable[[], AsyncIterator[T]]
+    ) -> AsyncIterator[T]:
+        """Async variant of :meth:`stream`."""
+        if self.flights is None or key is None:
+            async with self.aadmit():
+                async for item in produce():
+                    yield item
+            return
+
+        flight, leader = self.flights.join(key)
+        if not leader:
+            record_coalesced(**self._labels())
+            yielded = False
+            try:
+                async for item in flight.afollow():
+                    yielded = True
+                    yield item
+                return
+            except RequestAbandonedError:
+                if yielded:
+                    raise
+            async with self.aadmit():
+                async for item in produce():
+                    yield item
+            return
+
+        error: BaseException | None = None
+        try:
+            async with self.aadmit():
+                async for item in produce():
+                    flight.publish(item)
+                    yield item
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self.flights.land(key, flight, error)
+
+    def call(self, key: str | None, func: Callable[[], T]) -> T:
+        """Return the result of an upstream call, sharing it with identical callers."""
+        return list(self.stream(key, lambda: iter([func()])))[0]
+
+    async def acall(self, key: str | None, func: Callable[[], Awaitable[T]]) -> T:
+        """Async variant of :meth:`call`."""
+
+        async def produce() -> AsyncIterator[T]:
+            yield await func()
+
+        return [item async for item in self.astream(key, produce)][0]
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, BaseMessage):
+        return value.model_dump(exclude={"id"})
+    return repr(value)
+
+
+def request_key(*parts: Any) -> str:
+    """Return a digest identifying a call by its model, input and options."""
+    encoded = json.dumps(parts, default=_default, sort_keys=True)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+def _fresh(message: BaseMessage) -> BaseMessage:
+    # Each caller's chat model run sets its own message ID and metadata
+    return message.model_copy(update={"id": None})
+
+
+def _inner_config(run_manager: Any) -> RunnableConfig:
+    """Return the config of the wrapped model's run, a child of the caller's run.
+
+    The wrapped run is traced and calls its own callbacks, rate limiter and cache,
+    but is tagged ``nostream``: its tokens reach the streaming handlers through
+    the run of every (possibly coalesced) caller instead.
+    """
+    return {
+        "callbacks": run_manager.get_child() if run_manager else None,
+        "tags": [TAG_NOSTREAM],
+    }
+
+
+class AdmittedChatModel(BaseChatModel):
+    """Chat model whose requests go through an :class:`AdmissionController`.
+
+    The wrapped model is called through its public ``invoke``/``stream`` API.
+    Callbacks also fire on this model, so every coalesced caller streams the
+    shared completion token by token like its own. Structured output models built
+    from it are wrapped in :class:`AdmittedRunnable`.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    wrapped: BaseChatModel
+    """Chat model that calls the provider."""
+
+    admission: AdmissionController
+    """Controller of the upstream model."""
+
+    identity: str = ""
+    """Model name and settings, part of the coalescing key."""
+
+    @property
+    def _llm_type(self) -> str:
+        return self.wrapped._llm_type
+
+    def _key(
+        self, messages: list[BaseMessage], stop: list[str] | None, kwargs: dict
+    ) -> str:
+        return request_key(self.identity, messages, stop, kwargs)
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        message = self.admission.call(
+            self._key(messages, stop, kwargs),
+            lambda: self.wrapped.invoke(
+                messages, _inner_config(run_manager), stop=stop, **kwargs
+            ),
+        )
+        return ChatResult(generations=[ChatGeneration(message=_fresh(message))])
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        message = await self.admission.acall(
+            self._key(messages, stop, kwargs),
+            lambda: self.wrapped.ainvoke(
+                messages, _inner_config(run_manager), stop=stop, **kwargs
+            ),
+        )
+        return ChatResult(generations=[ChatGeneration(message=_fresh(message))])
+
+    def _stream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        chunks = self.admission.stream(
+            self._key(messages, stop, {**kwargs, "stream": True}),
+            lambda: self.wrapped.stream(
+                messages, _inner_config(run_manager), stop=stop, **kwargs
+            ),
+        )
+        for chunk in chunks:
+            yield ChatGenerationChunk(message=_fresh(chunk))
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        chunks = self.admission.astream(
+            self._key(messages, stop, {**kwargs, "stream": True}),
+            lambda: self.wrapped.astream(
+                messages, _inner_config(run_manager), stop=stop, **kwargs
+            ),
+        )
+        async for chunk in chunks:
+            yield ChatGenerationChunk(message=_fresh(chunk))
+
+    def with_structured_output(  # type: ignore[override]
+        self, schema: Any, **kwargs: Any
+    ) -> Runnable:
+        """Return the wrapped model's structured output runnable, admitted."""
+        return AdmittedRunnable(
+            self.wrapped.with_structured_output(schema, **kwargs),
+            self.admission,
+            request_key(self.identity, schema, kwargs),
+        )
+
+
+class AdmittedRunnable(Runnable):
+    """Runnable whose invocations go through an :class:`AdmissionController`.
+
+    Args:
+        bound: Runnable that calls the provider, e.g. a structured output model
+        admission: Controller of the upstream model
+        identity: Part of the coalescing key, distinguishing runnables
+    """
+
+    def __init__(
+        self, bound: Runnable, admission: AdmissionController, identity: str
+    ) -> None:
+        """Wrap ``bound``."""
+        self.bound = bound
+        self.admission = admission
+        self.identity = identity
+
+    def invoke(
+        self, input: Any, config: RunnableConfig | None = None, **kwargs: Any
+    ) -> Any:
+        """Invoke the bound runnable, or share an identical call in flight."""
+        return self.admission.call(
+            request_key(self.identity, input, kwargs),
+            lambda: self.bound.invoke(input, config, **kwargs),
+        )
+
+    async def ainvoke(
+        self, input: Any, config: RunnableConfig | None = None, **kwargs: Any
+    ) -> Any:
+        """Async variant of :meth:`invoke`."""
+        return await self.admission.acall(
+            request_key(self.identity, input, kwargs),
+            lambda: self.bound.ainvoke(input, config, **kwargs),
+        )
+
+
+class AdmittedEmbeddings(Embeddings):
+    """Embedding client whose requests go through an :class:`AdmissionController`.
+
+    Args:
+        wrapped: Embedding client that calls the provider
+        admission: Controller of the upstream model
+    """
+
+    def __init__(self, wrapped: Embeddings, admission: AdmissionController) -> None:
+        """Wrap ``wrapped``."""
+        self.wrapped = wrapped
+        self.admission = admission
+
+    def _key(self, method: str, texts: Sequence[str] | str) -> str:
+        return request_key(self.admission.model, method, texts)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        """Embed ``texts`` in one admitted request."""
+        return self.admission.call(
+            self._key("documents", texts), lambda: self.wrapped.embed_documents(texts)
+        )
+
+    def embed_query(self, text: str) -> list[float]:
+        """Embed a query in one admitted request."""
+        return self.admission.call(
+            self._key("query", text), lambda: self.wrapped.embed_query(text)
+        )
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        """Async variant of :meth:`embed_documents`."""
+        return await self.admission.acall(
+            self._key("documents", texts),
+            lambda: self.wrapped.aembed_documents(texts),
+        )
+
+    async def aembed_query(self, text: str) -> list[float]:
+        """Async variant of :meth:`embed_query`."""
+        return await self.admission.acall(
+            self._key("query", text), lambda: self.wrapped.aembed_query(text)
+        )
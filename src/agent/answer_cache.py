@@ -0,0 +1,246 @@
+"""Semantic answer cache for the RAG agent.
+
+Near-duplicate questions ("what is lambda", "What is AWS Lambda?") are common, and
+each one otherwise pays for routing, embedding, retrieval and a full generation.
+The cache stores finished answers keyed by the normalised question and, when a
+similarity threshold is configured, also matches new questions whose embedding is
+close enough to a cached one.
+
+Entries expire after a TTL, the least recently used entry is evicted once the cache
+is full, and the whole cache is dropped when the indexer rebuilds the Chroma index
+(detected through the index version file it writes next to the collection).
+"""
+
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+import numpy as np
+from langchain_core.documents import Document
+
+from agent.chunks import ChunkRef
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION_FILENAME = "index_version"
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalise_question(question: str) -> str:
+    """Lower-case ``question`` and strip punctuation and repeated whitespace."""
+    question = _PUNCTUATION.sub(" ", question.lower())
+    return _WHITESPACE.sub(" ", question).strip()
+
+
+def read_index_version(persist_directory: str) -> str | None:
+    """Return the version written by the last index build, if any."""
+    try:
+        with open(os.path.join(persist_directory, INDEX_VERSION_FILENAME)) as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+def write_index_version(persist_directory: str) -> str:
+    """Record that the index in ``persist_directory`` was rebuilt.
+
+    Returns:
+        str: The new version identifier
+    """
+    version = uuid.uuid4().hex
+    os.makedirs(persist_directory, exist_ok=True)
+    path = os.path.join(persist_directory, INDEX_VERSION_FILENAME)
+    with open(f"{path}.tmp", "w") as f:
+        f.write(version)
+    os.replace(f"{path}.tmp", path)
+    return version
+
+
+@dataclass
+class CachedAnswer:
+    """An answer stored in the cache."""
+
+    answer: str
+    route_decision: str
+    documents: list[Document] | None = None
+    chunk_refs: list[ChunkRef] | None = None
+    embedding: np.ndarray | None = field(default=None, repr=False)
+    created_at: float = 0.0
+
+
+@dataclass
+class CacheStats:
+    """Counters describing cache effectiveness."""
+
+    hits: int = 0
+    semantic_hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+    invalidations: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        """Return the fraction of lookups served from the cache."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class AnswerCache:
+    """Bounded LRU cache of answers with TTL and optional semantic matching.
+
+    Args:
+        max_size: Maximum number of cached answers
+        ttl: Seconds an answer stays valid
+        similarity_threshold: Minimum cosine similarity for a semantic hit, or
+            ``None`` to only match normalised questions exactly
+        persist_directory: Chroma directory whose index version invalidates the
+            cache when it changes, or ``None`` to disable invalidation
+        version_check_interval: Seconds between checks of the index version file
+    """
+
+    def __init__(
+        self,
+        max_size: int = 1024,
+        ttl: float = 3600,
+        similarity_threshold: float | None = None,
+        persist_directory: str | None = None,
+        version_check_interval: float = 5.0,
+    ) -> None:
+        """Create an empty cache."""
+        self.max_size = max_size
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.persist_directory = persist_directory
+        self.version_check_interval = version_check_interval
+        self.stats = CacheStats()
+
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, CachedAnswer] = OrderedDict()
+        self._matrix: np.ndarray | None = None
+        self._matrix_keys: list[str] = []
+        self._index_version = (
+            read_index_version(persist_directory) if persist_directory else None
+        )
+        self._version_checked_at = time.monotonic()
+
+    def __len__(self) -> int:
+        """Return the number of cached answers."""
+        return len(self._entries)
+
+    @property
+    def uses_embeddings(self) -> bool:
+        """Return whether lookups need the question embedding."""
+        return self.similarity_threshold is not None
+
+    def clear(self) -> None:
+        """Drop every cached answer."""
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+    def _check_index_version(self, now: float) -> None:
+        if self.persist_directory is None:
+            return
+        if now - self._version_checked_at < self.version_check_interval:
+            return
+        self._version_checked_at = now
+        version = read_index_version(self.persist_directory)
+        if version != self._index_version:
+            logger.info("Index version changed, dropping %d answers", len(self))
+            self._index_version = version
+            self._entries.clear()
+            self._matrix = None
+            self.stats.invalidations += 1
+
+    def _expire(self, key: str, now: float) -> bool:
+        entry = self._entries.get(key)
+        if entry is not None and now - entry.created_at > self.ttl:
+            del self._entries[key]
+            self._matrix = None
+            self.stats.expirations += 1
+            return True
+        return False
+
+    def _matches(self, embedding: np.ndarray, threshold: float) -> list[str]:
+        """Return the keys of entries at least ``threshold`` similar, best first."""
+        if self._matrix is None:
+            self._matrix_keys = [
+                key
+                for key, entry in self._entries.items()
+                if entry.embedding is not None
+            ]
+            if not self._matrix_keys:
+                return []
+            self._matrix = np.stack(
+                [self._entries[key].embedding for key in self._matrix_keys]  # type: ignore[misc]
+            )
+        if not self._matrix_keys:
+            return []
+        scores = self._matrix @ embedding
+        (above,) = np.nonzero(scores >= threshold)
+        best_first = above[np.argsort(-scores[above], kind="stable")]
+        return [self._matrix_keys[i] for i in best_first]
+
+    def lookup(
+        self, question: str, embedding: list[float] | None = None
+    ) -> CachedAnswer | None:
+        """Return the cached answer for ``question``, or ``None`` on a miss.
+
+        Args:
+            question: The user's question
+            embedding: Embedding of the question, required for semantic matching
+        """
+        key = normalise_question(question)
+        now = time.monotonic()
+        with self._lock:
+            self._check_index_version(now)
+
+            if key in self._entries and not self._expire(key, now):
+                self._entries.move_to_end(key)
+                self.stats.hits += 1
+                return self._entries[key]
+
+            if self.similarity_threshold is not None and embedding is not None:
+                # An expired neighbour is dropped and the next nearest one tried
+                for match in self._matches(_unit(embedding), self.similarity_threshold):
+                    if not self._expire(match, now):
+                        self._entries.move_to_end(match)
+                        self.stats.hits += 1
+                        self.stats.semantic_hits += 1
+                        return self._entries[match]
+
+            self.stats.misses += 1
+            return None
+
+    def store(
+        self,
+        question: str,
+        answer: CachedAnswer,
+        embedding: list[float] | None = None,
+    ) -> None:
+        """Cache ``answer`` for ``question``, evicting the oldest entry if full."""
+        key = normalise_question(question)
+        answer.created_at = time.monotonic()
+        if embedding is not None:
+            answer.embedding = _unit(embedding)
+        with self._lock:
+            self._entries[key] = answer
+            self._entries.move_to_end(key)
+            self._matrix = None
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.stats.evictions += 1
+
+
+def _unit(embedding: list[float]) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
@@ -0,0 +1,446 @@
+"""Batch question answering over the agent's nodes.
+
+Bulk jobs, such as evaluating a FAQ set or pre-warming the answer cache, would
+otherwise call ``graph.ainvoke`` once per question and pay for an embedding
+request, a vector search and often a routing call per question. :func:`abatch_answer`
+runs those stages across the whole batch instead:
+
+1. every question is embedded in one embeddings request,
+2. with the answer cache enabled, hits are returned straight away and the
+   generated answers are stored, so a batch run also warms the cache,
+3. the local router decides what it can from those embeddings and the remaining
+   questions are routed in one LLM call per ``batch_routing_size`` questions,
+4. the AWS questions are searched with the embeddings from step 1, in one pass
+   over the memory-mapped store, and fused with BM25 when hybrid retrieval is
+   on, and
+5. answers are generated concurrently by the graph's own rerank and generation
+   nodes, at most ``batch_max_concurrency`` at a time.
+
+Results are yielded as they finish. A failure only marks the items it affects as
+failed, whether it happens in a shared stage or in one item's generation, and
+the rest of the batch carries on.
+"""
+
+import asyncio
+import logging
+import time
+from collections.abc import AsyncIterator, Sequence
+from dataclasses import dataclass, field
+from typing import Any, Literal, cast
+
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.runnables import RunnableConfig
+from langchain_core.vectorstores import VectorStore
+from langgraph.constants import TAG_NOSTREAM
+from pydantic import BaseModel
+
+from agent.configuration import Configuration
+from agent.context import rank_documents
+from agent.graph import (
+    RoutingResponse,
+    adirect_response,
+    agenerate_response,
+    arerank_documents,
+)
+from agent.metrics import record_documents, record_route, timed
+from agent.mmap_store import MmapVectorStore
+from agent.prompts import BATCH_ROUTING_PROMPT, ROUTING_PROMPT
+from agent.resources import get_registry
+from agent.state import AgentState
+
+logger = logging.getLogger(__name__)
+
+Route = Literal["aws_docs", "direct_response"]
+
+
+class BatchRoutingResponse(BaseModel):
+    """Routing decisions for a numbered list of questions, in order."""
+
+    decisions: list[Route]
+
+
+@dataclass
+class BatchResult:
+    """Outcome of one question of a batch.
+
+    Attributes:
+        index: Position of the question in the batch
+        question: The question
+        answer: The generated or cached answer, ``None`` on failure
+        route_decision: Routing decision, if routing got that far
+        documents: Documents the answer was generated from, in retrieval order
+        cache_hit: Whether the answer came from the answer cache
+        error: ``ExceptionType: message`` of the failure, if any
+        seconds: Time from the start of the batch until the result was ready
+    """
+
+    index: int
+    question: str
+    answer: str | None = None
+    route_decision: Route | None = None
+    documents: list[Document] | None = field(default=None, repr=False)
+    cache_hit: bool = False
+    error: str | None = None
+    seconds: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        """Return whether the question was answered."""
+        return self.error is None
+
+
+def _error(exception: BaseException) -> str:
+    return f"{type(exception).__name__}: {exception}"
+
+
+def _numbered(questions: Sequence[str]) -> str:
+    # One line per question so a newline inside a question can't shift the list
+    return "\n".join(
+        f"{i}. {' '.join(question.split())}" for i, question in enumerate(questions, 1)
+    )
+
+
+async def _route_with_llm(
+    questions: list[str], configuration: Configuration
+) -> list[Route | BaseException]:
+    """Route ``questions`` in one LLM call, falling back to one call each."""
+    registry = get_registry()
+    start = time.perf_counter()
+    try:
+        llm = await registry.aget_structured_model(
+            BatchRoutingResponse, configuration.chat_model, configuration.temperature
+        )
+        response = cast(
+            BatchRoutingResponse,
+            await llm.ainvoke(
+                [
+                    SystemMessage(content=BATCH_ROUTING_PROMPT),
+                    HumanMessage(content=_numbered(questions)),
+                ],
+                {"tags": [TAG_NOSTREAM]},
+            ),
+        )
+        if len(response.decisions) == len(questions):
+            elapsed = (time.perf_counter() - start) / len(questions)
+            for decision in response.decisions:
+                record_route("llm_batch", decision, elapsed)
+            return list(response.decisions)
+        logger.warning(
+            "Batch router returned %d decisions for %d questions",
+            len(response.decisions),
+            len(questions),
+        )
+    except Exception:
+        logger.warning("Batch routing failed, routing one by one", exc_info=True)
+
+    llm = await registry.aget_structured_model(
+        RoutingResponse, configuration.chat_model, configuration.temperature
+    )
+    responses = await llm.abatch(
+        [
+            [
+                SystemMessage(content=ROUTING_PROMPT.format(question=question)),
+                HumanMessage(content=question),
+            ]
+            for question in questions
+        ],
+        {"tags": [TAG_NOSTREAM]},
+        return_exceptions=True,
+    )
+    return [
+        response
+        if isinstance(response, BaseException)
+        else cast(RoutingResponse, response).decision
+        for response in responses
+    ]
+
+
+def _search(
+    vector_store: VectorStore, embeddings: list[list[float]], k: int
+) -> list[list[Document]]:
+    """Run the vector searches of a batch, in one pass when the store allows it."""
+    if isinstance(vector_store, MmapVectorStore):
+        return vector_store.similarity_search_by_vectors(embeddings, k)
+    if isinstance(vector_store, Chroma):
+        return [
+            [
+                document
+                for document, _ in (
+                    vector_store.similarity_search_by_vector_with_relevance_scores(
+                        embedding, k=k
+                    )
+                )
+            ]
+            for embedding in embeddings
+        ]
+    return [
+        vector_store.similarity_search_by_vector(embedding, k=k)
+        for embedding in embeddings
+    ]
+
+
+def _retrieve(
+    questions: list[str],
+    embeddings: list[list[float]],
+    k: int,
+    configuration: Configuration,
+) -> list[list[Document]]:
+    """Retrieve the documents of every question, like ``retrieve_documents``."""
+    from agent.lexical import fuse_results
+
+    registry = get_registry()
+    vector_store = registry.get_vector_store(
+        configuration.collection_name,
+        configuration.persist_directory,
+        configuration.embedding_model,
+        configuration.vector_store,
+        configuration.ann_nprobe,
+    )
+    with timed("batch_vector_search"):
+        results = _search(vector_store, embeddings, k)
+
+    if configuration.retriever == "hybrid":
+        index = registry.get_lexical_index(configuration.persist_directory).get()
+        if index is not None:
+            with timed("batch_lexical_search"):
+                results = [
+                    fuse_results(
+                        vector_store, documents, index.search(question, k=k), k
+                    )
+                    for question, documents in zip(questions, results, strict=True)
+                ]
+    return [rank_documents(documents) for documents in results]
+
+
+async def _answer(
+    result: BatchResult,
+    config: RunnableConfig,
+    configuration: Configuration,
+    documents: list[Document] | None,
+) -> None:
+    """Generate the answer of one routed question through the graph's nodes."""
+    state = AgentState(
+        messages=[HumanMessage(content=result.question)],
+        question=result.question,
+        route_decision=result.route_decision,
+        documents=documents,
+    )
+    if result.route_decision == "direct_response":
+        update: dict[str, Any] = await adirect_response(state, config)
+    else:
+        if configuration.rerank:
+            state = state.model_copy(update=await arerank_documents(state, config))
+        update = await agenerate_response(state, config)
+    result.answer = str(update["messages"][-1].content)
+    result.documents = state.documents
+
+
+async def abatch_answer(
+    questions: Sequence[str],
+    config: RunnableConfig | None = None,
+    max_concurrency: int | None = None,
+) -> AsyncIterator[BatchResult]:
+    """Answer ``questions``, yielding each result as soon as it is ready.
+
+    Args:
+        questions: Standalone questions to answer
+        config: Runnable config whose ``configurable`` values override the
+            configuration, as for a graph run; ``answer_cache`` and ``rerank``
+            may be set here too
+        max_concurrency: Answers generated at once, ``batch_max_concurrency`` by
+            default
+
+    Yields:
+        BatchResult: The result of each question, in completion order
+    """
+    # Nothing is checkpointed, so documents are kept whole
+    config = {
+        **(config or {}),
+        "configurable": {
+            **((config or {}).get("configurable") or {}),
+            "chunk_refs": False,
+        },
+    }
+    configuration = Configuration.from_runnable_config(config)
+    limit = asyncio.Semaphore(max_concurrency or configuration.batch_max_concurrency)
+    results = [BatchResult(index, question) for index, question in enumerate(questions)]
+    finished: asyncio.Queue[BatchResult] = asyncio.Queue()
+    tasks: set[asyncio.Task] = set()
+    # Questions that have a result or a generation task
+    handled: set[int] = set()
+    start = time.perf_counter()
+
+    def finish(result: BatchResult, error: BaseException | None = None) -> None:
+        handled.add(result.index)
+        if error is not None:
+            logger.warning("Batch question %d failed: %s", result.index, _error(error))
+            result.error = _error(error)
+        result.seconds = time.perf_counter() - start
+        finished.put_nowait(result)
+
+    async def generate(result: BatchResult, documents: list[Document] | None) -> None:
+        async with limit:
+            try:
+                await _answer(result, config, configuration, documents)
+            except Exception as e:
+                finish(result, e)
+                return
+        if cache is not None:
+            try:
+                cache.store(result.question, _cached(result), embeddings[result.index])
+            except Exception:
+                # The answer is still good; it just won't be served from the cache
+                logger.exception("Caching batch answer %d failed", result.index)
+        finish(result)
+
+    def spawn(result: BatchResult, documents: list[Document] | None = None) -> None:
+        handled.add(result.index)
+        task = asyncio.create_task(generate(result, documents))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    cache = None
+    embeddings: list[list[float]] = []
+
+    async def run() -> None:
+        nonlocal cache, embeddings
+        registry = get_registry()
+        with timed("batch_embed"):
+            embedder = await registry.aget_embeddings(configuration.embedding_model)
+            embeddings = await embedder.aembed_documents(list(questions))
+
+        pending = results
+        if configuration.answer_cache:
+            cache = await asyncio.to_thread(
+                registry.get_answer_cache,
+                configuration.answer_cache_max_size,
+                configuration.answer_cache_ttl_seconds,
+                configuration.answer_cache_similarity_threshold,
+                configuration.persist_directory,
+                configuration.answer_scope,
+            )
+            pending = []
+            for result in results:
+                cached = cache.lookup(result.question, embeddings[result.index])
+                if cached is None:
+                    pending.append(result)
+                    continue
+                result.answer = cached.answer
+                result.route_decision = cast(Route, cached.route_decision)
+                result.documents = cached.documents
+                result.cache_hit = True
+                finish(result)
+
+        undecided = pending
+        router = None
+        if configuration.local_router:
+            router = registry.get_local_router(
+                configuration.embedding_model, configuration.local_router_min_margin
+            )
+            undecided = []
+            for result in pending:
+                routed_at = time.perf_counter()
+                decision, tier = await router.aroute_embedded(
+                    result.question, embeddings[result.index]
+                )
+                if decision is None:
+                    undecided.append(result)
+                    continue
+                elapsed = time.perf_counter() - routed_at
+                record_route(tier, decision, elapsed)
+                router.stats.record(tier, elapsed)
+                result.route_decision = decision
+        size = max(configuration.batch_routing_size, 1)
+        for offset in range(0, len(undecided), size):
+            chunk = undecided[offset : offset + size]
+            routed_at = time.perf_counter()
+            decisions = await _route_with_llm(
+                [result.question for result in chunk], configuration
+            )
+            elapsed = (time.perf_counter() - routed_at) / len(chunk)
+            for result, decision in zip(chunk, decisions, strict=True):
+                if isinstance(decision, BaseException):
+                    finish(result, decision)
+                    continue
+                result.route_decision = decision
+                if router is not None:
+                    router.stats.record("llm", elapsed)
+
+        aws = []
+        for result in pending:
+            if result.route_decision == "direct_response":
+                spawn(result)
+            elif result.route_decision == "aws_docs":
+                aws.append(result)
+        if not aws:
+            return
+
+        k = (
+            configuration.rerank_candidates
+            if configuration.rerank
+            else configuration.retrieval_k
+        )
+        try:
+            retrieved = await asyncio.to_thread(
+                _retrieve,
+                [result.question for result in aws],
+                [embeddings[result.index] for result in aws],
+                k,
+                configuration,
+            )
+        except Exception as e:
+            for result in aws:
+                finish(result, e)
+            return
+        for result, documents in zip(aws, retrieved, strict=True):
+            record_documents("batch_retrieve", len(documents))
+            spawn(result, documents)
+
+    async def run_safely() -> None:
+        try:
+            await run()
+        except Exception as e:
+            # A shared stage failed: fail every question it left unanswered
+            for result in results:
+                if result.index not in handled:
+                    finish(result, e)
+
+    runner = asyncio.create_task(run_safely())
+    try:
+        for _ in results:
+            yield await finished.get()
+    finally:
+        runner.cancel()
+        for task in list(tasks):
+            task.cancel()
+
+
+def _cached(result: BatchResult) -> Any:
+    from agent.answer_cache import CachedAnswer
+
+    return CachedAnswer(
+        answer=cast(str, result.answer),
+        route_decision=cast(str, result.route_decision),
+        documents=result.documents if result.route_decision == "aws_docs" else None,
+    )
+
+
+def batch_answer(
+    questions: Sequence[str],
+    config: RunnableConfig | None = None,
+    max_concurrency: int | None = None,
+) -> list[BatchResult]:
+    """Answer ``questions`` and return the results in question order.
+
+    Synchronous wrapper around :func:`abatch_answer`; it must not be called from a
+    running event loop.
+    """
+
+    async def collect() -> list[BatchResult]:
+        return [
+            result async for result in abatch_answer(questions, config, max_concurrency)
+        ]
+
+    return sorted(asyncio.run(collect()), key=lambda result: result.index)
@@ -0,0 +1,82 @@
+"""Compact references to retrieved chunks, for slim checkpointed state.
+
+Retrieved documents are the bulk of the agent state: ten 1200-token chunks are
+tens of kilobytes, and the checkpointer writes them on every step of every thread.
+With ``chunk_refs`` enabled the retrieval and rerank nodes store a
+:class:`ChunkRef` per chunk instead (its Chroma ID, source, title, position and
+retrieval rank), and the nodes that need the text load it back from the local
+vector store with :func:`load_chunks`.
+"""
+
+import logging
+from collections.abc import Sequence
+
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+from pydantic import BaseModel
+
+from agent.context import RANK_KEY
+
+logger = logging.getLogger(__name__)
+
+
+class ChunkRef(BaseModel):
+    """Reference to a chunk in the vector store.
+
+    Attributes:
+        id: Chroma ID of the chunk
+        source: URL of the page the chunk comes from
+        title: Title of the page, if known
+        start_index: Character offset of the chunk in the page, -1 if unknown
+        rank: Position of the chunk in the retrieval results, if ranked
+    """
+
+    id: str
+    source: str = ""
+    title: str | None = None
+    start_index: int = -1
+    rank: int | None = None
+
+
+def to_refs(documents: Sequence[Document]) -> list[ChunkRef] | None:
+    """Return references to ``documents``, or ``None`` if any has no ID."""
+    if any(document.id is None for document in documents):
+        return None
+    return [
+        ChunkRef(
+            id=str(document.id),
+            source=document.metadata.get("source", ""),
+            title=document.metadata.get("title"),
+            start_index=document.metadata.get("start_index", -1),
+            rank=document.metadata.get(RANK_KEY),
+        )
+        for document in documents
+    ]
+
+
+def load_chunks(vector_store: VectorStore, refs: Sequence[ChunkRef]) -> list[Document]:
+    """Load the documents behind ``refs`` in the order of ``refs``.
+
+    Chunks that no longer exist, e.g. after the index was rebuilt, are skipped.
+    """
+    if not refs:
+        return []
+    by_id = {
+        str(document.id): document
+        for document in vector_store.get_by_ids([ref.id for ref in refs])
+    }
+    documents = []
+    for ref in refs:
+        document = by_id.get(ref.id)
+        if document is None:
+            continue
+        if ref.rank is not None:
+            document.metadata[RANK_KEY] = ref.rank
+        documents.append(document)
+    if len(documents) < len(refs):
+        logger.warning(
+            "%d of %d referenced chunks are no longer in the vector store",
+            len(refs) - len(documents),
+            len(refs),
+        )
+    return documents
@@ -0,0 +1,315 @@
+"""Typed runtime configuration of the RAG agent.
+
+:class:`Configuration` gathers every setting of the graph: models, retrieval depth
+and retriever type, conversation history, caching, reranking, context budget and
+concurrency. It is read in three layers:
+
+1. the field defaults below,
+2. environment variables (and ``.env``), read once by :func:`default_configuration`,
+3. the ``configurable`` dict of a run's ``RunnableConfig``, so a single deployment
+   can be tuned per tenant or per request without redeploying::
+
+       graph.invoke(inputs, {"configurable": {"chat_model": "openai:gpt-4o"}})
+
+Fields marked as topology fields decide which nodes the graph has, so they only
+take effect when the graph is built by ``agent.graph.build_graph``. Metrics fields
+are process-wide and only take effect on the first build, and the embedding cache
+and admission fields configure the process-wide registry of
+``agent.resources.get_registry`` when it is first used.
+"""
+
+import functools
+import os
+import types
+import typing
+from dataclasses import dataclass, field, fields, replace
+from typing import Any, Literal
+
+from langchain_core.runnables import RunnableConfig
+
+from agent.resources import (
+    DEFAULT_CHAT_MODEL,
+    DEFAULT_COLLECTION_NAME,
+    DEFAULT_EMBEDDING_CACHE_PATH,
+    DEFAULT_EMBEDDING_MODEL,
+    DEFAULT_PERSIST_DIRECTORY,
+)
+
+RetrieverType = Literal["dense", "hybrid"]
+VectorStoreType = Literal["chroma", "mmap"]
+
+
+def _env(name: str, topology: bool = False) -> dict[str, Any]:
+    return {"env": name, "topology": topology}
+
+
+@dataclass(frozen=True, kw_only=True)
+class Configuration:
+    """Settings of the RAG agent graph.
+
+    Attributes:
+        chat_model: Chat model for routing and answers, as ``provider:model``
+        temperature: Sampling temperature of the chat model
+        embedding_model: Embedding model of the questions and the index
+        collection_name: Chroma collection holding the documentation chunks
+        persist_directory: Directory of the Chroma data and the BM25 index
+        retrieval_k: Documents retrieved per question
+        retriever: ``hybrid`` fuses BM25 with the vector search, ``dense`` only
+            searches vectors
+        vector_store: ``chroma`` searches the Chroma collection, ``mmap`` its
+            memory-mapped export written by ``indexer --export-mmap``
+        ann_nprobe: IVF lists the ``mmap`` store searches per query, or 0 for
+            exact search
+        condense_questions: Whether follow-up questions are rewritten into
+            standalone questions before routing and retrieval
+        condense_history_messages: Recent messages shown to the rewrite
+        rewrite_cache_max_size: Maximum memoised rewrites
+        history_max_messages: Messages a thread keeps before the oldest are
+            trimmed, or 0 to keep them all
+        history_summary: Whether trimmed messages are folded into a summary
+        local_router: Whether keyword and centroid routing may skip the LLM
+        local_router_min_margin: Minimum centroid similarity margin for a local
+            decision
+        answer_cache: Whether answers are cached (topology)
+        answer_cache_max_size: Maximum cached answers
+        answer_cache_ttl_seconds: Seconds a cached answer stays valid
+        answer_cache_similarity_threshold: Cosine similarity for semantic cache
+            hits, or ``None`` for exact matches only
+        speculative_retrieval: Whether retrieval runs alongside routing (topology)
+        rerank: Whether retrieval candidates are reranked (topology)
+        rerank_candidates: Documents retrieved for the reranker
+        rerank_top_n: Documents the reranker keeps
+        rerank_timeout_ms: Milliseconds after which the retrieval order is kept
+        rerank_model: sentence-transformers cross-encoder, or ``None`` for the
+            lexical scorer
+        chunk_refs: Whether the state stores chunk references instead of the
+            retrieved documents, which are loaded again when needed
+        context_token_budget: Tokens of document content in the RAG prompt; 0 only
+            merges and deduplicates
+        max_concurrency: Maximum nodes a run executes in parallel
+        batch_max_concurrency: Answers generated at once by the batch API
+        batch_routing_size: Questions routed per LLM call by the batch API
+        metrics_exporter: ``prometheus``, ``openmetrics``, ``log`` or ``None``
+        metrics_port: HTTP port of the Prometheus and OpenMetrics exporters
+        metrics_log_interval: Seconds between log exports
+        warm_up: Whether building the graph builds the shared clients in the
+            background
+        embedding_cache_path: SQLite file of the persistent embedding cache, or
+            ``None`` (an empty variable) to embed without caching
+        request_coalescing: Whether concurrent identical model calls share one
+            upstream request
+        llm_max_concurrency: Chat model requests in flight per model, or
+            ``None`` for no limit
+        llm_requests_per_second: Sustained chat model request rate per model, or
+            ``None`` for no limit
+        llm_burst: Chat model requests allowed at once above the rate
+        embedding_max_concurrency: Embedding requests in flight per model, or
+            ``None`` for no limit
+        embedding_requests_per_second: Sustained embedding request rate per
+            model, or ``None`` for no limit
+        embedding_burst: Embedding requests allowed at once above the rate
+    """
+
+    chat_model: str = field(default=DEFAULT_CHAT_MODEL, metadata=_env("CHAT_MODEL"))
+    temperature: float = field(default=0.0, metadata=_env("TEMPERATURE"))
+    embedding_model: str = field(
+        default=DEFAULT_EMBEDDING_MODEL, metadata=_env("EMBEDDING_MODEL")
+    )
+    collection_name: str = field(
+        default=DEFAULT_COLLECTION_NAME, metadata=_env("COLLECTION_NAME")
+    )
+    persist_directory: str = field(
+        default=DEFAULT_PERSIST_DIRECTORY, metadata=_env("PERSIST_DIRECTORY")
+    )
+    retrieval_k: int = field(default=10, metadata=_env("RETRIEVAL_K"))
+    retriever: RetrieverType = field(default="hybrid", metadata=_env("RETRIEVER"))
+    vector_store: VectorStoreType = field(
+        default="chroma", metadata=_env("VECTOR_STORE")
+    )
+    ann_nprobe: int = field(default=16, metadata=_env("ANN_NPROBE"))
+
+    condense_questions: bool = field(
+        default=True, metadata=_env("CONDENSE_QUESTIONS_ENABLED")
+    )
+    condense_history_messages: int = field(
+        default=6, metadata=_env("CONDENSE_HISTORY_MESSAGES")
+    )
+    rewrite_cache_max_size: int = field(
+        default=1024, metadata=_env("REWRITE_CACHE_MAX_SIZE")
+    )
+    history_max_messages: int = field(default=20, metadata=_env("HISTORY_MAX_MESSAGES"))
+    history_summary: bool = field(
+        default=True, metadata=_env("HISTORY_SUMMARY_ENABLED")
+    )
+
+    local_router: bool = field(default=True, metadata=_env("LOCAL_ROUTER_ENABLED"))
+    local_router_min_margin: float = field(
+        default=0.05, metadata=_env("LOCAL_ROUTER_MIN_MARGIN")
+    )
+
+    answer_cache: bool = field(
+        default=False, metadata=_env("ANSWER_CACHE_ENABLED", topology=True)
+    )
+    answer_cache_max_size: int = field(
+        default=1024, metadata=_env("ANSWER_CACHE_MAX_SIZE")
+    )
+    answer_cache_ttl_seconds: float = field(
+        default=3600.0, metadata=_env("ANSWER_CACHE_TTL_SECONDS")
+    )
+    answer_cache_similarity_threshold: float | None = field(
+        default=None, metadata=_env("ANSWER_CACHE_SIMILARITY_THRESHOLD")
+    )
+
+    speculative_retrieval: bool = field(
+        default=False, metadata=_env("SPECULATIVE_RETRIEVAL_ENABLED", topology=True)
+    )
+
+    rerank: bool = field(default=False, metadata=_env("RERANK_ENABLED", topology=True))
+    rerank_candidates: int = field(default=50, metadata=_env("RERANK_CANDIDATES"))
+    rerank_top_n: int = field(default=10, metadata=_env("RERANK_TOP_N"))
+    rerank_timeout_ms: float = field(default=100.0, metadata=_env("RERANK_TIMEOUT_MS"))
+    rerank_model: str | None = field(default=None, metadata=_env("RERANK_MODEL"))
+
+    chunk_refs: bool = field(default=False, metadata=_env("CHUNK_REFS_ENABLED"))
+    context_token_budget: int = field(
+        default=6000, metadata=_env("CONTEXT_TOKEN_BUDGET")
+    )
+    max_concurrency: int | None = field(
+        default=None, metadata=_env("MAX_CONCURRENCY", topology=True)
+    )
+
+    batch_max_concurrency: int = field(
+        default=8, metadata=_env("BATCH_MAX_CONCURRENCY")
+    )
+    batch_routing_size: int = field(default=50, metadata=_env("BATCH_ROUTING_SIZE"))
+
+    metrics_exporter: str | None = field(
+        default=None, metadata=_env("METRICS_EXPORTER", topology=True)
+    )
+    metrics_port: int = field(
+        default=9464, metadata=_env("METRICS_PORT", topology=True)
+    )
+    metrics_log_interval: float = field(
+        default=60.0, metadata=_env("METRICS_LOG_INTERVAL", topology=True)
+    )
+    warm_up: bool = field(default=False, metadata=_env("AGENT_WARM_UP", topology=True))
+
+    embedding_cache_path: str | None = field(
+        default=DEFAULT_EMBEDDING_CACHE_PATH,
+        metadata=_env("EMBEDDING_CACHE_PATH", topology=True),
+    )
+    request_coalescing: bool = field(
+        default=True, metadata=_env("REQUEST_COALESCING_ENABLED", topology=True)
+    )
+    llm_max_concurrency: int | None = field(
+        default=None, metadata=_env("LLM_MAX_CONCURRENCY", topology=True)
+    )
+    llm_requests_per_second: float | None = field(
+        default=None, metadata=_env("LLM_REQUESTS_PER_SECOND", topology=True)
+    )
+    llm_burst: int | None = field(
+        default=None, metadata=_env("LLM_BURST", topology=True)
+    )
+    embedding_max_concurrency: int | None = field(
+        default=None, metadata=_env("EMBEDDING_MAX_CONCURRENCY", topology=True)
+    )
+    embedding_requests_per_second: float | None = field(
+        default=None, metadata=_env("EMBEDDING_REQUESTS_PER_SECOND", topology=True)
+    )
+    embedding_burst: int | None = field(
+        default=None, metadata=_env("EMBEDDING_BURST", topology=True)
+    )
+
+    @classmethod
+    def from_env(cls) -> "Configuration":
+        """Read the configuration from environment variables, after loading ``.env``."""
+        from dotenv import load_dotenv
+
+        load_dotenv()
+        values = {}
+        for f in fields(cls):
+            raw = os.getenv(f.metadata["env"])
+            if raw is not None:
+                values[f.name] = _parse(raw, _field_types()[f.name])
+        return cls(**values)
+
+    @classmethod
+    def from_runnable_config(
+        cls, config: RunnableConfig | None = None
+    ) -> "Configuration":
+        """Overlay the ``configurable`` values of ``config`` on the defaults."""
+        configurable = (config or {}).get("configurable") or {}
+        types_ = _field_types()
+        overrides = {
+            name: _parse(value, types_[name]) if isinstance(value, str) else value
+            for name, value in configurable.items()
+            if name in types_
+        }
+        base = default_configuration()
+        return replace(base, **overrides) if overrides else base
+
+    def as_configurable(self) -> dict[str, Any]:
+        """Return the non-topology fields as a ``configurable`` dict."""
+        return {
+            f.name: getattr(self, f.name)
+            for f in fields(self)
+            if not f.metadata["topology"]
+        }
+
+    @property
+    def answer_scope(self) -> tuple[Any, ...]:
+        """Return the settings a cached answer depends on.
+
+        Runs that differ in any of them get answers from separate caches: the
+        model, the documents retrieved and reranked, and how much of them reaches
+        the prompt all change the answer.
+        """
+        return (
+            self.chat_model,
+            self.temperature,
+            self.embedding_model,
+            self.collection_name,
+            self.vector_store,
+            self.ann_nprobe,
+            self.retrieval_k,
+            self.retriever,
+            self.rerank,
+            self.rerank_candidates,
+            self.rerank_top_n,
+            self.rerank_model,
+            self.rerank_timeout_ms,
+            self.chunk_refs,
+            self.context_token_budget,
+        )
+
+    @property
+    def chat_model_name(self) -> str:
+        """Return the chat model without its provider prefix."""
+        return self.chat_model.split(":", 1)[-1]
+
+
+@functools.cache
+def _field_types() -> dict[str, Any]:
+    return typing.get_type_hints(Configuration)
+
+
+def _parse(value: str, annotation: Any) -> Any:
+    """Convert an environment or API string to the type of a field."""
+    if typing.get_origin(annotation) in (typing.Union, types.UnionType):
+        if value.strip().lower() in ("", "none", "null"):
+            return None
+        annotation = next(a for a in typing.get_args(annotation) if a is not type(None))
+    if annotation is bool:
+        return value.strip().lower() in ("1", "true", "yes")
+    if annotation in (int, float):
+        return annotation(value)
+    if typing.get_origin(annotation) is Literal:
+        if value not in typing.get_args(annotation):
+            raise ValueError(f"{value!r} is not one of {typing.get_args(annotation)}")
+    return value
+
+
+@functools.cache
+def default_configuration() -> Configuration:
+    """Return the configuration from the environment, read once per process."""
+    return Configuration.from_env()
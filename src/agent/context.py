@@ -0,0 +1,291 @@
+"""Context assembly for the RAG prompt.
+
+Retrieved chunks are 1200 tokens long with 200 tokens of overlap, so neighbouring
+chunks of the same page repeat text and the prompt grows with ``k``. Before the
+prompt is built, :func:`assemble_context`:
+
+1. merges chunks of the same ``source`` that overlap or touch, using
+   ``start_index`` (a character offset into the page) to drop the repeated text,
+2. drops chunks whose word shingles are nearly identical to a better-ranked one,
+3. packs the best-ranked chunks into a token budget, truncating the last one that
+   only partly fits. A merged chunk is cut from its best-ranked part onwards, so
+   the text that ranked it stays in the prompt.
+
+Token counts come from tiktoken. When its encoding cannot be loaded (e.g. offline)
+a four-characters-per-token estimate is used instead.
+"""
+
+import functools
+import logging
+import math
+from collections.abc import Sequence
+from dataclasses import asdict, dataclass
+from typing import Protocol
+
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+RANK_KEY = "retrieval_rank"
+BEST_PART_KEY = "best_part_offset"
+MIN_TRUNCATED_TOKENS = 64
+
+
+class TokenCounter(Protocol):
+    """Counts and truncates text in model tokens."""
+
+    def count(self, text: str) -> int:
+        """Return the number of tokens in ``text``."""
+        ...
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Return the longest prefix of ``text`` within ``max_tokens``."""
+        ...
+
+
+class TiktokenCounter:
+    """Token counter backed by a tiktoken encoding.
+
+    Args:
+        model: Model whose encoding is used
+    """
+
+    def __init__(self, model: str) -> None:
+        """Load the tiktoken encoding of ``model``."""
+        import tiktoken
+
+        self.encoding = tiktoken.encoding_for_model(model)
+
+    def count(self, text: str) -> int:
+        """Return the number of tokens in ``text``."""
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Return the longest prefix of ``text`` within ``max_tokens``."""
+        tokens = self.encoding.encode(text, disallowed_special=())
+        return (
+            text
+            if len(tokens) <= max_tokens
+            else self.encoding.decode(tokens[:max_tokens])
+        )
+
+
+class ApproximateTokenCounter:
+    """Estimates tokens as one per four characters."""
+
+    chars_per_token = 4
+
+    def count(self, text: str) -> int:
+        """Return the estimated number of tokens in ``text``."""
+        return math.ceil(len(text) / self.chars_per_token)
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Return the prefix of ``text`` estimated to fit in ``max_tokens``."""
+        return text[: max_tokens * self.chars_per_token]
+
+
+@functools.lru_cache
+def default_token_counter(model: str = "gpt-4o-mini") -> TokenCounter:
+    """Return a tiktoken counter for ``model``, or an estimate if unavailable."""
+    try:
+        return TiktokenCounter(model)
+    except Exception:
+        logger.warning("tiktoken encoding for %s unavailable; estimating tokens", model)
+        return ApproximateTokenCounter()
+
+
+@dataclass
+class ContextStats:
+    """Size of the context before and after assembly.
+
+    Attributes:
+        documents_before: Retrieved chunks
+        documents_after: Chunks in the prompt after merging, dedup and packing
+        tokens_before: Tokens of the retrieved chunks
+        tokens_after: Tokens of the chunks in the prompt
+        merged: Chunks folded into a neighbour from the same page
+        duplicates: Near-duplicate chunks dropped
+        dropped: Chunks left out because the budget was exhausted
+        truncated: Whether the last packed chunk was cut to fit
+    """
+
+    documents_before: int = 0
+    documents_after: int = 0
+    tokens_before: int = 0
+    tokens_after: int = 0
+    merged: int = 0
+    duplicates: int = 0
+    dropped: int = 0
+    truncated: bool = False
+
+    def as_dict(self) -> dict[str, int]:
+        """Return the statistics as a plain dict."""
+        return {key: int(value) for key, value in asdict(self).items()}
+
+
+def rank_documents(documents: Sequence[Document]) -> list[Document]:
+    """Record each document's retrieval position in its metadata."""
+    for rank, document in enumerate(documents):
+        document.metadata[RANK_KEY] = rank
+    return list(documents)
+
+
+def _rank(document: Document, default: int) -> int:
+    return document.metadata.get(RANK_KEY, default)
+
+
+def _start(document: Document) -> int:
+    return document.metadata.get("start_index", -1)
+
+
+def merge_chunks(
+    documents: Sequence[Document], max_gap: int = 4
+) -> tuple[list[Document], int]:
+    """Merge chunks of the same source that overlap or are at most ``max_gap`` apart.
+
+    A merged document takes the best rank of its chunks, and records where the
+    text of that chunk starts in its content under :data:`BEST_PART_KEY`.
+
+    Returns:
+        tuple: The merged documents, in the order of their first chunk, and the
+            number of chunks folded into another
+    """
+    ranked = [
+        (_rank(document, position), position, document)
+        for position, document in enumerate(documents)
+    ]
+    by_source: dict[str, list[tuple[int, int, Document]]] = {}
+    for item in ranked:
+        by_source.setdefault(item[2].metadata.get("source", ""), []).append(item)
+
+    merged: list[tuple[int, Document]] = []
+    folded = 0
+    for source, items in by_source.items():
+        items.sort(key=lambda item: _start(item[2]))
+        current: tuple[int, int, Document] | None = None
+        for rank, position, document in items:
+            start = _start(document)
+            if current is not None and source and start >= 0:
+                cur_rank, cur_position, cur = current
+                cur_end = _start(cur) + len(cur.page_content)
+                if start - cur_end <= max_gap:
+                    overlap = cur_end - start
+                    offset = start - _start(cur)
+                    if overlap >= len(document.page_content):
+                        content = cur.page_content
+                    elif overlap >= 0:
+                        content = cur.page_content + document.page_content[overlap:]
+                    else:
+                        content = cur.page_content + "\n" + document.page_content
+                        offset = len(cur.page_content) + 1
+                    best_part = (
+                        offset
+                        if rank < cur_rank
+                        else cur.metadata.get(BEST_PART_KEY, 0)
+                    )
+                    metadata = {
+                        **cur.metadata,
+                        RANK_KEY: min(cur_rank, rank),
+                        BEST_PART_KEY: best_part,
+                    }
+                    current = (
+                        min(cur_rank, rank),
+                        min(cur_position, position),
+                        Document(page_content=content, metadata=metadata, id=cur.id),
+                    )
+                    folded += 1
+                    continue
+            if current is not None:
+                merged.append((current[1], current[2]))
+            current = (rank, position, document)
+        if current is not None:
+            merged.append((current[1], current[2]))
+
+    merged.sort(key=lambda item: item[0])
+    return [document for _, document in merged], folded
+
+
+def _shingles(text: str, size: int = 5) -> set[int]:
+    words = text.lower().split()
+    if len(words) <= size:
+        return {hash(" ".join(words))}
+    return {hash(" ".join(words[i : i + size])) for i in range(len(words) - size + 1)}
+
+
+def drop_near_duplicates(
+    documents: Sequence[Document], threshold: float = 0.9
+) -> tuple[list[Document], int]:
+    """Drop documents whose shingle Jaccard similarity to a better one is high.
+
+    Returns:
+        tuple: The remaining documents, in their original order, and the number
+            dropped
+    """
+    order = sorted(range(len(documents)), key=lambda i: _rank(documents[i], i))
+    kept: list[tuple[int, set[int]]] = []
+    for i in order:
+        shingles = _shingles(documents[i].page_content)
+        if any(
+            len(shingles & other) / (len(shingles | other) or 1) >= threshold
+            for _, other in kept
+        ):
+            continue
+        kept.append((i, shingles))
+    indices = sorted(i for i, _ in kept)
+    return [documents[i] for i in indices], len(documents) - len(indices)
+
+
+def assemble_context(
+    documents: Sequence[Document],
+    token_budget: int | None,
+    counter: TokenCounter | None = None,
+    duplicate_threshold: float = 0.9,
+) -> tuple[list[Document], ContextStats]:
+    """Merge, deduplicate and pack ``documents`` into ``token_budget`` tokens.
+
+    Documents keep their relative order; the budget is filled in retrieval rank
+    order (see :func:`rank_documents`), falling back to the given order.
+
+    Args:
+        documents: Retrieved documents
+        token_budget: Maximum tokens of document content, or ``None`` for no limit
+        counter: Token counter, :func:`default_token_counter` by default
+        duplicate_threshold: Shingle similarity above which a chunk is dropped
+    """
+    counter = counter or default_token_counter()
+    stats = ContextStats(
+        documents_before=len(documents),
+        tokens_before=sum(counter.count(d.page_content) for d in documents),
+    )
+    merged, stats.merged = merge_chunks(documents)
+    unique, stats.duplicates = drop_near_duplicates(merged, duplicate_threshold)
+
+    sizes = [counter.count(document.page_content) for document in unique]
+    selected: dict[int, Document] = {}
+    remaining = token_budget
+    for i in sorted(range(len(unique)), key=lambda i: _rank(unique[i], i)):
+        if remaining is None or sizes[i] <= remaining:
+            selected[i] = unique[i]
+            if remaining is not None:
+                remaining -= sizes[i]
+        elif remaining >= MIN_TRUNCATED_TOKENS:
+            document = unique[i]
+            # Keep the best-ranked part of a merged chunk rather than its start
+            best_part = document.metadata.get(BEST_PART_KEY, 0)
+            selected[i] = Document(
+                page_content=counter.truncate(
+                    document.page_content[best_part:], remaining
+                ),
+                metadata={**document.metadata, BEST_PART_KEY: 0}
+                if best_part
+                else document.metadata,
+                id=document.id,
+            )
+            stats.truncated = True
+            remaining = 0
+
+    packed = [selected[i] for i in sorted(selected)]
+    stats.dropped = len(unique) - len(packed)
+    stats.documents_after = len(packed)
+    stats.tokens_after = sum(counter.count(d.page_content) for d in packed)
+    return packed, stats
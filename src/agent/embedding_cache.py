@@ -0,0 +1,259 @@
+"""Persistent cache of text embeddings shared by the indexer and the query path.
+
+:class:`CachedEmbeddings` wraps any :class:`~langchain_core.embeddings.Embeddings`
+and keys each vector by the model name and the SHA-256 of the text. Lookups go to
+a bounded in-memory LRU first, then to an on-disk SQLite store, and only the
+remaining texts are sent to the wrapped model, in one request. Vectors are stored
+as raw float32 bytes, a quarter of the size of a JSON list of the same numbers.
+
+Cached and freshly computed vectors are both rounded to float32, so a text gets
+the same vector whether or not it was cached.
+"""
+
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from agent.resources import DEFAULT_EMBEDDING_CACHE_PATH
+
+
+def text_hash(text: str) -> str:
+    """Return the SHA-256 hex digest of ``text``."""
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+@dataclass
+class EmbeddingCacheStats:
+    """Counters of an embedding cache.
+
+    Attributes:
+        hits: Texts served from memory
+        disk_hits: Texts served from the on-disk store
+        misses: Texts sent to the embedding model
+        bytes_saved: UTF-8 bytes of text that did not have to be sent to the model
+    """
+
+    hits: int = 0
+    disk_hits: int = 0
+    misses: int = 0
+    bytes_saved: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        """Return the fraction of texts served from memory or disk."""
+        total = self.hits + self.disk_hits + self.misses
+        return (self.hits + self.disk_hits) / total if total else 0.0
+
+
+class EmbeddingStore:
+    """SQLite table of float32 vectors keyed by ``(model, text hash)``.
+
+    Args:
+        path: Database file, created if missing
+    """
+
+    def __init__(self, path: str = DEFAULT_EMBEDDING_CACHE_PATH) -> None:
+        """Open or create the store at ``path``."""
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "model TEXT NOT NULL, text_hash TEXT NOT NULL, vector BLOB NOT NULL, "
+                "PRIMARY KEY (model, text_hash)) WITHOUT ROWID"
+            )
+
+    def get_many(self, model: str, hashes: list[str]) -> dict[str, np.ndarray]:
+        """Return the stored vectors among ``hashes`` for ``model``."""
+        found = {}
+        with self._lock:
+            # Stay well below SQLite's limit on bound parameters
+            for i in range(0, len(hashes), 500):
+                batch = hashes[i : i + 500]
+                rows = self._connection.execute(
+                    "SELECT text_hash, vector FROM embeddings WHERE model = ? "
+                    f"AND text_hash IN ({', '.join('?' * len(batch))})",
+                    [model, *batch],
+                )
+                for digest, blob in rows:
+                    found[digest] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def put_many(self, model: str, vectors: dict[str, np.ndarray]) -> None:
+        """Store ``vectors`` by text hash for ``model``."""
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)",
+                [
+                    (model, digest, vector.astype(np.float32).tobytes())
+                    for digest, vector in vectors.items()
+                ],
+            )
+
+    def __len__(self) -> int:
+        """Return the number of stored vectors."""
+        with self._lock:
+            return self._connection.execute(
+                "SELECT COUNT(*) FROM embeddings"
+            ).fetchone()[0]
+
+    @property
+    def size_bytes(self) -> int:
+        """Return the size of the database file in bytes."""
+        return os.path.getsize(self.path)
+
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            self._connection.close()
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings served from an in-memory LRU and an on-disk store when possible.
+
+    Args:
+        wrapped: Embedding model used for texts that are not cached
+        model: Model name, part of the cache key
+        store: On-disk store, or ``None`` to only cache in memory
+        max_entries: Maximum number of vectors kept in memory
+    """
+
+    def __init__(
+        self,
+        wrapped: Embeddings,
+        model: str,
+        store: EmbeddingStore | None = None,
+        max_entries: int = 4096,
+    ) -> None:
+        """Wrap ``wrapped`` with a cache for ``model``."""
+        self.wrapped = wrapped
+        self.model = model
+        self.store = store
+        self.max_entries = max_entries
+        self.stats = EmbeddingCacheStats()
+        self._memory: OrderedDict[str, np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """Return the number of vectors held in memory."""
+        return len(self._memory)
+
+    def summary(self) -> dict[str, float]:
+        """Return the cache size, hit rate and bytes saved."""
+        summary: dict[str, float] = {
+            "memory_entries": len(self),
+            "hits": self.stats.hits,
+            "disk_hits": self.stats.disk_hits,
+            "misses": self.stats.misses,
+            "hit_rate": self.stats.hit_rate,
+            "bytes_saved": self.stats.bytes_saved,
+        }
+        if self.store is not None:
+            summary["disk_entries"] = len(self.store)
+            summary["disk_bytes"] = self.store.size_bytes
+        return summary
+
+    def _from_memory(self, hashes: list[str]) -> dict[str, np.ndarray]:
+        found = {}
+        with self._lock:
+            for digest in hashes:
+                vector = self._memory.get(digest)
+                if vector is not None:
+                    self._memory.move_to_end(digest)
+                    found[digest] = vector
+        return found
+
+    def _remember(self, vectors: dict[str, np.ndarray]) -> None:
+        with self._lock:
+            for digest, vector in vectors.items():
+                self._memory[digest] = vector
+                self._memory.move_to_end(digest)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def _lookup(self, texts: dict[str, str]) -> dict[str, np.ndarray]:
+        """Return cached vectors for ``texts`` (by hash), updating the statistics."""
+        found = self._from_memory(list(texts))
+        memory_hits = len(found)
+        missing = [digest for digest in texts if digest not in found]
+        if missing and self.store is not None:
+            from_disk = self.store.get_many(self.model, missing)
+            self._remember(from_disk)
+            found.update(from_disk)
+        with self._lock:
+            self.stats.hits += memory_hits
+            self.stats.disk_hits += len(found) - memory_hits
+            self.stats.misses += len(texts) - len(found)
+            self.stats.bytes_saved += sum(len(texts[d].encode()) for d in found)
+        return found
+
+    def _save(
+        self, hashes: list[str], vectors: list[list[float]]
+    ) -> dict[str, np.ndarray]:
+        computed = {
+            digest: np.asarray(vector, dtype=np.float32)
+            for digest, vector in zip(hashes, vectors, strict=True)
+        }
+        self._remember(computed)
+        if self.store is not None:
+            self.store.put_many(self.model, computed)
+        return computed
+
+    @staticmethod
+    def _unique(texts: list[str]) -> dict[str, str]:
+        return {text_hash(text): text for text in texts}
+
+    @staticmethod
+    def _ordered(texts: list[str], vectors: dict[str, np.ndarray]) -> list[list[float]]:
+        return [vectors[text_hash(text)].tolist() for text in texts]
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        """Embed ``texts``, sending only uncached ones to the wrapped model."""
+        unique = self._unique(texts)
+        vectors = self._lookup(unique)
+        missing = [digest for digest in unique if digest not in vectors]
+        if missing:
+            computed = self.wrapped.embed_documents([unique[d] for d in missing])
+            vectors.update(self._save(missing, computed))
+        return self._ordered(texts, vectors)
+
+    def embed_query(self, text: str) -> list[float]:
+        """Embed a query, using the cache when possible."""
+        digest = text_hash(text)
+        vectors = self._lookup({digest: text})
+        if digest not in vectors:
+            vectors.update(self._save([digest], [self.wrapped.embed_query(text)]))
+        return vectors[digest].tolist()
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        """Async variant of :meth:`embed_documents`."""
+        unique = self._unique(texts)
+        vectors = await asyncio.to_thread(self._lookup, unique)
+        missing = [digest for digest in unique if digest not in vectors]
+        if missing:
+            computed = await self.wrapped.aembed_documents([unique[d] for d in missing])
+            vectors.update(await asyncio.to_thread(self._save, missing, computed))
+        return self._ordered(texts, vectors)
+
+    async def aembed_query(self, text: str) -> list[float]:
+        """Async variant of :meth:`embed_query`."""
+        digest = text_hash(text)
+        if self.store is None or digest in self._memory:
+            vectors = self._lookup({digest: text})
+        else:
+            vectors = await asyncio.to_thread(self._lookup, {digest: text})
+        if digest not in vectors:
+            computed = await self.wrapped.aembed_query(text)
+            vectors.update(await asyncio.to_thread(self._save, [digest], [computed]))
+        return vectors[digest].tolist()
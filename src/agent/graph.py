@@ -2,23 +2,130 @@
 
 This module defines the main workflow for a Retrieval-Augmented Generation (RAG) agent
 that retrieves relevant documents from a vector store and generates responses using LLM.
+
+Graphs are built by :func:`build_graph` from a typed
+:class:`~agent.configuration.Configuration`. Nodes read their settings (models,
+retrieval depth, retriever type, cache and rerank parameters) from the run's
+``configurable`` dict, so they can be overridden per run::
+
+    graph.invoke(inputs, {"configurable": {"retrieval_k": 5, "retriever": "dense"}})
+
+Importing this module neither reads ``.env`` nor compiles anything: the
+module-level ``graph`` and ``speculative_graph`` are built on first access.
+
+Every node has a sync and a native async implementation. The graph runs the async
+one under ``ainvoke``/``astream``, so the LangGraph server can keep many
+conversations in flight on its event loop instead of parking each one on a worker
+thread, while ``invoke`` keeps using the sync one.
+
+Each turn starts with ``condense_question``: a follow-up such as "and what about
+its pricing?" is rewritten into a standalone question from the recent history and
+the thread summary (see ``agent.history``), and every later node works on that
+question. Rewrites are memoised. Each turn ends with ``manage_history``, which
+keeps a checkpointed thread to ``history_max_messages`` messages by removing the
+oldest ones and folding them into the summary, so checkpoints stay the same size
+however long the thread runs.
+
+Routing first asks a local tier (AWS keyword matcher, then a nearest-centroid
+classifier over question embeddings) and only calls the LLM router when that tier
+is unsure. Set ``LOCAL_ROUTER_ENABLED=false`` to always use the LLM.
+
+An optional answer cache (``ANSWER_CACHE_ENABLED=true``) sits in front of the
+router. A hit returns the stored answer and documents straight away; otherwise the
+finished answer is stored once one of the answer nodes completes.
+
+The opt-in speculative variant (``SPECULATIVE_RETRIEVAL_ENABLED=true``, or
+``speculative_graph``) starts embedding the question and searching Chroma while the
+router is still deciding. AWS questions then go straight to generation with the
+prefetched documents; for direct responses the prefetch is cancelled and discarded.
+
+With ``CHUNK_REFS_ENABLED=true`` the state keeps compact chunk references (see
+``agent.chunks``) instead of full documents, and the rerank and generation nodes
+load the text from the local Chroma store, which keeps checkpoints small.
+
+Retrieval is hybrid when the indexer has built a BM25 index next to the Chroma
+data: the lexical and the dense search run in parallel and their rankings are
+merged with reciprocal-rank fusion, so exact tokens such as instance types or IAM
+actions are found even when the embedding misses them. Set
+``RETRIEVER=dense`` for dense-only retrieval.
+
+Before the RAG prompt is built, the retrieved chunks go through context assembly
+(``agent.context``): overlapping chunks of the same page are merged, near-duplicates
+are dropped and the rest is packed into ``CONTEXT_TOKEN_BUDGET`` tokens. The token
+counts before and after are recorded in ``context_stats``.
+
+With ``RERANK_ENABLED=true`` retrieval fetches ``RERANK_CANDIDATES`` chunks and a
+``rerank_documents`` node keeps the ``RERANK_TOP_N`` most relevant ones (see
+``agent.rerank``). Scoring is bounded by ``RERANK_TIMEOUT_MS``; past that the
+retrieval order is kept.
+
+Every node is instrumented (``agent.metrics``): its wall time, the time of the
+embedding, search, rerank and context assembly steps inside it, the number of
+retrieved documents, the context size and the LLM token usage and cost are
+aggregated as histograms. Set ``METRICS_EXPORTER`` to ``prometheus`` or
+``openmetrics`` to serve them on ``METRICS_PORT``, or to ``log`` to log them.
+
+The answer nodes stream their completion, so ``graph.astream(...,
+stream_mode="messages")`` delivers tokens as the model produces them. The routing
+call is tagged ``nostream`` to keep its structured output out of that stream.
 """
 
-from typing import Literal, cast
+import asyncio
+import functools
+import inspect
+import logging
+import time
+from collections.abc import AsyncIterator, Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from typing import TYPE_CHECKING, Any, Literal, cast
 
-from dotenv import load_dotenv
-from langchain.chat_models import init_chat_model
-from langchain_chroma import Chroma
 from langchain_core.documents import Document
-from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
-from langchain_openai import OpenAIEmbeddings
+from langchain_core.messages import (
+    AIMessage,
+    BaseMessage,
+    BaseMessageChunk,
+    HumanMessage,
+    RemoveMessage,
+    SystemMessage,
+    message_chunk_to_message,
+)
+from langchain_core.runnables import RunnableConfig, RunnableLambda
+from langgraph.constants import TAG_NOSTREAM
 from langgraph.graph import END, START, StateGraph
+from langgraph.graph.state import CompiledStateGraph
+from langgraph.types import Checkpointer
 from pydantic import BaseModel
 
-from agent.prompts import DIRECT_RESPONSE_PROMPT, RAG_PROMPT, ROUTING_PROMPT
+from agent.chunks import load_chunks, to_refs
+from agent.configuration import Configuration, default_configuration
+from agent.context import RANK_KEY, assemble_context, rank_documents
+from agent.history import format_history, is_follow_up, recent_history, split_history
+from agent.metrics import (
+    instrument_node,
+    record_context,
+    record_documents,
+    record_history,
+    record_llm_usage,
+    record_rewrite,
+    record_route,
+    start_exporter,
+    timed,
+)
+from agent.prompts import (
+    CONDENSE_PROMPT,
+    DIRECT_RESPONSE_PROMPT,
+    RAG_PROMPT,
+    ROUTING_PROMPT,
+    SUMMARY_PROMPT,
+)
+from agent.resources import get_registry
 from agent.state import AgentState
 
-load_dotenv()
+if TYPE_CHECKING:
+    from agent.answer_cache import AnswerCache, CachedAnswer
+
+logger = logging.getLogger(__name__)
 
 
 class RoutingResponse(BaseModel):
@@ -27,56 +134,28 @@ class RoutingResponse(BaseModel):
     decision: Literal["aws_docs", "direct_response"]
 
 
-def route_question(state: AgentState) -> dict[str, str]:
-    """Route the user's question to determine if it needs RAG or direct response.
-
-    Args:
-        state: Current agent state containing messages
+def _question(state: AgentState) -> str:
+    """Return the standalone form of the latest question."""
+    if state.question is not None:
+        return state.question
+    return next(
+        str(message.content)
+        for message in reversed(state.messages)
+        if isinstance(message, HumanMessage)
+    )
 
-    Returns:
-        dict: Updated state with routing decision
-    """
-    question = state.messages[-1].content
 
+def _routing_messages(question: str) -> list[BaseMessage]:
     routing_prompt_formatted = ROUTING_PROMPT.format(question=question)
-    messages = [
+    return [
         SystemMessage(content=routing_prompt_formatted),
         HumanMessage(content=question),
     ]
 
-    llm = init_chat_model(
-        model="openai:gpt-4o-mini",
-        temperature=0,
-    ).with_structured_output(RoutingResponse)
-
-    response = cast(RoutingResponse, llm.invoke(messages))
-
-    return {"route_decision": response.decision}
-
-
-def retrieve_documents(state: AgentState) -> dict[str, list[Document]]:
-    """Retrieve relevant documents from vector store based on the user's question.
-
-    Args:
-        state: Current agent state containing messages and documents
-
-    Returns:
-        dict: Updated state with retrieved documents sorted by start_index
-    """
-    question = state.messages[-1].content
-
-    embedding_model = OpenAIEmbeddings(model="text-embedding-3-small")
-    vector_store = Chroma(
-        collection_name="rag-chroma",
-        embedding_function=embedding_model,
-        persist_directory="./data/chromadb",
-    )
-
-    retriever = vector_store.as_retriever()
-    documents = retriever.invoke(str(question), k=10)
 
+def _sort_documents(documents: list[Document]) -> list[Document]:
     # Sort documents by start_index (ascending), with start_index=-1 at the end
-    sorted_documents = sorted(
+    return sorted(
         documents,
         key=lambda doc: (
             doc.metadata.get("start_index", -1) == -1,
@@ -84,21 +163,8 @@ def retrieve_documents(state: AgentState) -> dict[str, list[Document]]:
         ),
     )
 
-    return {"documents": sorted_documents}
-
-
-def generate_response(state: AgentState) -> dict[str, list[BaseMessage]]:
-    """Generate a response using LLM based on retrieved documents and user question.
-
-    Args:
-        state: Current agent state containing messages and documents
-
-    Returns:
-        dict: Updated state with LLM response message
-    """
-    question = state.messages[-1].content
-    documents = state.documents
 
+def _rag_messages(question: str, documents: list[Document] | None) -> list[BaseMessage]:
     if documents:
         formatted_docs_list = []
         unique_sources = {}  # Track unique sources: {url: title}
@@ -129,42 +195,734 @@ def generate_response(state: AgentState) -> dict[str, list[BaseMessage]]:
         formatted_docs = ""
 
     rag_prompt_formatted = RAG_PROMPT.format(context=formatted_docs, question=question)
-    messages = [
+    return [
         SystemMessage(content=rag_prompt_formatted),
         HumanMessage(content=question),
     ]
 
-    llm = init_chat_model(
-        model="openai:gpt-4o-mini",
-        temperature=0,
+
+def _direct_messages(question: str) -> list[BaseMessage]:
+    direct_prompt_formatted = DIRECT_RESPONSE_PROMPT.format(question=question)
+    return [
+        SystemMessage(content=direct_prompt_formatted),
+        HumanMessage(content=question),
+    ]
+
+
+def _join_chunks(chunks: Iterator[BaseMessageChunk]) -> BaseMessage:
+    response: BaseMessageChunk | None = None
+    for chunk in chunks:
+        response = chunk if response is None else response + chunk
+    if response is None:
+        raise ValueError("Chat model stream produced no chunks")
+    return message_chunk_to_message(response)
+
+
+async def _ajoin_chunks(chunks: AsyncIterator[BaseMessageChunk]) -> BaseMessage:
+    response: BaseMessageChunk | None = None
+    async for chunk in chunks:
+        response = chunk if response is None else response + chunk
+    if response is None:
+        raise ValueError("Chat model stream produced no chunks")
+    return message_chunk_to_message(response)
+
+
+def _condense_messages(
+    state: AgentState, question: str, configuration: Configuration
+) -> list[BaseMessage]:
+    history = recent_history(state.messages, configuration.condense_history_messages)
+    condense_prompt_formatted = CONDENSE_PROMPT.format(
+        summary=state.summary or "(none)", history=format_history(history)
     )
-    response = llm.invoke(messages)
+    return [
+        SystemMessage(content=condense_prompt_formatted),
+        HumanMessage(content=question),
+    ]
+
+
+def _rewrite_key(
+    state: AgentState, question: str, configuration: Configuration
+) -> str | None:
+    """Return the rewrite cache key, or ``None`` when no rewrite is needed."""
+    if not configuration.condense_questions:
+        return None
+    if not is_follow_up(state.messages, state.summary):
+        return None
+    history = recent_history(state.messages, configuration.condense_history_messages)
+    return (
+        get_registry()
+        .get_rewrite_cache(configuration.rewrite_cache_max_size)
+        .key(configuration.chat_model, state.summary, format_history(history), question)
+    )
+
+
+def _turn_update(standalone: str) -> dict:
+    # Documents and statistics of the previous turn don't belong to this one
+    return {
+        "question": standalone,
+        "documents": None,
+        "chunk_refs": None,
+        "context_stats": None,
+        "cache_hit": False,
+    }
+
+
+def condense_question(state: AgentState, config: RunnableConfig) -> dict:
+    """Rewrite a follow-up question into a standalone question.
+
+    The first question of a thread is used as it is. Rewrites are memoised by
+    question, recent history and summary.
+
+    Args:
+        state: Current agent state containing messages and the history summary
+        config: Runnable config of the node run, carrying the configuration
+
+    Returns:
+        dict: Updated state with the standalone question and the previous turn's
+            documents cleared
+    """
+    question = str(state.messages[-1].content)
+    configuration = Configuration.from_runnable_config(config)
+
+    key = _rewrite_key(state, question, configuration)
+    if key is None:
+        record_rewrite("skipped")
+        return _turn_update(question)
+    cache = get_registry().get_rewrite_cache(configuration.rewrite_cache_max_size)
+    if (standalone := cache.get(key)) is not None:
+        record_rewrite("cached")
+        return _turn_update(standalone)
+
+    llm = get_registry().get_chat_model(
+        configuration.chat_model, configuration.temperature
+    )
+    response = llm.invoke(
+        _condense_messages(state, question, configuration), {"tags": [TAG_NOSTREAM]}
+    )
+    record_llm_usage("condense_question", configuration.chat_model, response)
+    standalone = str(response.content).strip() or question
+    cache.put(key, standalone)
+    record_rewrite("rewritten")
+
+    return _turn_update(standalone)
+
+
+async def acondense_question(state: AgentState, config: RunnableConfig) -> dict:
+    """Async variant of :func:`condense_question`."""
+    question = str(state.messages[-1].content)
+    configuration = Configuration.from_runnable_config(config)
+
+    key = _rewrite_key(state, question, configuration)
+    if key is None:
+        record_rewrite("skipped")
+        return _turn_update(question)
+    cache = get_registry().get_rewrite_cache(configuration.rewrite_cache_max_size)
+    if (standalone := cache.get(key)) is not None:
+        record_rewrite("cached")
+        return _turn_update(standalone)
+
+    llm = await get_registry().aget_chat_model(
+        configuration.chat_model, configuration.temperature
+    )
+    response = await llm.ainvoke(
+        _condense_messages(state, question, configuration), {"tags": [TAG_NOSTREAM]}
+    )
+    record_llm_usage("condense_question", configuration.chat_model, response)
+    standalone = str(response.content).strip() or question
+    cache.put(key, standalone)
+    record_rewrite("rewritten")
+
+    return _turn_update(standalone)
+
+
+def _summary_messages(
+    state: AgentState, removed: list[BaseMessage]
+) -> list[BaseMessage]:
+    summary_prompt_formatted = SUMMARY_PROMPT.format(
+        summary=state.summary or "(none)", history=format_history(removed)
+    )
+    return [HumanMessage(content=summary_prompt_formatted)]
+
+
+def _trim_update(
+    removed: list[BaseMessage], kept: list[BaseMessage], summary: str | None
+) -> dict:
+    record_history(len(kept), len(removed))
+    if not removed:
+        return {}
+    update: dict[str, Any] = {
+        "messages": [RemoveMessage(id=cast(str, message.id)) for message in removed]
+    }
+    if summary is not None:
+        update["summary"] = summary
+    return update
+
+
+def manage_history(state: AgentState, config: RunnableConfig) -> dict:
+    """Trim the thread to ``history_max_messages``, summarising what is removed.
+
+    Args:
+        state: Current agent state containing messages and the history summary
+        config: Runnable config of the node run, carrying the configuration
+
+    Returns:
+        dict: Removals of the trimmed messages and the new summary, or an empty
+            update while the thread fits the window
+    """
+    configuration = Configuration.from_runnable_config(config)
+    removed, kept = split_history(state.messages, configuration.history_max_messages)
+
+    summary = None
+    if removed and configuration.history_summary:
+        llm = get_registry().get_chat_model(
+            configuration.chat_model, configuration.temperature
+        )
+        response = llm.invoke(
+            _summary_messages(state, removed), {"tags": [TAG_NOSTREAM]}
+        )
+        record_llm_usage("manage_history", configuration.chat_model, response)
+        summary = str(response.content).strip()
+
+    return _trim_update(removed, kept, summary)
+
+
+async def amanage_history(state: AgentState, config: RunnableConfig) -> dict:
+    """Async variant of :func:`manage_history`."""
+    configuration = Configuration.from_runnable_config(config)
+    removed, kept = split_history(state.messages, configuration.history_max_messages)
+
+    summary = None
+    if removed and configuration.history_summary:
+        llm = await get_registry().aget_chat_model(
+            configuration.chat_model, configuration.temperature
+        )
+        response = await llm.ainvoke(
+            _summary_messages(state, removed), {"tags": [TAG_NOSTREAM]}
+        )
+        record_llm_usage("manage_history", configuration.chat_model, response)
+        summary = str(response.content).strip()
+
+    return _trim_update(removed, kept, summary)
+
+
+def _answer_cache(configuration: Configuration) -> "AnswerCache":
+    return get_registry().get_answer_cache(
+        max_size=configuration.answer_cache_max_size,
+        ttl=configuration.answer_cache_ttl_seconds,
+        similarity_threshold=configuration.answer_cache_similarity_threshold,
+        persist_directory=configuration.persist_directory,
+        scope=configuration.answer_scope,
+    )
+
+
+def _cache_hit_update(cached: "CachedAnswer | None") -> dict:
+    if cached is None:
+        return {"cache_hit": False}
+    return {
+        "messages": [AIMessage(content=cached.answer)],
+        "documents": cached.documents,
+        "chunk_refs": cached.chunk_refs,
+        "route_decision": cached.route_decision,
+        "cache_hit": True,
+    }
+
+
+def _cached_answer(state: AgentState) -> "CachedAnswer":
+    from agent.answer_cache import CachedAnswer
+
+    rag = state.route_decision == "aws_docs"
+    return CachedAnswer(
+        answer=str(state.messages[-1].content),
+        route_decision=cast(str, state.route_decision),
+        documents=state.documents if rag else None,
+        chunk_refs=state.chunk_refs if rag else None,
+    )
+
+
+def check_answer_cache(state: AgentState, config: RunnableConfig) -> dict:
+    """Look up the user's question in the answer cache.
+
+    Args:
+        state: Current agent state containing messages
+        config: Runnable config of the node run, carrying the configuration
+
+    Returns:
+        dict: Updated state with the cached answer, documents and routing decision
+            on a hit, or only ``cache_hit=False`` on a miss
+    """
+    question = _question(state)
+    configuration = Configuration.from_runnable_config(config)
+
+    cache = _answer_cache(configuration)
+    embedding = None
+    if cache.uses_embeddings:
+        embeddings = get_registry().get_embeddings(configuration.embedding_model)
+        embedding = embeddings.embed_query(question)
+
+    return _cache_hit_update(cache.lookup(question, embedding))
+
+
+async def acheck_answer_cache(state: AgentState, config: RunnableConfig) -> dict:
+    """Async variant of :func:`check_answer_cache`."""
+    question = _question(state)
+    configuration = Configuration.from_runnable_config(config)
+
+    cache = _answer_cache(configuration)
+    embedding = None
+    if cache.uses_embeddings:
+        embeddings = await get_registry().aget_embeddings(configuration.embedding_model)
+        embedding = await embeddings.aembed_query(question)
+
+    return _cache_hit_update(cache.lookup(question, embedding))
+
+
+def store_answer(state: AgentState, config: RunnableConfig) -> dict:
+    """Store the answer just generated in the answer cache.
+
+    Args:
+        state: Current agent state with the standalone question and its answer
+        config: Runnable config of the node run, carrying the configuration
+
+    Returns:
+        dict: Empty update, the state is left unchanged
+    """
+    question = _question(state)
+    configuration = Configuration.from_runnable_config(config)
+
+    cache = _answer_cache(configuration)
+    embedding = None
+    if cache.uses_embeddings:
+        embeddings = get_registry().get_embeddings(configuration.embedding_model)
+        embedding = embeddings.embed_query(question)
+
+    cache.store(question, _cached_answer(state), embedding)
+    return {}
+
+
+async def astore_answer(state: AgentState, config: RunnableConfig) -> dict:
+    """Async variant of :func:`store_answer`."""
+    question = _question(state)
+    configuration = Configuration.from_runnable_config(config)
+
+    cache = _answer_cache(configuration)
+    embedding = None
+    if cache.uses_embeddings:
+        embeddings = await get_registry().aget_embeddings(configuration.embedding_model)
+        embedding = await embeddings.aembed_query(question)
+
+    cache.store(question, _cached_answer(state), embedding)
+    return {}
+
+
+def _local_router(configuration: Configuration) -> Any:
+    return get_registry().get_local_router(
+        configuration.embedding_model, configuration.local_router_min_margin
+    )
+
+
+def _record_route(
+    configuration: Configuration, tier: str, decision: str, start: float
+) -> None:
+    elapsed = time.perf_counter() - start
+    record_route(tier, decision, elapsed)
+    if configuration.local_router:
+        _local_router(configuration).stats.record(tier, elapsed)
+    logger.debug("Routed to %s by %s in %.1fms", decision, tier, elapsed * 1000)
+
+
+def route_question(state: AgentState, config: RunnableConfig) -> dict[str, str]:
+    """Route the user's question to determine if it needs RAG or direct response.
+
+    Args:
+        state: Current agent state containing messages
+        config: Runnable config of the node run, carrying the configuration
+
+    Returns:
+        dict: Updated state with routing decision
+    """
+    question = _question(state)
+    configuration = Configuration.from_runnable_config(config)
+    start = time.perf_counter()
+
+    if configuration.local_router:
+        decision, tier = _local_router(configuration).route(question)
+        if decision is not None:
+            _record_route(configuration, tier, decision, start)
+            return {"route_decision": decision}
+
+    llm = get_registry().get_structured_model(
+        RoutingResponse, configuration.chat_model, configuration.temperature
+    )
+    response = cast(
+        RoutingResponse,
+        llm.invoke(_routing_messages(question), {"tags": [TAG_NOSTREAM]}),
+    )
+    _record_route(configuration, "llm", response.decision, start)
+
+    return {"route_decision": response.decision}
 
-    return {"messages": [response]}
 
+async def aroute_question(state: AgentState, config: RunnableConfig) -> dict[str, str]:
+    """Async variant of :func:`route_question`."""
+    question = _question(state)
+    configuration = Configuration.from_runnable_config(config)
+    start = time.perf_counter()
 
-def direct_response(state: AgentState) -> dict[str, list[BaseMessage]]:
+    if configuration.local_router:
+        decision, tier = await _local_router(configuration).aroute(question)
+        if decision is not None:
+            _record_route(configuration, tier, decision, start)
+            return {"route_decision": decision}
+
+    llm = await get_registry().aget_structured_model(
+        RoutingResponse, configuration.chat_model, configuration.temperature
+    )
+    response = cast(
+        RoutingResponse,
+        await llm.ainvoke(_routing_messages(question), {"tags": [TAG_NOSTREAM]}),
+    )
+    _record_route(configuration, "llm", response.decision, start)
+
+    return {"route_decision": response.decision}
+
+
+def _retrieval_k(configuration: Configuration, rerank: bool) -> int:
+    return configuration.rerank_candidates if rerank else configuration.retrieval_k
+
+
+def _vector_store(configuration: Configuration) -> Any:
+    return get_registry().get_vector_store(
+        configuration.collection_name,
+        configuration.persist_directory,
+        configuration.embedding_model,
+        configuration.vector_store,
+        configuration.ann_nprobe,
+    )
+
+
+def _lexical_search(
+    question: str, k: int, configuration: Configuration
+) -> list[tuple[str, float]] | None:
+    """Search the BM25 index, or return ``None`` for the dense retriever."""
+    if configuration.retriever != "hybrid":
+        return None
+    index = get_registry().get_lexical_index(configuration.persist_directory).get()
+    if index is None:
+        return None
+    with timed("lexical_search"):
+        return index.search(question, k=k)
+
+
+def _documents_update(documents: list[Document], configuration: Configuration) -> dict:
+    """Return the state update storing ``documents`` or references to them."""
+    documents = _sort_documents(documents)
+    if configuration.chunk_refs and (refs := to_refs(documents)) is not None:
+        return {"documents": None, "chunk_refs": refs}
+    return {"documents": documents, "chunk_refs": None}
+
+
+def _state_documents(
+    state: AgentState, configuration: Configuration
+) -> list[Document] | None:
+    """Return the retrieved documents, loading them when only referenced."""
+    if state.chunk_refs is None:
+        return state.documents
+    with timed("load_chunks"):
+        return load_chunks(_vector_store(configuration), state.chunk_refs)
+
+
+_search_executor = ThreadPoolExecutor(thread_name_prefix="agent-lexical")
+
+
+def retrieve_documents(
+    state: AgentState, config: RunnableConfig, rerank: bool = False
+) -> dict:
+    """Retrieve relevant documents from vector store based on the user's question.
+
+    Args:
+        state: Current agent state containing messages and documents
+        config: Runnable config of the node run, carrying the configuration
+        rerank: Whether a rerank node follows, so ``rerank_candidates`` documents
+            are retrieved instead of ``retrieval_k``
+
+    Returns:
+        dict: Updated state with retrieved documents, or references to them,
+            sorted by start_index
+    """
+    from agent.lexical import fuse_results
+
+    question = _question(state)
+    configuration = Configuration.from_runnable_config(config)
+    k = _retrieval_k(configuration, rerank)
+
+    embeddings = get_registry().get_embeddings(configuration.embedding_model)
+    vector_store = _vector_store(configuration)
+    lexical = _search_executor.submit(_lexical_search, question, k, configuration)
+
+    with timed("embed_query"):
+        query_embedding = embeddings.embed_query(question)
+    with timed("vector_search"):
+        documents = vector_store.similarity_search_by_vector(query_embedding, k=k)
+
+    if (lexical_hits := lexical.result()) is not None:
+        with timed("fusion"):
+            documents = fuse_results(vector_store, documents, lexical_hits, k)
+
+    record_documents("retrieve_documents", len(documents))
+    return _documents_update(rank_documents(documents), configuration)
+
+
+async def aretrieve_documents(
+    state: AgentState, config: RunnableConfig, rerank: bool = False
+) -> dict:
+    """Async variant of :func:`retrieve_documents`.
+
+    The question is embedded with the embedding client's native async API. The
+    Chroma and BM25 searches are local CPU and SQLite work, so they run in worker
+    threads.
+    """
+    from agent.lexical import fuse_results
+
+    question = _question(state)
+    configuration = Configuration.from_runnable_config(config)
+    k = _retrieval_k(configuration, rerank)
+
+    registry = get_registry()
+    embeddings = await registry.aget_embeddings(configuration.embedding_model)
+    vector_store = await registry.aget_vector_store(
+        configuration.collection_name,
+        configuration.persist_directory,
+        configuration.embedding_model,
+        configuration.vector_store,
+        configuration.ann_nprobe,
+    )
+
+    async def dense_search() -> list[Document]:
+        with timed("embed_query"):
+            query_embedding = await embeddings.aembed_query(question)
+        with timed("vector_search"):
+            return await asyncio.to_thread(
+                vector_store.similarity_search_by_vector, query_embedding, k=k
+            )
+
+    documents, lexical_hits = await asyncio.gather(
+        dense_search(), asyncio.to_thread(_lexical_search, question, k, configuration)
+    )
+    if lexical_hits is not None:
+        with timed("fusion"):
+            documents = await asyncio.to_thread(
+                fuse_results, vector_store, documents, lexical_hits, k
+            )
+
+    record_documents("retrieve_documents", len(documents))
+    return _documents_update(rank_documents(documents), configuration)
+
+
+_prefetch_executor = ThreadPoolExecutor(thread_name_prefix="agent-prefetch")
+
+
+def route_and_retrieve(
+    state: AgentState, config: RunnableConfig, rerank: bool = False
+) -> dict:
+    """Route the question while speculatively retrieving documents for it.
+
+    Args:
+        state: Current agent state containing messages
+        config: Runnable config of the node run, carrying the configuration
+        rerank: Whether a rerank node follows (see :func:`retrieve_documents`)
+
+    Returns:
+        dict: Updated state with the routing decision, plus the retrieved documents
+            when the question was routed to ``aws_docs``
+    """
+    prefetch = _prefetch_executor.submit(retrieve_documents, state, config, rerank)
+    update: dict = route_question(state, config)
+    if update["route_decision"] == "aws_docs":
+        return {**update, **prefetch.result()}
+    prefetch.cancel()
+    return update
+
+
+def _discard(task: asyncio.Task) -> None:
+    task.cancel()
+    # Consume the outcome so a prefetch that already failed isn't reported as an
+    # unretrieved task exception.
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+
+async def aroute_and_retrieve(
+    state: AgentState, config: RunnableConfig, rerank: bool = False
+) -> dict:
+    """Async variant of :func:`route_and_retrieve`."""
+    prefetch = asyncio.create_task(aretrieve_documents(state, config, rerank))
+    try:
+        update: dict = await aroute_question(state, config)
+    except BaseException:
+        _discard(prefetch)
+        raise
+    if update["route_decision"] == "aws_docs":
+        return {**update, **await prefetch}
+    _discard(prefetch)
+    return update
+
+
+def _retrieval_order(documents: list[Document] | None) -> list[Document]:
+    # Documents are kept sorted by start_index; the rank records retrieval order
+    documents = documents or []
+    return sorted(documents, key=lambda doc: doc.metadata.get(RANK_KEY, len(documents)))
+
+
+def rerank_documents(state: AgentState, config: RunnableConfig) -> dict:
+    """Keep the ``rerank_top_n`` retrieved documents most relevant to the question.
+
+    Args:
+        state: Current agent state containing messages and retrieved candidates
+        config: Runnable config of the node run, carrying the configuration
+
+    Returns:
+        dict: Updated state with the kept documents, or references to them, sorted
+            by start_index
+    """
+    question = _question(state)
+    configuration = Configuration.from_runnable_config(config)
+
+    reranker = get_registry().get_reranker(
+        configuration.rerank_model, configuration.rerank_timeout_ms / 1000
+    )
+    with timed("rerank"):
+        documents = reranker.rerank(
+            question,
+            _retrieval_order(_state_documents(state, configuration)),
+            configuration.rerank_top_n,
+        )
+
+    record_documents("rerank_documents", len(documents))
+    return _documents_update(rank_documents(documents), configuration)
+
+
+async def arerank_documents(state: AgentState, config: RunnableConfig) -> dict:
+    """Async variant of :func:`rerank_documents`."""
+    question = _question(state)
+    configuration = Configuration.from_runnable_config(config)
+
+    reranker = await get_registry().aget_reranker(
+        configuration.rerank_model, configuration.rerank_timeout_ms / 1000
+    )
+    candidates = await asyncio.to_thread(_state_documents, state, configuration)
+    with timed("rerank"):
+        documents = await reranker.arerank(
+            question, _retrieval_order(candidates), configuration.rerank_top_n
+        )
+
+    record_documents("rerank_documents", len(documents))
+    return _documents_update(rank_documents(documents), configuration)
+
+
+def _assemble_context(
+    documents: list[Document] | None, configuration: Configuration
+) -> tuple[list[Document] | None, dict[str, int] | None]:
+    if not documents:
+        return documents, None
+    with timed("context_assembly"):
+        packed, stats = assemble_context(
+            documents,
+            configuration.context_token_budget or None,
+            get_registry().get_token_counter(configuration.chat_model_name),
+        )
+    record_context(stats.tokens_before, stats.tokens_after)
+    logger.info(
+        "Context assembled: %d -> %d chunks, %d -> %d tokens",
+        stats.documents_before,
+        stats.documents_after,
+        stats.tokens_before,
+        stats.tokens_after,
+    )
+    return packed, stats.as_dict()
+
+
+def generate_response(state: AgentState, config: RunnableConfig) -> dict:
+    """Generate a response using LLM based on retrieved documents and user question.
+
+    Args:
+        state: Current agent state containing messages and documents
+        config: Runnable config of the node run, carrying the configuration and
+            forwarded so streamed tokens reach the graph's stream
+
+    Returns:
+        dict: Updated state with LLM response message and context statistics
+    """
+    question = _question(state)
+    configuration = Configuration.from_runnable_config(config)
+
+    documents, context_stats = _assemble_context(
+        _state_documents(state, configuration), configuration
+    )
+    llm = get_registry().get_chat_model(
+        configuration.chat_model, configuration.temperature
+    )
+    response = _join_chunks(llm.stream(_rag_messages(question, documents), config))
+    record_llm_usage("generate_response", configuration.chat_model, response)
+
+    return {"messages": [response], "context_stats": context_stats}
+
+
+async def agenerate_response(state: AgentState, config: RunnableConfig) -> dict:
+    """Async variant of :func:`generate_response`."""
+    question = _question(state)
+    configuration = Configuration.from_runnable_config(config)
+
+    documents = await asyncio.to_thread(_state_documents, state, configuration)
+    documents, context_stats = await asyncio.to_thread(
+        _assemble_context, documents, configuration
+    )
+    llm = await get_registry().aget_chat_model(
+        configuration.chat_model, configuration.temperature
+    )
+    response = await _ajoin_chunks(
+        llm.astream(_rag_messages(question, documents), config)
+    )
+    record_llm_usage("generate_response", configuration.chat_model, response)
+
+    return {"messages": [response], "context_stats": context_stats}
+
+
+def direct_response(
+    state: AgentState, config: RunnableConfig
+) -> dict[str, list[BaseMessage]]:
     """Generate a direct response for non-AWS questions without RAG.
 
     Args:
         state: Current agent state containing messages
+        config: Runnable config of the node run, carrying the configuration and
+            forwarded so streamed tokens reach the graph's stream
 
     Returns:
         dict: Updated state with LLM response message
     """
-    question = state.messages[-1].content
+    question = _question(state)
+    configuration = Configuration.from_runnable_config(config)
 
-    direct_prompt_formatted = DIRECT_RESPONSE_PROMPT.format(question=question)
-    messages = [
-        SystemMessage(content=direct_prompt_formatted),
-        HumanMessage(content=question),
-    ]
+    llm = get_registry().get_chat_model(
+        configuration.chat_model, configuration.temperature
+    )
+    response = _join_chunks(llm.stream(_direct_messages(question), config))
+    record_llm_usage("direct_response", configuration.chat_model, response)
 
-    llm = init_chat_model(
-        model="openai:gpt-4o-mini",
-        temperature=0,
+    return {"messages": [response]}
+
+
+async def adirect_response(
+    state: AgentState, config: RunnableConfig
+) -> dict[str, list[BaseMessage]]:
+    """Async variant of :func:`direct_response`."""
+    question = _question(state)
+    configuration = Configuration.from_runnable_config(config)
+
+    llm = await get_registry().aget_chat_model(
+        configuration.chat_model, configuration.temperature
     )
-    response = llm.invoke(messages)
+    response = await _ajoin_chunks(llm.astream(_direct_messages(question), config))
+    record_llm_usage("direct_response", configuration.chat_model, response)
 
     return {"messages": [response]}
 
@@ -187,30 +945,244 @@ def decide_route(state: AgentState) -> str:
         raise ValueError(f"Invalid route_decision: {state.route_decision}")
 
 
-workflow = StateGraph(AgentState)
-workflow.add_node("route_question", route_question)
-workflow.add_node("retrieve_documents", retrieve_documents)
-workflow.add_node("generate_response", generate_response)
-workflow.add_node("direct_response", direct_response)
+def decide_speculative_route(state: AgentState) -> str:
+    """Conditional edge function for the speculative variant.
 
-# Start with routing the question
-workflow.add_edge(START, "route_question")
+    Documents were already retrieved alongside routing, so AWS questions go
+    straight to generation.
 
-# Conditional routing based on question type
-workflow.add_conditional_edges(
-    "route_question",
-    decide_route,
-    {
-        "retrieve_documents": "retrieve_documents",
-        "direct_response": "direct_response",
-    },
-)
+    Args:
+        state: Current agent state with route_decision
+
+    Returns:
+        str: Next node name based on routing decision
+    """
+    if decide_route(state) == "retrieve_documents":
+        return "generate_response"
+    return "direct_response"
+
+
+def decide_cache(state: AgentState) -> str:
+    """Conditional edge function that skips the graph on an answer cache hit.
+
+    Args:
+        state: Current agent state with cache_hit
+
+    Returns:
+        str: ``END`` on a hit, where only the history is still trimmed, otherwise
+            the routing node
+    """
+    return END if state.cache_hit else "route_question"
+
+
+def _with_defaults(func: Callable, defaults: dict[str, Any]) -> Callable:
+    """Wrap a node so the run's ``configurable`` values overlay ``defaults``.
 
-# RAG workflow: retrieve -> generate
-workflow.add_edge("retrieve_documents", "generate_response")
+    LangGraph replaces, rather than merges, a graph's ``configurable`` with the one
+    of the run (which carries at least the ``thread_id`` under a checkpointer), so
+    the defaults are merged in here instead.
+    """
+
+    def merged(config: RunnableConfig) -> RunnableConfig:
+        return {
+            **config,
+            "configurable": {**defaults, **(config.get("configurable") or {})},
+        }
+
+    if inspect.iscoroutinefunction(func):
+
+        @functools.wraps(func)
+        async def async_wrapper(state: AgentState, config: RunnableConfig) -> Any:
+            return await func(state, merged(config))
+
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(state: AgentState, config: RunnableConfig) -> Any:
+        return func(state, merged(config))
 
-# Both paths end at END
-workflow.add_edge("generate_response", END)
-workflow.add_edge("direct_response", END)
+    return wrapper
 
-graph = workflow.compile()
+
+def create_workflow(
+    configuration: Configuration | None = None,
+    *,
+    answer_cache: bool | None = None,
+    speculative_retrieval: bool | None = None,
+    rerank: bool | None = None,
+) -> StateGraph:
+    """Build the RAG workflow.
+
+    Args:
+        configuration: Configuration whose topology fields shape the workflow and
+            whose other fields are the nodes' defaults,
+            :func:`~agent.configuration.default_configuration` by default
+        answer_cache: Whether to put the answer cache in front of the router
+        speculative_retrieval: Whether to retrieve documents while routing instead
+            of after it
+        rerank: Whether to retrieve ``rerank_candidates`` documents and rerank
+            them before generation
+
+    Returns:
+        StateGraph: The uncompiled workflow
+    """
+    configuration = configuration or default_configuration()
+    if answer_cache is None:
+        answer_cache = configuration.answer_cache
+    if speculative_retrieval is None:
+        speculative_retrieval = configuration.speculative_retrieval
+    if rerank is None:
+        rerank = configuration.rerank
+
+    workflow = StateGraph(AgentState, config_schema=Configuration)
+    # Generation follows retrieval directly, or through the reranker
+    generate_node = "rerank_documents" if rerank else "generate_response"
+
+    defaults = configuration.as_configurable()
+
+    def add_node(name: str, func: Callable, afunc: Callable) -> None:
+        workflow.add_node(
+            name,
+            RunnableLambda(
+                instrument_node(name, _with_defaults(func, defaults)),
+                afunc=instrument_node(name, _with_defaults(afunc, defaults)),
+            ),
+        )
+
+    if speculative_retrieval:
+        router_node = "route_and_retrieve"
+        add_node(
+            router_node,
+            functools.partial(route_and_retrieve, rerank=rerank),
+            functools.partial(aroute_and_retrieve, rerank=rerank),
+        )
+    else:
+        router_node = "route_question"
+        add_node(router_node, route_question, aroute_question)
+        add_node(
+            "retrieve_documents",
+            functools.partial(retrieve_documents, rerank=rerank),
+            functools.partial(aretrieve_documents, rerank=rerank),
+        )
+    if rerank:
+        add_node("rerank_documents", rerank_documents, arerank_documents)
+        workflow.add_edge("rerank_documents", "generate_response")
+    add_node("generate_response", generate_response, agenerate_response)
+    add_node("direct_response", direct_response, adirect_response)
+    add_node("condense_question", condense_question, acondense_question)
+    add_node("manage_history", manage_history, amanage_history)
+
+    # Every turn starts by turning the question into a standalone one
+    workflow.add_edge(START, "condense_question")
+
+    if answer_cache:
+        add_node("check_answer_cache", check_answer_cache, acheck_answer_cache)
+        add_node("store_answer", store_answer, astore_answer)
+
+        # Serve cached answers before doing any routing work
+        workflow.add_edge("condense_question", "check_answer_cache")
+        workflow.add_conditional_edges(
+            "check_answer_cache",
+            decide_cache,
+            {END: "manage_history", "route_question": router_node},
+        )
+    else:
+        # Continue with routing the question
+        workflow.add_edge("condense_question", router_node)
+
+    if speculative_retrieval:
+        # Documents are already in the state once routing finishes
+        workflow.add_conditional_edges(
+            router_node,
+            decide_speculative_route,
+            {
+                "generate_response": generate_node,
+                "direct_response": "direct_response",
+            },
+        )
+    else:
+        # Conditional routing based on question type
+        workflow.add_conditional_edges(
+            router_node,
+            decide_route,
+            {
+                "retrieve_documents": "retrieve_documents",
+                "direct_response": "direct_response",
+            },
+        )
+
+        # RAG workflow: retrieve -> (rerank ->) generate
+        workflow.add_edge("retrieve_documents", generate_node)
+
+    # Both paths end by bounding the history, through the cache when it is enabled
+    answer_end = "store_answer" if answer_cache else "manage_history"
+    workflow.add_edge("generate_response", answer_end)
+    workflow.add_edge("direct_response", answer_end)
+    if answer_cache:
+        workflow.add_edge("store_answer", "manage_history")
+    workflow.add_edge("manage_history", END)
+
+    return workflow
+
+
+def build_graph(
+    configuration: Configuration | None = None, checkpointer: Checkpointer = None
+) -> CompiledStateGraph:
+    """Compile the RAG graph for ``configuration``.
+
+    The configuration's topology fields shape the graph and the rest become the
+    defaults of every run's ``configurable``, which callers can still override per
+    run. The first build also starts the metrics exporter and, with ``warm_up``,
+    builds the shared clients in the background so the first request after a pod
+    starts doesn't pay the cold-start cost.
+
+    Args:
+        configuration: Graph configuration,
+            :func:`~agent.configuration.default_configuration` by default
+        checkpointer: Checkpointer persisting threads; the LangGraph server
+            provides its own
+
+    Returns:
+        CompiledStateGraph: The compiled graph
+    """
+    configuration = configuration or default_configuration()
+    start_exporter(
+        configuration.metrics_exporter,
+        configuration.metrics_port,
+        configuration.metrics_log_interval,
+    )
+    if configuration.warm_up:
+        get_registry().warm_up_in_background(
+            chat_models=(configuration.chat_model,),
+            embedding_model=configuration.embedding_model,
+            collection_name=configuration.collection_name,
+            persist_directory=configuration.persist_directory,
+            backend=configuration.vector_store,
+            nprobe=configuration.ann_nprobe,
+        )
+
+    compiled = create_workflow(configuration).compile(checkpointer=checkpointer)
+    if configuration.max_concurrency is None:
+        return compiled
+    # A copy of the compiled graph whose runs default to the limit
+    return compiled.with_config(max_concurrency=configuration.max_concurrency)
+
+
+def __getattr__(name: str) -> Any:
+    """Build the module-level graphs on first access.
+
+    ``graph`` (the entry point in ``langgraph.json``), ``speculative_graph`` and
+    ``workflow`` are built lazily, so importing this module stays cheap.
+    """
+    if name == "graph":
+        value: Any = build_graph()
+    elif name == "speculative_graph":
+        value = build_graph(
+            replace(default_configuration(), speculative_retrieval=True)
+        )
+    elif name == "workflow":
+        value = create_workflow()
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value
+    return value
@@ -0,0 +1,131 @@
+"""Conversation history management for the RAG agent.
+
+Every node works on the latest question only, so a follow-up such as "and what
+about its pricing?" would be routed and retrieved on its own. Before routing, the
+graph therefore condenses follow-ups into a standalone question using the recent
+history and the running summary. Rewrites are memoised in a
+:class:`QueryRewriteCache`, so a retried or replayed turn doesn't pay for the LLM
+call twice; first questions of a thread are used as they are.
+
+The messages of a thread are kept by ``add_messages`` and checkpointed after every
+turn, so without a bound the checkpoint grows with the thread. Once a thread holds
+more than ``history_max_messages`` messages, the oldest ones are removed and,
+optionally, folded into the summary. Trimming keeps half the window so the summary
+call is amortised over several turns, and always cuts before a question so
+question/answer pairs stay together.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from collections.abc import Sequence
+from dataclasses import dataclass
+
+from langchain_core.messages import BaseMessage, HumanMessage
+
+
+@dataclass
+class RewriteStats:
+    """Counters describing rewrite cache effectiveness."""
+
+    hits: int = 0
+    misses: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        """Return the fraction of rewrites served from the cache."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class QueryRewriteCache:
+    """Bounded LRU cache of standalone questions keyed by their conversation.
+
+    Args:
+        max_size: Maximum number of cached rewrites
+    """
+
+    def __init__(self, max_size: int = 1024) -> None:
+        """Create an empty cache."""
+        self.max_size = max_size
+        self.stats = RewriteStats()
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, str] = OrderedDict()
+
+    def __len__(self) -> int:
+        """Return the number of cached rewrites."""
+        return len(self._entries)
+
+    @staticmethod
+    def key(model: str, summary: str | None, history: str, question: str) -> str:
+        """Return the cache key of a rewrite of ``question`` in a conversation."""
+        digest = hashlib.sha256()
+        for part in (model, summary or "", history, question):
+            digest.update(part.encode())
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def get(self, key: str) -> str | None:
+        """Return the cached rewrite for ``key``, or ``None`` on a miss."""
+        with self._lock:
+            rewrite = self._entries.get(key)
+            if rewrite is None:
+                self.stats.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats.hits += 1
+            return rewrite
+
+    def put(self, key: str, rewrite: str) -> None:
+        """Cache ``rewrite``, evicting the least recently used entry if full."""
+        with self._lock:
+            self._entries[key] = rewrite
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+def is_follow_up(messages: Sequence[BaseMessage], summary: str | None) -> bool:
+    """Return whether the latest question has earlier conversation to refer to."""
+    return bool(summary) or any(
+        isinstance(message, HumanMessage) for message in messages[:-1]
+    )
+
+
+def recent_history(
+    messages: Sequence[BaseMessage], max_messages: int
+) -> list[BaseMessage]:
+    """Return up to ``max_messages`` messages preceding the latest question."""
+    return list(messages[:-1][-max_messages:]) if max_messages > 0 else []
+
+
+def format_history(messages: Sequence[BaseMessage]) -> str:
+    """Render ``messages`` as a ``User:``/``Assistant:`` transcript."""
+    lines = []
+    for message in messages:
+        speaker = "User" if isinstance(message, HumanMessage) else "Assistant"
+        lines.append(f"{speaker}: {message.content}")
+    return "\n".join(lines)
+
+
+def split_history(
+    messages: Sequence[BaseMessage], max_messages: int
+) -> tuple[list[BaseMessage], list[BaseMessage]]:
+    """Split ``messages`` into the ones to remove and the ones to keep.
+
+    Nothing is removed until there are more than ``max_messages`` messages; then
+    about half of the window is kept, starting at a question.
+
+    Args:
+        messages: Messages of the thread, oldest first
+        max_messages: Maximum messages to keep, or 0 to keep every message
+
+    Returns:
+        tuple: The removed messages and the kept messages
+    """
+    if max_messages <= 0 or len(messages) <= max_messages:
+        return [], list(messages)
+    cut = len(messages) - max(max_messages // 2, 1)
+    while cut < len(messages) - 1 and not isinstance(messages[cut], HumanMessage):
+        cut += 1
+    return list(messages[:cut]), list(messages[cut:])
@@ -0,0 +1,235 @@
+"""BM25 lexical index over the indexed chunks, fused with dense retrieval.
+
+Dense embeddings blur exact tokens such as instance types (``m7g.large``), API
+names or IAM actions (``s3:GetObject``). The indexer therefore also builds a BM25
+index over the same chunks and stores it next to the Chroma data. At query time
+the graph searches both and merges the two rankings with reciprocal-rank fusion
+(:func:`reciprocal_rank_fusion`).
+
+The index is a plain inverted index in numpy arrays: a vocabulary, per-term
+posting lists of chunk positions and term frequencies, and chunk lengths. It is
+saved as a single ``.npz`` file and scoring a query only touches the posting lists
+of its terms.
+"""
+
+import os
+import re
+import threading
+from collections import Counter
+from collections.abc import Iterable, Sequence
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+LEXICAL_INDEX_FILENAME = "bm25.npz"
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[.:_/-][a-z0-9]+)*")
+_SEPARATOR_PATTERN = re.compile(r"[.:_/-]")
+
+
+def tokenize(text: str) -> list[str]:
+    """Split ``text`` into lowercase terms.
+
+    Compound tokens such as ``m7g.large`` or ``s3:GetObject`` are kept whole, so
+    they match exactly, and are also split into their parts.
+    """
+    tokens = []
+    for token in _TOKEN_PATTERN.findall(text.lower()):
+        tokens.append(token)
+        if _SEPARATOR_PATTERN.search(token):
+            tokens.extend(_SEPARATOR_PATTERN.split(token))
+    return tokens
+
+
+class BM25Index:
+    """Okapi BM25 over a fixed set of chunks.
+
+    Args:
+        ids: Chunk IDs, in index order
+        vocabulary: Terms, in column order
+        offsets: Start of each term's postings; ``offsets[-1]`` is their total length
+        postings: Chunk positions of each posting
+        frequencies: Term frequency of each posting
+        lengths: Number of terms in each chunk
+        k1: Term frequency saturation
+        b: Length normalisation
+    """
+
+    def __init__(
+        self,
+        ids: Sequence[str],
+        vocabulary: Sequence[str],
+        offsets: np.ndarray,
+        postings: np.ndarray,
+        frequencies: np.ndarray,
+        lengths: np.ndarray,
+        k1: float = 1.5,
+        b: float = 0.75,
+    ) -> None:
+        """Create an index from its arrays; see :meth:`build` to index texts."""
+        self.ids = list(ids)
+        self.terms = {term: i for i, term in enumerate(vocabulary)}
+        self.offsets = offsets
+        self.postings = postings
+        self.frequencies = frequencies
+        self.lengths = lengths
+        self.k1 = k1
+        self.b = b
+        count = len(self.ids)
+        document_frequency = np.diff(offsets).astype(np.float32)
+        self.idf = np.log1p(
+            (count - document_frequency + 0.5) / (document_frequency + 0.5)
+        )
+        average = float(lengths.mean()) if count else 1.0
+        self._norm = (k1 * (1 - b + b * lengths / (average or 1.0))).astype(np.float32)
+
+    def __len__(self) -> int:
+        """Return the number of indexed chunks."""
+        return len(self.ids)
+
+    @classmethod
+    def build(cls, chunks: Iterable[tuple[str, str]], **kwargs: float) -> "BM25Index":
+        """Index ``(id, text)`` pairs."""
+        ids = []
+        lengths = []
+        postings: dict[str, list[tuple[int, int]]] = {}
+        for position, (chunk_id, text) in enumerate(chunks):
+            tokens = tokenize(text)
+            ids.append(chunk_id)
+            lengths.append(len(tokens))
+            for term, frequency in Counter(tokens).items():
+                postings.setdefault(term, []).append((position, frequency))
+
+        vocabulary = sorted(postings)
+        sizes = [len(postings[term]) for term in vocabulary]
+        offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum(sizes, out=offsets[1:])
+        flat = [entry for term in vocabulary for entry in postings[term]]
+        pairs = np.asarray(flat, dtype=np.int32).reshape(-1, 2)
+        return cls(
+            ids,
+            vocabulary,
+            offsets,
+            pairs[:, 0].copy(),
+            pairs[:, 1].astype(np.float32),
+            np.asarray(lengths, dtype=np.float32),
+            **kwargs,
+        )
+
+    def search(self, query: str, k: int = 10) -> list[tuple[str, float]]:
+        """Return the IDs and scores of the ``k`` best chunks for ``query``."""
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        for term in set(tokenize(query)):
+            column = self.terms.get(term)
+            if column is None:
+                continue
+            start, end = self.offsets[column], self.offsets[column + 1]
+            positions = self.postings[start:end]
+            frequencies = self.frequencies[start:end]
+            scores[positions] += (
+                self.idf[column]
+                * frequencies
+                * (self.k1 + 1)
+                / (frequencies + self._norm[positions])
+            )
+        matched = np.flatnonzero(scores)
+        if len(matched) > k:
+            matched = matched[np.argpartition(scores[matched], -k)[-k:]]
+        ranked = matched[np.argsort(scores[matched])[::-1]]
+        return [(self.ids[i], float(scores[i])) for i in ranked]
+
+    def save(self, path: str) -> None:
+        """Write the index atomically to ``path``."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        vocabulary = sorted(self.terms, key=self.terms.__getitem__)
+        with open(f"{path}.tmp", "wb") as f:
+            np.savez(
+                f,
+                ids=np.asarray(self.ids, dtype=str),
+                vocabulary=np.asarray(vocabulary, dtype=str),
+                offsets=self.offsets,
+                postings=self.postings,
+                frequencies=self.frequencies,
+                lengths=self.lengths,
+                params=np.asarray([self.k1, self.b]),
+            )
+        os.replace(f"{path}.tmp", path)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        """Read an index written by :meth:`save`."""
+        with np.load(path) as data:
+            k1, b = data["params"].tolist()
+            return cls(
+                data["ids"].tolist(),
+                data["vocabulary"].tolist(),
+                data["offsets"],
+                data["postings"],
+                data["frequencies"],
+                data["lengths"],
+                k1=k1,
+                b=b,
+            )
+
+
+class LexicalIndexFile:
+    """A BM25 index on disk, reloaded when the indexer rewrites it.
+
+    Args:
+        path: Index file written by :meth:`BM25Index.save`
+    """
+
+    def __init__(self, path: str) -> None:
+        """Track the index at ``path``; it is loaded on first use."""
+        self.path = path
+        self._index: BM25Index | None = None
+        self._mtime: int | None = None
+        self._lock = threading.Lock()
+
+    def get(self) -> BM25Index | None:
+        """Return the current index, or ``None`` if none has been built."""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        if mtime != self._mtime:
+            with self._lock:
+                if mtime != self._mtime:
+                    self._index = BM25Index.load(self.path)
+                    self._mtime = mtime
+        return self._index
+
+
+def reciprocal_rank_fusion(rankings: Iterable[Sequence[str]], k: int = 60) -> list[str]:
+    """Merge ranked ID lists by their summed reciprocal ranks ``1 / (k + rank)``."""
+    scores: Counter[str] = Counter()
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] += 1.0 / (k + rank)
+    return [item for item, _ in scores.most_common()]
+
+
+def fuse_results(
+    vector_store: VectorStore,
+    dense: Sequence[Document],
+    lexical: Sequence[tuple[str, float]],
+    k: int,
+) -> list[Document]:
+    """Fuse dense and lexical results into the ``k`` best documents.
+
+    Chunks found only by the lexical index are loaded from ``vector_store``.
+    """
+    if any(document.id is None for document in dense):
+        return list(dense)[:k]
+    by_id = {str(document.id): document for document in dense}
+    ranked = reciprocal_rank_fusion(
+        [list(by_id), [chunk_id for chunk_id, _ in lexical]]
+    )[:k]
+    missing = [chunk_id for chunk_id in ranked if chunk_id not in by_id]
+    if missing:
+        by_id.update(
+            (str(document.id), document)
+            for document in vector_store.get_by_ids(missing)
+        )
+    return [by_id[chunk_id] for chunk_id in ranked if chunk_id in by_id]
@@ -0,0 +1,662 @@
+"""In-process metrics for the agent graph and the indexer.
+
+A small, dependency-free take on the Prometheus client model: a
+:class:`MetricsRegistry` holds labelled :class:`Counter`, :class:`Gauge` and
+:class:`Histogram` families, and an exporter renders them:
+
+* :class:`PrometheusExporter` – Prometheus text exposition format 0.0.4
+* :class:`OpenMetricsExporter` – OpenMetrics 1.0 text format
+* :class:`LogExporter` – one JSON log line per metric family
+
+:func:`start_exporter` serves the text formats over HTTP on ``/metrics`` or logs
+periodically, without any external service. The helpers at the bottom of the
+module (:func:`instrument_node`, :func:`timed`, :func:`record_llm_usage`, ...)
+are what the graph nodes and the indexer pipeline call.
+"""
+
+import bisect
+import functools
+import inspect
+import itertools
+import json
+import logging
+import math
+import threading
+import time
+from collections.abc import Callable, Iterator, Sequence
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Protocol
+
+from langchain_core.messages import BaseMessage
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+
+# USD per million prompt and completion tokens
+MODEL_PRICES: dict[str, tuple[float, float]] = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4.1-mini": (0.40, 1.60),
+}
+
+Labels = tuple[tuple[str, str], ...]
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict[str, object]) -> Labels:
+        if set(labels) != set(self.label_names):
+            raise ValueError(
+                f"{self.name} expects labels {self.label_names}, got {tuple(labels)}"
+            )
+        return tuple((name, str(labels[name])) for name in self.label_names)
+
+    def samples(self) -> Iterator[tuple[str, Labels, float]]:
+        """Yield ``(suffix, labels, value)`` for every sample of the family."""
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonically increasing value per label set.
+
+    Args:
+        name: Family name, without the ``_total`` suffix
+        documentation: Help text
+        labels: Label names
+    """
+
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        """Create an empty counter family."""
+        super().__init__(name, documentation, labels)
+        self._values: dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, **labels: object) -> None:
+        """Add ``amount`` to the counter for ``labels``."""
+        if amount < 0:
+            raise ValueError("Counters can only increase")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: object) -> float:
+        """Return the counter for ``labels``."""
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> Iterator[tuple[str, Labels, float]]:
+        """Yield one ``_total`` sample per label set."""
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield "_total", key, value
+
+
+class Gauge(_Metric):
+    """Value per label set that can go up and down, e.g. a queue depth.
+
+    Args:
+        name: Family name
+        documentation: Help text
+        labels: Label names
+    """
+
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        """Create an empty gauge family."""
+        super().__init__(name, documentation, labels)
+        self._values: dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, **labels: object) -> None:
+        """Add ``amount``, which may be negative, to the gauge for ``labels``."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def set(self, value: float, **labels: object) -> None:
+        """Set the gauge for ``labels``."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def value(self, **labels: object) -> float:
+        """Return the gauge for ``labels``."""
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> Iterator[tuple[str, Labels, float]]:
+        """Yield one sample per label set."""
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield "", key, value
+
+
+class _Series:
+    __slots__ = ("buckets", "count", "sum")
+
+    def __init__(self, size: int) -> None:
+        # Observations per bucket, not cumulative; the last one is +Inf
+        self.buckets = [0] * (size + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def cumulative(self) -> list[int]:
+        return list(itertools.accumulate(self.buckets))
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets per label set.
+
+    Args:
+        name: Family name
+        documentation: Help text
+        labels: Label names
+        buckets: Upper bounds of the buckets; ``+Inf`` is added
+    """
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        """Create an empty histogram family."""
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series: dict[Labels, _Series] = {}
+
+    def observe(self, value: float, **labels: object) -> None:
+        """Record ``value`` for ``labels``."""
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = _Series(len(self.buckets))
+            series.buckets[bisect.bisect_left(self.buckets, value)] += 1
+            series.count += 1
+            series.sum += value
+
+    @contextmanager
+    def time(self, **labels: object) -> Iterator[None]:
+        """Observe the seconds spent in the block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels: object) -> int:
+        """Return the number of observations for ``labels``."""
+        series = self._series.get(self._key(labels))
+        return series.count if series else 0
+
+    def sum(self, **labels: object) -> float:
+        """Return the sum of the observations for ``labels``."""
+        series = self._series.get(self._key(labels))
+        return series.sum if series else 0.0
+
+    def quantile(self, q: float, **labels: object) -> float:
+        """Estimate the ``q`` quantile by interpolating within buckets."""
+        series = self._series.get(self._key(labels))
+        if not series or not series.count:
+            return math.nan
+        rank = q * series.count
+        lower, below = 0.0, 0
+        for bound, cumulative in zip(self.buckets, series.cumulative(), strict=False):
+            if cumulative >= rank:
+                inside = cumulative - below
+                return lower + (bound - lower) * (
+                    (rank - below) / inside if inside else 0
+                )
+            lower, below = bound, cumulative
+        return self.buckets[-1] if self.buckets else math.nan
+
+    def samples(self) -> Iterator[tuple[str, Labels, float]]:
+        """Yield ``_bucket``, ``_count`` and ``_sum`` samples per label set."""
+        with self._lock:
+            series = sorted(
+                (key, s.cumulative(), s.count, s.sum) for key, s in self._series.items()
+            )
+        for key, buckets, count, total in series:
+            for bound, cumulative in zip(self.buckets, buckets, strict=False):
+                yield "_bucket", (*key, ("le", _format_value(bound))), cumulative
+            yield "_bucket", (*key, ("le", "+Inf")), count
+            yield "_count", key, count
+            yield "_sum", key, total
+
+
+class MetricsRegistry:
+    """Named metric families, created on first use."""
+
+    def __init__(self) -> None:
+        """Create an empty registry."""
+        self._lock = threading.Lock()
+        self._metrics: dict[str, _Metric] = {}
+
+    def _get_or_create(self, metric: _Metric) -> Any:
+        with self._lock:
+            existing = self._metrics.setdefault(metric.name, metric)
+        if type(existing) is not type(metric):
+            raise ValueError(f"{metric.name} is already a {existing.type}")
+        return existing
+
+    def counter(
+        self, name: str, documentation: str, labels: Sequence[str] = ()
+    ) -> Counter:
+        """Return the counter family ``name``, creating it if needed."""
+        return self._get_or_create(Counter(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Gauge:
+        """Return the gauge family ``name``, creating it if needed."""
+        return self._get_or_create(Gauge(name, documentation, labels))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        """Return the histogram family ``name``, creating it if needed."""
+        return self._get_or_create(Histogram(name, documentation, labels, buckets))
+
+    def collect(self) -> list[_Metric]:
+        """Return every family, sorted by name."""
+        with self._lock:
+            return [self._metrics[name] for name in sorted(self._metrics)]
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+class Exporter(Protocol):
+    """Renders a registry."""
+
+    content_type: str
+
+    def render(self, registry: MetricsRegistry) -> str:
+        """Return the metrics of ``registry`` as text."""
+        ...
+
+
+class PrometheusExporter:
+    """Prometheus text exposition format 0.0.4."""
+
+    content_type = "text/plain; version=0.0.4; charset=utf-8"
+
+    def render(self, registry: MetricsRegistry) -> str:
+        """Return the metrics of ``registry`` as Prometheus text."""
+        lines = []
+        for metric in registry.collect():
+            name = metric.name + ("_total" if metric.type == "counter" else "")
+            lines.append(f"# HELP {name} {_escape(metric.documentation)}")
+            lines.append(f"# TYPE {name} {metric.type}")
+            for suffix, labels, value in metric.samples():
+                sample = metric.name + suffix
+                lines.append(f"{sample}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class OpenMetricsExporter:
+    """OpenMetrics 1.0 text format."""
+
+    content_type = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+    def render(self, registry: MetricsRegistry) -> str:
+        """Return the metrics of ``registry`` as OpenMetrics text."""
+        lines = []
+        for metric in registry.collect():
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.append(f"# HELP {metric.name} {_escape(metric.documentation)}")
+            for suffix, labels, value in metric.samples():
+                sample = metric.name + suffix
+                lines.append(f"{sample}{_format_labels(labels)} {_format_value(value)}")
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+class LogExporter:
+    """One JSON object per metric family, for structured log pipelines.
+
+    Histograms are summarised as count, sum and p50/p95/p99 per label set.
+    """
+
+    content_type = "application/x-ndjson"
+
+    def families(self, registry: MetricsRegistry) -> Iterator[dict[str, Any]]:
+        """Yield a JSON-serialisable summary of each family."""
+        for metric in registry.collect():
+            series = []
+            if isinstance(metric, Histogram):
+                keys = sorted(metric._series)
+                for key in keys:
+                    labels = dict(key)
+                    series.append(
+                        {
+                            "labels": labels,
+                            "count": metric.count(**labels),
+                            "sum": metric.sum(**labels),
+                            **{
+                                f"p{int(q * 100)}": metric.quantile(q, **labels)
+                                for q in (0.5, 0.95, 0.99)
+                            },
+                        }
+                    )
+            else:
+                series = [
+                    {"labels": dict(key), "value": value}
+                    for _, key, value in metric.samples()
+                ]
+            yield {"metric": metric.name, "type": metric.type, "series": series}
+
+    def render(self, registry: MetricsRegistry) -> str:
+        """Return one JSON line per family."""
+        return "".join(json.dumps(family) + "\n" for family in self.families(registry))
+
+    def export(self, registry: MetricsRegistry) -> None:
+        """Log one line per family on the ``agent.metrics`` logger."""
+        for family in self.families(registry):
+            logger.info(json.dumps(family))
+
+
+EXPORTERS: dict[str, Callable[[], Exporter]] = {
+    "prometheus": PrometheusExporter,
+    "openmetrics": OpenMetricsExporter,
+    "log": LogExporter,
+}
+
+
+_metrics = MetricsRegistry()
+
+
+def get_metrics() -> MetricsRegistry:
+    """Return the process-wide metrics registry."""
+    return _metrics
+
+
+def set_metrics(registry: MetricsRegistry) -> MetricsRegistry:
+    """Replace the process-wide metrics registry, e.g. in tests.
+
+    Returns:
+        MetricsRegistry: The previous registry, so it can be restored
+    """
+    global _metrics
+    previous, _metrics = _metrics, registry
+    return previous
+
+
+def serve_metrics(
+    port: int, exporter: Exporter | None = None, host: str = "0.0.0.0"
+) -> ThreadingHTTPServer:
+    """Serve ``/metrics`` from a daemon thread and return the server."""
+    exporter = exporter or PrometheusExporter()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:  # noqa: N802
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = exporter.render(get_metrics()).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", exporter.content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args: Any) -> None:
+            logger.debug(format, *args)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(
+        target=server.serve_forever, name="agent-metrics", daemon=True
+    ).start()
+    return server
+
+
+def log_metrics(interval: float) -> threading.Event:
+    """Log every metric family every ``interval`` seconds until the event is set."""
+    stop = threading.Event()
+    exporter = LogExporter()
+
+    def run() -> None:
+        while not stop.wait(interval):
+            exporter.export(get_metrics())
+
+    threading.Thread(target=run, name="agent-metrics-log", daemon=True).start()
+    return stop
+
+
+@functools.cache
+def start_exporter(kind: str | None, port: int = 9464, interval: float = 60) -> None:
+    """Start the exporter named ``kind`` once per process.
+
+    Args:
+        kind: ``prometheus`` or ``openmetrics`` to serve ``/metrics`` on ``port``,
+            ``log`` to log every ``interval`` seconds, or ``None`` for neither
+        port: HTTP port of the text exporters
+        interval: Seconds between log exports
+    """
+    if not kind:
+        return
+    if kind not in EXPORTERS:
+        raise ValueError(
+            f"Unknown metrics exporter {kind!r}; use one of {list(EXPORTERS)}"
+        )
+    if kind == "log":
+        log_metrics(interval)
+    else:
+        serve_metrics(port, EXPORTERS[kind]())
+    logger.info("Started %s metrics exporter", kind)
+
+
+# Graph and indexer instrumentation
+
+
+def instrument_node(name: str, func: Callable[..., Any]) -> Callable[..., Any]:
+    """Wrap a graph node so its wall time and failures are recorded."""
+
+    def record(start: float, outcome: str) -> None:
+        metrics = get_metrics()
+        metrics.histogram(
+            "agent_node_duration_seconds", "Wall time of graph nodes", ["node"]
+        ).observe(time.perf_counter() - start, node=name)
+        if outcome == "error":
+            metrics.counter(
+                "agent_node_errors", "Graph node runs that raised", ["node"]
+            ).inc(node=name)
+
+    if inspect.iscoroutinefunction(func):
+
+        @functools.wraps(func)
+        async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+            start = time.perf_counter()
+            try:
+                result = await func(*args, **kwargs)
+            except BaseException:
+                record(start, "error")
+                raise
+            record(start, "ok")
+            return result
+
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        start = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        except BaseException:
+            record(start, "error")
+            raise
+        record(start, "ok")
+        return result
+
+    return wrapper
+
+
+@contextmanager
+def timed(operation: str) -> Iterator[None]:
+    """Record the wall time of an operation inside a node, e.g. ``vector_search``."""
+    with (
+        get_metrics()
+        .histogram(
+            "agent_operation_duration_seconds",
+            "Wall time of operations inside graph nodes",
+            ["operation"],
+        )
+        .time(operation=operation)
+    ):
+        yield
+
+
+def record_llm_usage(node: str, model: str, message: BaseMessage) -> None:
+    """Record the prompt and completion tokens, and their cost, of an LLM call."""
+    usage = getattr(message, "usage_metadata", None)
+    if not usage:
+        return
+    metrics = get_metrics()
+    model = model.split(":", 1)[-1]
+    tokens = metrics.histogram(
+        "agent_llm_tokens",
+        "Tokens per LLM call",
+        ["node", "model", "type"],
+        TOKEN_BUCKETS,
+    )
+    prompt, completion = usage["input_tokens"], usage["output_tokens"]
+    tokens.observe(prompt, node=node, model=model, type="prompt")
+    tokens.observe(completion, node=node, model=model, type="completion")
+    if model in MODEL_PRICES:
+        prompt_price, completion_price = MODEL_PRICES[model]
+        metrics.counter(
+            "agent_llm_cost_usd", "Estimated LLM spend in USD", ["node", "model"]
+        ).inc(
+            (prompt * prompt_price + completion * completion_price) / 1_000_000,
+            node=node,
+            model=model,
+        )
+
+
+def record_route(tier: str, decision: str, seconds: float) -> None:
+    """Record a routing decision and the time the deciding tier took."""
+    metrics = get_metrics()
+    metrics.histogram(
+        "agent_route_duration_seconds", "Wall time of routing decisions", ["tier"]
+    ).observe(seconds, tier=tier)
+    metrics.counter(
+        "agent_route_decisions", "Routing decisions", ["tier", "decision"]
+    ).inc(tier=tier, decision=decision)
+
+
+def record_rewrite(outcome: str) -> None:
+    """Record how the latest question was condensed: skipped, cached or rewritten."""
+    get_metrics().counter(
+        "agent_question_rewrites", "Follow-up question rewrites", ["outcome"]
+    ).inc(outcome=outcome)
+
+
+def record_history(messages: int, removed: int) -> None:
+    """Record the messages a thread keeps after a turn and how many were trimmed."""
+    metrics = get_metrics()
+    metrics.histogram(
+        "agent_history_messages",
+        "Messages kept in the thread state after a turn",
+        buckets=COUNT_BUCKETS,
+    ).observe(messages)
+    if removed:
+        metrics.counter(
+            "agent_history_trimmed_messages", "Messages trimmed from thread state"
+        ).inc(removed)
+
+
+def track_upstream(state: str, delta: int, kind: str, model: str) -> None:
+    """Move a model call into (+1) or out of (-1) an admission state."""
+    get_metrics().gauge(
+        "agent_upstream_requests",
+        "Upstream model calls waiting for admission or in flight",
+        ["kind", "model", "state"],
+    ).inc(delta, kind=kind, model=model.split(":", 1)[-1], state=state)
+
+
+def record_upstream_wait(seconds: float, kind: str, model: str) -> None:
+    """Record how long a call waited for a concurrency slot and a rate token."""
+    get_metrics().histogram(
+        "agent_upstream_wait_seconds",
+        "Time upstream model calls waited for admission",
+        ["kind", "model"],
+    ).observe(seconds, kind=kind, model=model.split(":", 1)[-1])
+
+
+def record_coalesced(kind: str, model: str) -> None:
+    """Count a call that shared an identical call already in flight."""
+    get_metrics().counter(
+        "agent_upstream_coalesced",
+        "Upstream model calls served by an identical call in flight",
+        ["kind", "model"],
+    ).inc(kind=kind, model=model.split(":", 1)[-1])
+
+
+def record_documents(node: str, count: int) -> None:
+    """Record the number of documents a node retrieved or kept."""
+    get_metrics().histogram(
+        "agent_documents", "Documents per node run", ["node"], COUNT_BUCKETS
+    ).observe(count, node=node)
+
+
+def record_context(tokens_before: int, tokens_after: int) -> None:
+    """Record the context size before and after assembly."""
+    context = get_metrics().histogram(
+        "agent_context_tokens",
+        "Tokens of document content per RAG prompt",
+        ["stage"],
+        TOKEN_BUCKETS,
+    )
+    context.observe(tokens_before, stage="retrieved")
+    context.observe(tokens_after, stage="prompt")
+
+
+def record_stage(stage: str, seconds: float | None, items: int) -> None:
+    """Record one unit of work of an indexer pipeline stage.
+
+    Args:
+        stage: Pipeline stage
+        seconds: Time the stage spent working, or ``None`` to only count items
+        items: Items the stage produced
+    """
+    metrics = get_metrics()
+    if seconds is not None:
+        metrics.histogram(
+            "indexer_stage_duration_seconds",
+            "Wall time of indexer stage work",
+            ["stage"],
+        ).observe(seconds, stage=stage)
+    metrics.counter(
+        "indexer_stage_items", "Items produced by indexer stages", ["stage"]
+    ).inc(items, stage=stage)
@@ -0,0 +1,530 @@
+"""Memory-mapped vector store, an in-process alternative to Chroma.
+
+The indexer can export the Chroma collection to a compact directory (see
+:func:`export_chroma`) that every API replica opens read-only. Each export is
+written to a new version directory, and the ``CURRENT`` file names the version
+readers open, so an export is switched in with one atomic rename. A version holds:
+
+* ``manifest.json``: chunk count, dimension, embedding model and index layout,
+* ``vectors.npy``: float32 unit vectors, one row per chunk,
+* ``texts.bin`` and ``text_offsets.npy``: chunk texts as concatenated UTF-8,
+* ``ids.bin`` and ``id_offsets.npy``: chunk IDs, the same way, and
+  ``id_order.npy``: the rows sorted by ID, to look chunks up by binary search,
+* ``metadata_<i>.bin`` and ``metadata_<i>_offsets.npy``: one column per metadata
+  key listed in the manifest, holding the JSON of each row's value, or nothing
+  where the chunk has no value,
+* ``ivf_centroids.npy``, ``ivf_offsets.npy`` and ``ivf_rows.npy``: an inverted
+  file (IVF) index, built for collections of at least ``ANN_MIN_VECTORS`` chunks.
+
+Every file but the manifest is memory-mapped, so opening a store only reads the
+manifest whatever the collection's size, and replicas on the same node share the
+pages through the OS page cache instead of each loading a SQLite database and HNSW
+segments.
+
+Small collections are searched exactly with one matrix-vector product. With an IVF
+index, the query is compared to the list centroids first and only the rows of the
+``nprobe`` closest lists are scored; ``nprobe=0`` always searches exactly.
+"""
+
+import bisect
+import json
+import logging
+import math
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections.abc import Iterable, Sequence
+from typing import Any, cast
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+logger = logging.getLogger(__name__)
+
+MMAP_DIRNAME = "mmap"
+CURRENT_FILENAME = "CURRENT"
+FORMAT_VERSION = 2
+ANN_MIN_VECTORS = 20_000
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE_PER_LIST = 64
+
+
+def mmap_store_path(persist_directory: str, collection_name: str) -> str:
+    """Return the directory of the exported store of a collection."""
+    return os.path.join(persist_directory, MMAP_DIRNAME, collection_name)
+
+
+def current_version(directory: str) -> str | None:
+    """Return the version of the store in ``directory``, or ``None`` if none."""
+    try:
+        with open(os.path.join(directory, CURRENT_FILENAME)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def export_format(directory: str) -> int | None:
+    """Return the format of the store in ``directory``, or ``None`` if none."""
+    version = current_version(directory)
+    if version is None:
+        return None
+    try:
+        with open(os.path.join(directory, version, "manifest.json")) as f:
+            return json.load(f)["format"]
+    except FileNotFoundError:
+        return None
+
+
+def _normalise(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Return the indices of the ``k`` highest ``scores``, best first."""
+    if k >= len(scores):
+        return np.argsort(-scores, kind="stable")
+    best = np.argpartition(-scores, k - 1)[:k]
+    return best[np.argsort(-scores[best], kind="stable")]
+
+
+def build_ivf(
+    vectors: np.ndarray, lists: int | None = None, seed: int = 0
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Cluster unit ``vectors`` with spherical k-means into an IVF index.
+
+    Args:
+        vectors: Unit vectors, one row per chunk
+        lists: Number of inverted lists, about ``4 * sqrt(n)`` by default
+        seed: Seed of the sampling and initialisation
+
+    Returns:
+        tuple: Centroids, list offsets into the row order, and the row order
+    """
+    count = len(vectors)
+    lists = min(lists or max(1, int(4 * math.sqrt(count))), count)
+    rng = np.random.default_rng(seed)
+    sample_size = min(count, lists * KMEANS_SAMPLE_PER_LIST)
+    sample = np.asarray(vectors[np.sort(rng.choice(count, sample_size, replace=False))])
+
+    centroids = sample[rng.choice(sample_size, lists, replace=False)]
+    for _ in range(KMEANS_ITERATIONS):
+        assignment = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, sample)
+        empty = np.bincount(assignment, minlength=lists) == 0
+        # Re-seed empty lists with random sample points
+        sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+        centroids = _normalise(sums)
+
+    assignment = np.concatenate(
+        [
+            np.argmax(np.asarray(vectors[i : i + 8192]) @ centroids.T, axis=1)
+            for i in range(0, count, 8192)
+        ]
+    )
+    rows = np.argsort(assignment, kind="stable").astype(np.int64)
+    offsets = np.zeros(lists + 1, dtype=np.int64)
+    np.cumsum(np.bincount(assignment, minlength=lists), out=offsets[1:])
+    return centroids.astype(np.float32), offsets, rows
+
+
+def write_mmap_store(
+    directory: str,
+    ids: Sequence[str],
+    texts: Sequence[str],
+    metadatas: Sequence[dict[str, Any] | None],
+    vectors: np.ndarray,
+    embedding_model: str | None = None,
+    ann_min_vectors: int = ANN_MIN_VECTORS,
+) -> None:
+    """Write a store to ``directory``, replacing any previous one.
+
+    The store is written to a new version directory and ``CURRENT`` is then
+    renamed over to point to it, so readers always find a complete store. The
+    version it replaces is kept for readers that resolved it just before the
+    switch; older versions are deleted.
+
+    Args:
+        directory: Directory of the store
+        ids: Chunk IDs
+        texts: Chunk texts
+        metadatas: Chunk metadata
+        vectors: Chunk embeddings, one row per chunk
+        embedding_model: Model the embeddings come from, for the manifest
+        ann_min_vectors: Chunk count from which an IVF index is built
+    """
+    count = len(ids)
+    vectors = _normalise(np.asarray(vectors, dtype=np.float32))
+    version = f"v-{time.time_ns():x}-{uuid.uuid4().hex[:8]}"
+    path = os.path.join(directory, version)
+    os.makedirs(path)
+
+    np.save(os.path.join(path, "vectors.npy"), vectors)
+    _write_strings(path, "texts", "text", [text.encode() for text in texts])
+    _write_strings(path, "ids", "id", [chunk_id.encode() for chunk_id in ids])
+    order = sorted(range(count), key=ids.__getitem__)
+    np.save(os.path.join(path, "id_order.npy"), np.asarray(order, dtype=np.int64))
+
+    keys = sorted({key for metadata in metadatas for key in metadata or {}})
+    for i, key in enumerate(keys):
+        values = [(metadata or {}).get(key) for metadata in metadatas]
+        _write_strings(
+            path,
+            f"metadata_{i}",
+            f"metadata_{i}",
+            [b"" if value is None else json.dumps(value).encode() for value in values],
+        )
+
+    ivf_lists = 0
+    if count >= ann_min_vectors:
+        centroids, list_offsets, rows = build_ivf(vectors)
+        np.save(os.path.join(path, "ivf_centroids.npy"), centroids)
+        np.save(os.path.join(path, "ivf_offsets.npy"), list_offsets)
+        np.save(os.path.join(path, "ivf_rows.npy"), rows)
+        ivf_lists = len(centroids)
+
+    manifest = {
+        "format": FORMAT_VERSION,
+        "version": version,
+        "count": count,
+        "dimension": int(vectors.shape[1]) if count else 0,
+        "embedding_model": embedding_model,
+        "ivf_lists": ivf_lists,
+        "metadata_keys": keys,
+    }
+    with open(os.path.join(path, "manifest.json"), "w") as f:
+        json.dump(manifest, f)
+
+    previous = current_version(directory)
+    pointer = os.path.join(directory, f".{CURRENT_FILENAME}-{uuid.uuid4().hex}")
+    with open(pointer, "w") as f:
+        f.write(version)
+    os.replace(pointer, os.path.join(directory, CURRENT_FILENAME))
+
+    for name in os.listdir(directory):
+        if name.startswith("v-") and name not in (version, previous):
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+    logger.info(
+        "Wrote %d vectors to %s version %s (%d IVF lists)",
+        count,
+        directory,
+        version,
+        ivf_lists,
+    )
+
+
+def _write_strings(path: str, data: str, offsets: str, values: list[bytes]) -> None:
+    """Write ``values`` to ``<data>.bin`` and their offsets to ``<offsets>_offsets.npy``."""
+    bounds = np.zeros(len(values) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in values], out=bounds[1:])
+    np.save(os.path.join(path, f"{offsets}_offsets.npy"), bounds)
+    with open(os.path.join(path, f"{data}.bin"), "wb") as f:
+        f.writelines(values)
+
+
+def export_chroma(
+    vector_store: Any,
+    directory: str,
+    embedding_model: str | None = None,
+    ann_min_vectors: int = ANN_MIN_VECTORS,
+    batch_size: int = 5000,
+) -> int:
+    """Export a Chroma collection to a memory-mapped store.
+
+    Args:
+        vector_store: ``langchain_chroma.Chroma`` store to export
+        directory: Directory of the store
+        embedding_model: Model the embeddings come from, for the manifest
+        ann_min_vectors: Chunk count from which an IVF index is built
+        batch_size: Chunks read from Chroma at a time
+
+    Returns:
+        int: Number of exported chunks
+    """
+    ids: list[str] = []
+    texts: list[str] = []
+    metadatas: list[dict[str, Any] | None] = []
+    batches = []
+    while True:
+        page = vector_store.get(
+            limit=batch_size,
+            offset=len(ids),
+            include=["embeddings", "documents", "metadatas"],
+        )
+        if not page["ids"]:
+            break
+        ids += page["ids"]
+        texts += [text or "" for text in page["documents"] or []]
+        metadatas += list(page["metadatas"] or [])
+        batches.append(np.asarray(page["embeddings"], dtype=np.float32))
+    vectors = np.concatenate(batches) if batches else np.zeros((0, 0), np.float32)
+    write_mmap_store(
+        directory, ids, texts, metadatas, vectors, embedding_model, ann_min_vectors
+    )
+    return len(ids)
+
+
+class _Strings:
+    """A column of variable-length values, mapped read-only."""
+
+    def __init__(self, path: str, data: str, offsets: str) -> None:
+        self.offsets = np.load(
+            os.path.join(path, f"{offsets}_offsets.npy"), mmap_mode="r"
+        )
+        data_path = os.path.join(path, f"{data}.bin")
+        # An empty file can't be mapped
+        self.data: np.ndarray | bytes = (
+            np.memmap(data_path, dtype=np.uint8, mode="r")
+            if os.path.getsize(data_path)
+            else b""
+        )
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row: int) -> bytes:
+        return bytes(self.data[self.offsets[row] : self.offsets[row + 1]])
+
+
+class _StoreVersion:
+    """One version of an export, mapped read-only."""
+
+    def __init__(self, directory: str, version: str) -> None:
+        self.version = version
+        self.path = os.path.join(directory, version)
+        with open(os.path.join(self.path, "manifest.json")) as f:
+            self.manifest = json.load(f)
+        if self.manifest["format"] != FORMAT_VERSION:
+            raise ValueError(
+                f"Unsupported store format {self.manifest['format']} in {directory}"
+            )
+        self.vectors = self._load("vectors.npy")
+        self.texts = _Strings(self.path, "texts", "text")
+        self.ids = _Strings(self.path, "ids", "id")
+        self.id_order = self._load("id_order.npy")
+        self.metadata = {
+            key: _Strings(self.path, f"metadata_{i}", f"metadata_{i}")
+            for i, key in enumerate(self.manifest["metadata_keys"])
+        }
+        self.ivf = None
+        if self.manifest["ivf_lists"]:
+            self.ivf = (
+                self._load("ivf_centroids.npy"),
+                self._load("ivf_offsets.npy"),
+                self._load("ivf_rows.npy"),
+            )
+
+    def _load(self, name: str) -> np.ndarray:
+        return np.load(os.path.join(self.path, name), mmap_mode="r")
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def chunk_id(self, row: int) -> str:
+        return self.ids[row].decode()
+
+    def row(self, chunk_id: str) -> int | None:
+        """Return the row of ``chunk_id`` by binary search, or ``None``."""
+        i = bisect.bisect_left(
+            self.id_order, chunk_id, key=lambda row: self.chunk_id(int(row))
+        )
+        if i < len(self.id_order) and self.chunk_id(int(self.id_order[i])) == chunk_id:
+            return int(self.id_order[i])
+        return None
+
+    def document(self, row: int) -> Document:
+        metadata = {}
+        for key, column in self.metadata.items():
+            if value := column[row]:
+                metadata[key] = json.loads(value)
+        return Document(
+            id=self.chunk_id(row),
+            page_content=self.texts[row].decode(),
+            metadata=metadata,
+        )
+
+    def search(
+        self, embedding: Sequence[float], k: int, nprobe: int
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Return the rows and cosine similarities of the ``k`` nearest chunks."""
+        query = _normalise(np.asarray(embedding, dtype=np.float32))
+        if not len(self) or k <= 0:
+            return np.zeros(0, np.int64), np.zeros(0, np.float32)
+        if self.ivf is not None and nprobe > 0:
+            centroids, offsets, order = self.ivf
+            lists = _top_k(centroids @ query, min(nprobe, len(centroids)))
+            candidates = np.sort(
+                np.concatenate([order[offsets[i] : offsets[i + 1]] for i in lists])
+            )
+            scores = self.vectors[candidates] @ query
+            best = _top_k(scores, k)
+            return candidates[best], scores[best]
+        scores = self.vectors @ query
+        best = _top_k(scores, k)
+        return best, scores[best]
+
+
+class MmapVectorStore(VectorStore):
+    """Read-only vector store over a memory-mapped export.
+
+    The store follows the ``CURRENT`` pointer of ``directory``: when the indexer
+    publishes a new export, the next query maps the new version, so the vector
+    search moves to a new index together with the BM25 index it is fused with.
+    Each query runs against a single version.
+
+    Args:
+        directory: Directory written by :func:`write_mmap_store`
+        embedding: Embedding client for text queries
+        nprobe: IVF lists searched per query, or 0 to always search exactly
+    """
+
+    def __init__(self, directory: str, embedding: Embeddings, nprobe: int = 16) -> None:
+        """Map the current version of the store in ``directory``."""
+        self.directory = directory
+        self.embedding = embedding
+        self.nprobe = nprobe
+        self._pointer = os.path.join(directory, CURRENT_FILENAME)
+        self._lock = threading.Lock()
+        self._stamp: tuple[int, int] | None = None
+        self._version: _StoreVersion | None = None
+        self._current()
+
+    def _current(self) -> _StoreVersion:
+        """Return the current version, mapping it if the pointer has moved."""
+        try:
+            stat = os.stat(self._pointer)
+        except FileNotFoundError:
+            if self._version is None:
+                raise FileNotFoundError(
+                    f"No memory-mapped store in {self.directory}"
+                ) from None
+            return self._version
+        # Every switch renames a new file over the pointer, so its inode changes
+        stamp = (stat.st_ino, stat.st_mtime_ns)
+        if stamp != self._stamp:
+            with self._lock:
+                if stamp != self._stamp:
+                    version = current_version(self.directory)
+                    if self._version is None or version != self._version.version:
+                        self._version = _StoreVersion(self.directory, str(version))
+                        logger.info(
+                            "Mapped %s version %s",
+                            self.directory,
+                            self._version.version,
+                        )
+                    self._stamp = stamp
+        return cast(_StoreVersion, self._version)
+
+    def __len__(self) -> int:
+        """Return the number of chunks in the store."""
+        return len(self._current())
+
+    @property
+    def embeddings(self) -> Embeddings:
+        """Return the embedding client of text queries."""
+        return self.embedding
+
+    @property
+    def version(self) -> str:
+        """Return the version of the export queries currently search."""
+        return self._current().version
+
+    @property
+    def manifest(self) -> dict[str, Any]:
+        """Return the manifest of the current version."""
+        return self._current().manifest
+
+    @property
+    def uses_ann(self) -> bool:
+        """Return whether queries search the IVF index rather than every vector."""
+        return self._current().ivf is not None and self.nprobe > 0
+
+    def similarity_search_by_vector(
+        self, embedding: list[float], k: int = 4, **kwargs: Any
+    ) -> list[Document]:
+        """Return the ``k`` chunks nearest to ``embedding``."""
+        version = self._current()
+        rows, _ = version.search(embedding, k, self.nprobe)
+        return [version.document(int(row)) for row in rows]
+
+    def similarity_search_by_vectors(
+        self, embeddings: Sequence[Sequence[float]], k: int = 4
+    ) -> list[list[Document]]:
+        """Return the ``k`` nearest chunks of each embedding.
+
+        Exact search scores every query in one matrix product.
+        """
+        version = self._current()
+        if (version.ivf is not None and self.nprobe > 0) or not len(version):
+            return [
+                [
+                    version.document(int(row))
+                    for row in version.search(embedding, k, self.nprobe)[0]
+                ]
+                for embedding in embeddings
+            ]
+        queries = _normalise(np.asarray(embeddings, dtype=np.float32))
+        scores = queries @ version.vectors.T
+        return [
+            [version.document(int(row)) for row in _top_k(row_scores, k)]
+            for row_scores in scores
+        ]
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, **kwargs: Any
+    ) -> list[tuple[Document, float]]:
+        """Return the ``k`` chunks nearest to ``query`` with their similarity."""
+        embedding = self.embedding.embed_query(query)
+        version = self._current()
+        rows, scores = version.search(embedding, k, self.nprobe)
+        return [
+            (version.document(int(row)), float(score))
+            for row, score in zip(rows, scores, strict=True)
+        ]
+
+    def similarity_search(
+        self, query: str, k: int = 4, **kwargs: Any
+    ) -> list[Document]:
+        """Return the ``k`` chunks nearest to ``query``."""
+        return self.similarity_search_by_vector(self.embedding.embed_query(query), k)
+
+    def get_by_ids(self, ids: Sequence[str], /) -> list[Document]:
+        """Return the chunks with the given IDs, skipping unknown ones."""
+        version = self._current()
+        rows = (version.row(chunk_id) for chunk_id in ids)
+        return [version.document(row) for row in rows if row is not None]
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: list[dict] | None = None,
+        **kwargs: Any,
+    ) -> list[str]:
+        """Not supported: the store is written by :func:`export_chroma`.
+
+        Raises:
+            TypeError: Always, since the store is read-only
+        """
+        raise TypeError("MmapVectorStore is read-only; re-export instead")
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: list[str],
+        embedding: Embeddings,
+        metadatas: list[dict] | None = None,
+        **kwargs: Any,
+    ) -> "MmapVectorStore":
+        """Embed ``texts`` and write them to ``kwargs["directory"]``."""
+        directory = kwargs["directory"]
+        ids = kwargs.get("ids") or [uuid.uuid4().hex for _ in texts]
+        vectors = np.asarray(embedding.embed_documents(texts), dtype=np.float32)
+        write_mmap_store(
+            directory, ids, texts, metadatas or [None] * len(texts), vectors
+        )
+        return cls(directory, embedding, kwargs.get("nprobe", 16))
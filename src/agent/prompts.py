@@ -58,3 +58,41 @@ DIRECT_RESPONSE_PROMPT = """You are a helpful AI assistant. Answer the user's qu
 Question: {question}
 
 Answer:"""
+
+CONDENSE_PROMPT = """Rewrite the user's latest question as a standalone question that can be understood without the conversation below.
+
+Instructions:
+1. Replace pronouns and references such as "it", "that service" or "the second one" with what they refer to
+2. Keep the user's wording, language and intent; do not answer the question
+3. If the question is already standalone, return it unchanged
+4. Return only the rewritten question
+
+Conversation summary:
+{summary}
+
+Recent conversation:
+{history}"""
+
+SUMMARY_PROMPT = """Summarise the conversation below for an assistant that will continue it.
+
+Instructions:
+1. Extend the existing summary with the new messages
+2. Keep the topics, AWS services, resources and decisions the user mentioned
+3. Be concise, a few sentences at most
+
+Existing summary:
+{summary}
+
+New messages:
+{history}
+
+Summary:"""
+
+BATCH_ROUTING_PROMPT = """You are a routing assistant that determines whether each of the user's questions is related to AWS documentation or not.
+
+The user sends a numbered list of questions. Classify every question into one of two categories:
+
+1. **aws_docs**: AWS services, features, configurations, best practices, troubleshooting or anything that would typically be found in AWS documentation
+2. **direct_response**: General knowledge, non-AWS topics, programming languages or frameworks in general, or topics outside of the AWS ecosystem
+
+Return exactly one decision per question, in the order of the list."""
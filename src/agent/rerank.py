@@ -0,0 +1,258 @@
+"""Rerank a large retrieval candidate set down to the few chunks worth prompting.
+
+Retrieval returns many more candidates than the prompt should hold. A reranker
+scores each ``(question, chunk)`` pair on CPU and the best ``top_n`` are kept:
+
+* :class:`LexicalReranker` (default) scores all candidates at once with numpy:
+  BM25 over the candidate set, plus the fraction of question terms a chunk
+  covers, blended with the original retrieval rank so a strong dense match is not
+  thrown away for lack of shared words.
+* :class:`CrossEncoderReranker` runs a small cross-encoder from
+  ``sentence-transformers`` in batches, when that optional package is installed.
+
+Scoring runs under a latency bound. If it does not finish in time, or fails, the
+candidates keep their retrieval order, so reranking can only cost ``timeout``.
+A late score cannot be interrupted, so scoring runs on a small fixed pool of
+workers, and while every worker is still busy new calls skip scoring instead of
+queueing behind it.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from collections.abc import Sequence
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from dataclasses import dataclass, field
+from typing import Protocol
+
+import numpy as np
+from langchain_core.documents import Document
+
+from agent.lexical import tokenize
+
+logger = logging.getLogger(__name__)
+
+
+class Reranker(Protocol):
+    """Scores candidate chunks for a question; higher is more relevant."""
+
+    def score(self, question: str, documents: Sequence[Document]) -> np.ndarray:
+        """Return one score per document."""
+        ...
+
+
+class LexicalReranker:
+    """Vectorised lexical-overlap scorer.
+
+    Args:
+        k1: BM25 term frequency saturation
+        b: BM25 length normalisation
+        prior_weight: Weight of the retrieval-rank prior against the lexical score
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75, prior_weight: float = 0.3):
+        """Create a scorer with the given BM25 parameters and rank prior weight."""
+        self.k1 = k1
+        self.b = b
+        self.prior_weight = prior_weight
+
+    def score(self, question: str, documents: Sequence[Document]) -> np.ndarray:
+        """Return one score in ``[0, 1]`` per document, in the given order."""
+        terms = sorted(set(tokenize(question)))
+        count = len(documents)
+        if not count:
+            return np.zeros(0, dtype=np.float32)
+        prior = 1.0 - np.arange(count, dtype=np.float32) / count
+        if not terms:
+            return prior
+
+        column = {term: i for i, term in enumerate(terms)}
+        frequencies = np.zeros((count, len(terms)), dtype=np.float32)
+        lengths = np.empty(count, dtype=np.float32)
+        for row, document in enumerate(documents):
+            tokens = tokenize(document.page_content)
+            lengths[row] = len(tokens)
+            for term, frequency in Counter(tokens).items():
+                if term in column:
+                    frequencies[row, column[term]] = frequency
+
+        document_frequency = (frequencies > 0).sum(axis=0)
+        idf = np.log1p((count - document_frequency + 0.5) / (document_frequency + 0.5))
+        norm = self.k1 * (1 - self.b + self.b * lengths / (lengths.mean() or 1.0))
+        bm25 = (idf * frequencies * (self.k1 + 1) / (frequencies + norm[:, None])).sum(
+            axis=1
+        )
+        coverage = (frequencies > 0).mean(axis=1)
+        lexical = 0.5 * bm25 / (bm25.max() or 1.0) + 0.5 * coverage
+        return (1 - self.prior_weight) * lexical + self.prior_weight * prior
+
+
+class CrossEncoderReranker:
+    """Cross-encoder scorer from the optional ``sentence-transformers`` package.
+
+    Args:
+        model_name: Hugging Face cross-encoder model
+        batch_size: Pairs scored per forward pass
+    """
+
+    def __init__(
+        self,
+        model_name: str = "cross-encoder/ms-marco-MiniLM-L-6-v2",
+        batch_size: int = 32,
+    ) -> None:
+        """Load the cross-encoder on CPU."""
+        from sentence_transformers import CrossEncoder
+
+        self.model = CrossEncoder(model_name, device="cpu")
+        self.batch_size = batch_size
+
+    def score(self, question: str, documents: Sequence[Document]) -> np.ndarray:
+        """Return one relevance score per document."""
+        pairs = [(question, document.page_content) for document in documents]
+        return np.asarray(
+            self.model.predict(pairs, batch_size=self.batch_size), dtype=np.float32
+        )
+
+
+@dataclass
+class RerankStats:
+    """Calls, fallbacks and scoring time of a reranker.
+
+    ``skipped`` counts the fallbacks that did not score at all because every
+    worker was still busy.
+    """
+
+    calls: int = 0
+    fallbacks: int = 0
+    skipped: int = 0
+    seconds: float = 0.0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def record(self, seconds: float, fallback: bool, skipped: bool = False) -> None:
+        """Record one rerank that took ``seconds``."""
+        with self._lock:
+            self.calls += 1
+            self.fallbacks += fallback
+            self.skipped += skipped
+            self.seconds += seconds
+
+    @property
+    def mean_latency(self) -> float:
+        """Return the mean rerank latency in seconds."""
+        return self.seconds / self.calls if self.calls else 0.0
+
+
+class BoundedReranker:
+    """Applies a reranker within a latency bound.
+
+    Args:
+        reranker: Scorer to apply
+        timeout: Seconds after which the retrieval order is used instead
+        workers: Scoring threads, up to four by default (scoring is CPU-bound); a
+            call that finds them all busy keeps the retrieval order without scoring
+    """
+
+    def __init__(
+        self,
+        reranker: Reranker,
+        timeout: float = 0.1,
+        workers: int = min(4, os.cpu_count() or 1),
+    ) -> None:
+        """Wrap ``reranker`` with a ``timeout`` in seconds."""
+        self.reranker = reranker
+        self.timeout = timeout
+        self.stats = RerankStats()
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix="agent-rerank")
+        # Held from submission until the score is computed, even after a timeout
+        self._idle = threading.BoundedSemaphore(workers)
+
+    def _submit(
+        self, question: str, documents: Sequence[Document]
+    ) -> "Future[np.ndarray] | None":
+        """Start scoring on an idle worker, or return ``None`` if all are busy."""
+        if not self._idle.acquire(blocking=False):
+            return None
+        try:
+            future = self._executor.submit(self.reranker.score, question, documents)
+        except BaseException:
+            self._idle.release()
+            raise
+        future.add_done_callback(lambda _: self._idle.release())
+        return future
+
+    def _select(
+        self, documents: Sequence[Document], scores: np.ndarray | None, top_n: int
+    ) -> list[Document]:
+        if scores is None:
+            return list(documents[:top_n])
+        # Stable, so ties keep the retrieval order
+        order = np.argsort(-scores, kind="stable")[:top_n]
+        return [documents[i] for i in order]
+
+    def rerank(
+        self, question: str, documents: Sequence[Document], top_n: int
+    ) -> list[Document]:
+        """Return the ``top_n`` best of ``documents``, given in retrieval order."""
+        start = time.perf_counter()
+        future = self._submit(question, documents)
+        if future is None:
+            self.stats.record(time.perf_counter() - start, True, skipped=True)
+            return self._select(documents, None, top_n)
+        try:
+            scores = future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            logger.warning(
+                "Rerank exceeded %.0f ms; keeping retrieval order", 1000 * self.timeout
+            )
+            scores = None
+        except Exception:
+            logger.exception("Rerank failed; keeping retrieval order")
+            scores = None
+        self.stats.record(time.perf_counter() - start, scores is None)
+        return self._select(documents, scores, top_n)
+
+    def close(self) -> None:
+        """Stop the scoring thread pool without waiting for a late score."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    async def arerank(
+        self, question: str, documents: Sequence[Document], top_n: int
+    ) -> list[Document]:
+        """Async variant of :meth:`rerank`."""
+        start = time.perf_counter()
+        future = self._submit(question, documents)
+        if future is None:
+            self.stats.record(time.perf_counter() - start, True, skipped=True)
+            return self._select(documents, None, top_n)
+        try:
+            scores = await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except TimeoutError:
+            logger.warning(
+                "Rerank exceeded %.0f ms; keeping retrieval order", 1000 * self.timeout
+            )
+            scores = None
+        except Exception:
+            logger.exception("Rerank failed; keeping retrieval order")
+            scores = None
+        self.stats.record(time.perf_counter() - start, scores is None)
+        return self._select(documents, scores, top_n)
+
+
+def create_reranker(model_name: str | None = None) -> Reranker:
+    """Return a cross-encoder for ``model_name``, or the lexical scorer.
+
+    Falls back to :class:`LexicalReranker` when no model is given or
+    ``sentence-transformers`` is not installed.
+    """
+    if model_name:
+        try:
+            return CrossEncoderReranker(model_name)
+        except ImportError:
+            logger.warning(
+                "sentence-transformers is not installed; using the lexical reranker"
+            )
+    return LexicalReranker()
@@ -0,0 +1,640 @@
+"""Process-wide registry of shared clients for the RAG agent.
+
+Chat models, embedding clients and vector stores are expensive to build: each chat
+model or embedding client owns its own HTTP connection pool, and opening a Chroma
+store loads its SQLite database and HNSW segments from disk. The registry in this
+module builds each of them lazily, once per configuration, and hands the same
+instance to every graph node for the lifetime of the process.
+
+The modules behind the caches, the BM25 index, the router and the reranker import
+numpy and are only imported when the first such resource is built, which keeps
+importing the graph cheap.
+"""
+
+import asyncio
+import atexit
+import logging
+import os
+import threading
+from collections.abc import Callable, Hashable, Sized
+from typing import TYPE_CHECKING, Any, TypeVar, cast
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.runnables import Runnable
+from langchain_core.vectorstores import VectorStore
+from pydantic import BaseModel
+
+from agent.admission import (
+    AdmissionController,
+    AdmissionPolicy,
+    AdmittedChatModel,
+    AdmittedEmbeddings,
+)
+from agent.context import TokenCounter, default_token_counter
+from agent.history import QueryRewriteCache
+
+if TYPE_CHECKING:
+    from agent.answer_cache import AnswerCache
+    from agent.configuration import Configuration
+    from agent.embedding_cache import EmbeddingStore
+    from agent.lexical import LexicalIndexFile
+    from agent.rerank import BoundedReranker
+    from agent.router import LocalRouter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHAT_MODEL = "openai:gpt-4o-mini"
+DEFAULT_EMBEDDING_MODEL = "text-embedding-3-small"
+DEFAULT_COLLECTION_NAME = "rag-chroma"
+DEFAULT_PERSIST_DIRECTORY = "./data/chromadb"
+DEFAULT_EMBEDDING_CACHE_PATH = "./data/embedding_cache.sqlite"
+
+T = TypeVar("T")
+
+ChatModelFactory = Callable[[str, float], BaseChatModel]
+EmbeddingsFactory = Callable[[str], Embeddings]
+VectorStoreFactory = Callable[[str, Embeddings, str], VectorStore]
+TokenCounterFactory = Callable[[str], TokenCounter]
+
+
+def _default_chat_model_factory(model: str, temperature: float) -> BaseChatModel:
+    from langchain.chat_models import init_chat_model
+
+    # Streamed completions only carry token usage when it is requested
+    return init_chat_model(model=model, temperature=temperature, stream_usage=True)
+
+
+def _default_embeddings_factory(model: str) -> Embeddings:
+    from langchain_openai import OpenAIEmbeddings
+
+    return OpenAIEmbeddings(model=model)
+
+
+def _default_vector_store_factory(
+    collection_name: str, embedding_function: Embeddings, persist_directory: str
+) -> VectorStore:
+    from langchain_chroma import Chroma
+
+    return Chroma(
+        collection_name=collection_name,
+        embedding_function=embedding_function,
+        persist_directory=persist_directory,
+    )
+
+
+def _vector_store_key(
+    collection_name: str,
+    persist_directory: str,
+    embedding_model: str,
+    backend: str,
+    nprobe: int,
+) -> Hashable:
+    if backend == "mmap":
+        return (
+            "mmap_store",
+            collection_name,
+            persist_directory,
+            embedding_model,
+            nprobe,
+        )
+    return ("vector_store", collection_name, persist_directory, embedding_model)
+
+
+def _close_clients(resource: Any, attributes: tuple[str, ...]) -> list[Any]:
+    """Close the sync HTTP clients held by a resource.
+
+    Returns:
+        list: Coroutines from clients whose ``close`` is async, for the caller to await
+    """
+    pending = []
+    for attribute in attributes:
+        client = getattr(resource, attribute, None)
+        # OpenAI resource wrappers (e.g. ``client.embeddings``) keep the real client
+        # in ``_client``.
+        client = getattr(client, "_client", client)
+        close = getattr(client, "close", None)
+        if not callable(close):
+            continue
+        try:
+            result = close()
+        except Exception:  # pragma: no cover - best effort during shutdown
+            logger.warning("Failed to close %s.%s", type(resource).__name__, attribute)
+            continue
+        if asyncio.iscoroutine(result):
+            pending.append(result)
+    return pending
+
+
+def _owns_close(resource: Any) -> bool:
+    """Return whether ``resource`` is one of ours with its own ``close``."""
+    from agent.embedding_cache import EmbeddingStore
+    from agent.rerank import BoundedReranker
+
+    return isinstance(resource, EmbeddingStore | BoundedReranker)
+
+
+def _unwrap(resource: Any) -> Any:
+    while getattr(resource, "wrapped", None) is not None:
+        resource = resource.wrapped
+    return resource
+
+
+_SYNC_CLIENT_ATTRIBUTES = ("root_client", "client", "http_client")
+_ASYNC_CLIENT_ATTRIBUTES = ("root_async_client", "async_client", "http_async_client")
+
+
+class ResourceRegistry:
+    """Lazily-initialised, thread- and asyncio-safe cache of shared clients.
+
+    Resources are keyed by their configuration (model name, temperature, collection
+    name, persist directory), so nodes asking for the same configuration share one
+    instance. Construction happens under a per-key lock: concurrent callers wait for
+    the first one to finish instead of building duplicates, while callers asking for
+    a different resource are not blocked. The async accessors build missing
+    resources in a worker thread so a cold Chroma load never stalls the event loop.
+
+    Args:
+        chat_model_factory: Builds a chat model from ``(model, temperature)``
+        embeddings_factory: Builds an embedding client from a model name
+        vector_store_factory: Builds a vector store from
+            ``(collection_name, embedding_function, persist_directory)``
+        embedding_cache_path: SQLite file of the persistent embedding cache wrapped
+            around every embedding client, or ``None`` to embed without caching
+        token_counter_factory: Builds a token counter from a model name
+        llm_admission: Coalescing and limits of the chat model calls, per model,
+            or ``None`` to call the models directly
+        embedding_admission: Coalescing and limits of the embedding calls, per
+            model, or ``None`` to call the clients directly
+    """
+
+    def __init__(
+        self,
+        chat_model_factory: ChatModelFactory | None = None,
+        embeddings_factory: EmbeddingsFactory | None = None,
+        vector_store_factory: VectorStoreFactory | None = None,
+        embedding_cache_path: str | None = None,
+        token_counter_factory: TokenCounterFactory | None = None,
+        llm_admission: AdmissionPolicy | None = None,
+        embedding_admission: AdmissionPolicy | None = None,
+    ) -> None:
+        """Create an empty registry, optionally with custom resource factories."""
+        self._chat_model_factory = chat_model_factory or _default_chat_model_factory
+        self._embeddings_factory = embeddings_factory or _default_embeddings_factory
+        self._vector_store_factory = (
+            vector_store_factory or _default_vector_store_factory
+        )
+        self._embedding_cache_path = embedding_cache_path
+        self._token_counter_factory = token_counter_factory or default_token_counter
+        self._admission = {"llm": llm_admission, "embeddings": embedding_admission}
+        self._lock = threading.Lock()
+        self._key_locks: dict[Hashable, threading.Lock] = {}
+        self._resources: dict[Hashable, Any] = {}
+
+    @classmethod
+    def from_configuration(cls, configuration: "Configuration") -> "ResourceRegistry":
+        """Create a registry of the default clients as ``configuration`` sets them."""
+        llm_admission = AdmissionPolicy(
+            max_concurrency=configuration.llm_max_concurrency or None,
+            requests_per_second=configuration.llm_requests_per_second or None,
+            burst=configuration.llm_burst or None,
+            coalesce=configuration.request_coalescing,
+        )
+        embedding_admission = AdmissionPolicy(
+            max_concurrency=configuration.embedding_max_concurrency or None,
+            requests_per_second=configuration.embedding_requests_per_second or None,
+            burst=configuration.embedding_burst or None,
+            coalesce=configuration.request_coalescing,
+        )
+        return cls(
+            embedding_cache_path=configuration.embedding_cache_path or None,
+            llm_admission=llm_admission if llm_admission.active else None,
+            embedding_admission=(
+                embedding_admission if embedding_admission.active else None
+            ),
+        )
+
+    def __len__(self) -> int:
+        """Return the number of resources built so far."""
+        return len(self._resources)
+
+    def __contains__(self, key: Hashable) -> bool:
+        """Return whether the resource for ``key`` has been built."""
+        return key in self._resources
+
+    def _get_or_create(self, key: Hashable, factory: Callable[[], T]) -> T:
+        resource = self._resources.get(key)
+        if resource is not None:
+            return cast(T, resource)
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            resource = self._resources.get(key)
+            if resource is None:
+                logger.debug("Initialising shared resource %r", key)
+                resource = factory()
+                self._resources[key] = resource
+        return cast(T, resource)
+
+    def get_chat_model(
+        self, model: str = DEFAULT_CHAT_MODEL, temperature: float = 0
+    ) -> BaseChatModel:
+        """Return the shared chat model for ``model`` and ``temperature``."""
+        return self._get_or_create(
+            ("chat_model", model, temperature),
+            lambda: self._chat_model(model, temperature),
+        )
+
+    def _chat_model(self, model: str, temperature: float) -> BaseChatModel:
+        chat_model = self._chat_model_factory(model, temperature)
+        admission = self.get_admission("llm", model)
+        if admission is None:
+            return chat_model
+        return AdmittedChatModel(
+            wrapped=chat_model, admission=admission, identity=f"{model}:{temperature}"
+        )
+
+    def get_admission(self, kind: str, model: str) -> AdmissionController | None:
+        """Return the admission controller shared by the ``kind`` calls of ``model``.
+
+        Args:
+            kind: ``llm`` or ``embeddings``
+            model: Model name
+
+        Returns:
+            AdmissionController | None: The controller, or ``None`` if the
+            registry has no admission policy for ``kind``
+        """
+        policy = self._admission[kind]
+        if policy is None:
+            return None
+        return self._get_or_create(
+            ("admission", kind, model),
+            lambda: AdmissionController(kind, model, policy),
+        )
+
+    def get_structured_model(
+        self,
+        schema: type[BaseModel],
+        model: str = DEFAULT_CHAT_MODEL,
+        temperature: float = 0,
+    ) -> Runnable:
+        """Return the shared chat model bound to a structured output ``schema``."""
+        return self._get_or_create(
+            ("structured_model", model, temperature, schema),
+            lambda: self.get_chat_model(model, temperature).with_structured_output(
+                schema
+            ),
+        )
+
+    def get_embeddings(self, model: str = DEFAULT_EMBEDDING_MODEL) -> Embeddings:
+        """Return the shared embedding client for ``model``."""
+        return self._get_or_create(
+            ("embeddings", model), lambda: self._embeddings(model)
+        )
+
+    def _embeddings(self, model: str) -> Embeddings:
+        embeddings = self._embeddings_factory(model)
+        admission = self.get_admission("embeddings", model)
+        if admission is not None:
+            embeddings = AdmittedEmbeddings(embeddings, admission)
+        if self._embedding_cache_path is None:
+            return embeddings
+        from agent.embedding_cache import CachedEmbeddings
+
+        return CachedEmbeddings(
+            embeddings, model, self.get_embedding_store(self._embedding_cache_path)
+        )
+
+    def get_embedding_store(
+        self, path: str = DEFAULT_EMBEDDING_CACHE_PATH
+    ) -> "EmbeddingStore":
+        """Return the shared on-disk embedding store at ``path``."""
+        from agent.embedding_cache import EmbeddingStore
+
+        return self._get_or_create(
+            ("embedding_store", path), lambda: EmbeddingStore(path)
+        )
+
+    def get_vector_store(
+        self,
+        collection_name: str = DEFAULT_COLLECTION_NAME,
+        persist_directory: str = DEFAULT_PERSIST_DIRECTORY,
+        embedding_model: str = DEFAULT_EMBEDDING_MODEL,
+        backend: str = "chroma",
+        nprobe: int = 16,
+    ) -> VectorStore:
+        """Return the shared vector store for a collection and persist directory.
+
+        Args:
+            collection_name: Name of the collection
+            persist_directory: Directory the indexer writes to
+            embedding_model: Model the collection was embedded with
+            backend: ``"chroma"`` for the Chroma collection, or ``"mmap"`` for its
+                memory-mapped export in ``persist_directory``
+            nprobe: IVF lists the ``"mmap"`` backend searches per query
+        """
+        key = _vector_store_key(
+            collection_name, persist_directory, embedding_model, backend, nprobe
+        )
+        if backend == "mmap":
+            return self._get_or_create(
+                key,
+                lambda: self._mmap_store(
+                    collection_name, persist_directory, embedding_model, nprobe
+                ),
+            )
+        return self._get_or_create(
+            key,
+            lambda: self._vector_store_factory(
+                collection_name,
+                self.get_embeddings(embedding_model),
+                persist_directory,
+            ),
+        )
+
+    def _mmap_store(
+        self,
+        collection_name: str,
+        persist_directory: str,
+        embedding_model: str,
+        nprobe: int,
+    ) -> VectorStore:
+        from agent.mmap_store import MmapVectorStore, mmap_store_path
+
+        return MmapVectorStore(
+            mmap_store_path(persist_directory, collection_name),
+            self.get_embeddings(embedding_model),
+            nprobe,
+        )
+
+    def get_token_counter(self, model: str = "gpt-4o-mini") -> TokenCounter:
+        """Return the shared token counter for ``model``."""
+        return self._get_or_create(
+            ("token_counter", model), lambda: self._token_counter_factory(model)
+        )
+
+    def get_lexical_index(
+        self, persist_directory: str = DEFAULT_PERSIST_DIRECTORY
+    ) -> "LexicalIndexFile":
+        """Return the shared BM25 index stored in ``persist_directory``."""
+        from agent.lexical import LEXICAL_INDEX_FILENAME, LexicalIndexFile
+
+        return self._get_or_create(
+            ("lexical_index", persist_directory),
+            lambda: LexicalIndexFile(
+                os.path.join(persist_directory, LEXICAL_INDEX_FILENAME)
+            ),
+        )
+
+    def get_reranker(
+        self, model: str | None = None, timeout: float = 0.1
+    ) -> "BoundedReranker":
+        """Return the shared reranker.
+
+        Args:
+            model: Cross-encoder model, or ``None`` for the lexical scorer
+            timeout: Seconds a rerank may take before the retrieval order is kept
+        """
+        from agent.rerank import BoundedReranker, create_reranker
+
+        return self._get_or_create(
+            ("reranker", model, timeout),
+            lambda: BoundedReranker(create_reranker(model), timeout),
+        )
+
+    def get_answer_cache(
+        self,
+        max_size: int = 1024,
+        ttl: float = 3600,
+        similarity_threshold: float | None = None,
+        persist_directory: str | None = DEFAULT_PERSIST_DIRECTORY,
+        scope: Hashable = None,
+    ) -> "AnswerCache":
+        """Return the shared answer cache for the given limits.
+
+        Args:
+            max_size: Maximum number of cached answers
+            ttl: Seconds an answer stays valid
+            similarity_threshold: Minimum cosine similarity for a semantic hit
+            persist_directory: Chroma directory whose index version invalidates
+                the cache
+            scope: Settings the answers depend on (see
+                ``Configuration.answer_scope``); each scope has its own cache
+        """
+        from agent.answer_cache import AnswerCache
+
+        return self._get_or_create(
+            (
+                "answer_cache",
+                max_size,
+                ttl,
+                similarity_threshold,
+                persist_directory,
+                scope,
+            ),
+            lambda: AnswerCache(
+                max_size=max_size,
+                ttl=ttl,
+                similarity_threshold=similarity_threshold,
+                persist_directory=persist_directory,
+            ),
+        )
+
+    def get_rewrite_cache(self, max_size: int = 1024) -> QueryRewriteCache:
+        """Return the shared cache of standalone question rewrites."""
+        return self._get_or_create(
+            ("rewrite_cache", max_size), lambda: QueryRewriteCache(max_size)
+        )
+
+    def get_local_router(
+        self,
+        embedding_model: str | None = DEFAULT_EMBEDDING_MODEL,
+        min_margin: float = 0.05,
+    ) -> "LocalRouter":
+        """Return the shared local router.
+
+        Args:
+            embedding_model: Embedding model for the centroid classifier, or
+                ``None`` to route on keywords only
+            min_margin: Minimum centroid similarity margin for a local decision
+        """
+        from agent.router import CentroidClassifier, LocalRouter
+
+        return self._get_or_create(
+            ("local_router", embedding_model, min_margin),
+            lambda: LocalRouter(
+                CentroidClassifier(
+                    self.get_embeddings(embedding_model), min_margin=min_margin
+                )
+                if embedding_model
+                else None
+            ),
+        )
+
+    async def aget_chat_model(
+        self, model: str = DEFAULT_CHAT_MODEL, temperature: float = 0
+    ) -> BaseChatModel:
+        """Async variant of :meth:`get_chat_model`."""
+        if ("chat_model", model, temperature) in self:
+            return self.get_chat_model(model, temperature)
+        return await asyncio.to_thread(self.get_chat_model, model, temperature)
+
+    async def aget_structured_model(
+        self,
+        schema: type[BaseModel],
+        model: str = DEFAULT_CHAT_MODEL,
+        temperature: float = 0,
+    ) -> Runnable:
+        """Async variant of :meth:`get_structured_model`."""
+        if ("structured_model", model, temperature, schema) in self:
+            return self.get_structured_model(schema, model, temperature)
+        return await asyncio.to_thread(
+            self.get_structured_model, schema, model, temperature
+        )
+
+    async def aget_embeddings(self, model: str = DEFAULT_EMBEDDING_MODEL) -> Embeddings:
+        """Async variant of :meth:`get_embeddings`."""
+        if ("embeddings", model) in self:
+            return self.get_embeddings(model)
+        return await asyncio.to_thread(self.get_embeddings, model)
+
+    async def aget_vector_store(
+        self,
+        collection_name: str = DEFAULT_COLLECTION_NAME,
+        persist_directory: str = DEFAULT_PERSIST_DIRECTORY,
+        embedding_model: str = DEFAULT_EMBEDDING_MODEL,
+        backend: str = "chroma",
+        nprobe: int = 16,
+    ) -> VectorStore:
+        """Async variant of :meth:`get_vector_store`."""
+        args = (collection_name, persist_directory, embedding_model, backend, nprobe)
+        if _vector_store_key(*args) in self:
+            return self.get_vector_store(*args)
+        return await asyncio.to_thread(self.get_vector_store, *args)
+
+    async def aget_reranker(
+        self, model: str | None = None, timeout: float = 0.1
+    ) -> "BoundedReranker":
+        """Async variant of :meth:`get_reranker`."""
+        if ("reranker", model, timeout) in self:
+            return self.get_reranker(model, timeout)
+        return await asyncio.to_thread(self.get_reranker, model, timeout)
+
+    def warm_up(
+        self,
+        chat_models: tuple[str, ...] = (DEFAULT_CHAT_MODEL,),
+        embedding_model: str = DEFAULT_EMBEDDING_MODEL,
+        collection_name: str = DEFAULT_COLLECTION_NAME,
+        persist_directory: str = DEFAULT_PERSIST_DIRECTORY,
+        backend: str = "chroma",
+        nprobe: int = 16,
+    ) -> None:
+        """Build the resources a configuration uses ahead of the first request.
+
+        Besides constructing the clients, this touches the Chroma collection so its
+        SQLite database and index segments are loaded before traffic arrives. The
+        arguments match :meth:`get_vector_store`, so the warmed store is the one
+        requests look up.
+        """
+        for model in chat_models:
+            self.get_chat_model(model)
+        vector_store = self.get_vector_store(
+            collection_name, persist_directory, embedding_model, backend, nprobe
+        )
+        if isinstance(vector_store, Sized):  # the memory-mapped store
+            chunks = len(vector_store)
+        elif callable(getattr(vector_store, "get", None)):  # Chroma
+            chunks = len(vector_store.get(include=[])["ids"])
+        else:
+            return
+        logger.info("Warmed up vector store %r with %d chunks", collection_name, chunks)
+
+    def warm_up_in_background(self, **kwargs: Any) -> threading.Thread:
+        """Run :meth:`warm_up` in a daemon thread and return the thread."""
+
+        def _run() -> None:
+            try:
+                self.warm_up(**kwargs)
+            except Exception:
+                logger.exception("Resource warm-up failed")
+
+        thread = threading.Thread(target=_run, name="agent-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+    async def awarm_up(self, **kwargs: Any) -> None:
+        """Async variant of :meth:`warm_up`."""
+        await asyncio.to_thread(self.warm_up, **kwargs)
+
+    def shutdown(self) -> None:
+        """Close the sync HTTP clients of every resource and forget them all."""
+        with self._lock:
+            resources = list(self._resources.values())
+            self._resources.clear()
+            self._key_locks.clear()
+
+        for resource in resources:
+            if _owns_close(resource):
+                resource.close()
+                continue
+            # Close the client behind wrappers such as ``CachedEmbeddings``
+            resource = _unwrap(resource)
+            for coroutine in _close_clients(resource, _SYNC_CLIENT_ATTRIBUTES):
+                coroutine.close()
+
+    async def ashutdown(self) -> None:
+        """Close the sync and async HTTP clients of every resource."""
+        with self._lock:
+            resources = list(self._resources.values())
+
+        pending = []
+        for resource in resources:
+            resource = _unwrap(resource)
+            pending.extend(_close_clients(resource, _ASYNC_CLIENT_ATTRIBUTES))
+        await asyncio.gather(*pending, return_exceptions=True)
+        self.shutdown()
+
+
+_registry: ResourceRegistry | None = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> ResourceRegistry:
+    """Return the process-wide resource registry.
+
+    The registry is created on first use from
+    :func:`agent.configuration.default_configuration`, so ``.env`` has been
+    loaded by the time its settings are read.
+    """
+    global _registry
+    registry = _registry
+    if registry is None:
+        from agent.configuration import default_configuration
+
+        with _registry_lock:
+            if _registry is None:
+                _registry = ResourceRegistry.from_configuration(default_configuration())
+            registry = _registry
+    return registry
+
+
+def set_registry(registry: ResourceRegistry | None) -> ResourceRegistry | None:
+    """Replace the process-wide resource registry.
+
+    Used by tests and benchmarks to inject fake models. The previous registry is
+    returned so it can be restored; ``None`` creates it again on next use.
+    """
+    global _registry
+    with _registry_lock:
+        previous = _registry
+        _registry = registry
+    return previous
+
+
+@atexit.register
+def _shutdown() -> None:
+    if _registry is not None:
+        _registry.shutdown()
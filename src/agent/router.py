@@ -0,0 +1,282 @@
+"""Local routing tier that answers obvious routing decisions without an LLM call.
+
+Two cheap classifiers run before the structured-output LLM router:
+
+1. A keyword matcher that recognises unambiguous AWS terms and service names.
+2. A nearest-centroid classifier over question embeddings, with one centroid per
+   route built from a small labelled seed set.
+
+Each tier either returns a decision or abstains. Only when both abstain does the
+routing node fall back to the LLM, and every decision is recorded in
+:class:`RouterStats` so the fallback rate and decision latency can be reported.
+"""
+
+import asyncio
+import re
+import threading
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Literal
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+Route = Literal["aws_docs", "direct_response"]
+
+# Terms that only make sense in an AWS context. Ambiguous words such as "lambda",
+# "bucket" or "instance", and short or common ones such as "amazon", "alb", "arn"
+# or "ami", are left to the centroid classifier. Services named after everyday
+# words ("aurora", "redshift", "bedrock", "sns", "kinesis") only match with their
+# "Amazon" prefix; "AWS" anywhere in the question matches on its own.
+AWS_TERMS = (
+    "aws",
+    "ec2",
+    "s3",
+    "rds",
+    "vpc",
+    "iam",
+    "cloudwatch",
+    "cloudformation",
+    "cloudfront",
+    "cloudtrail",
+    "dynamodb",
+    "ebs",
+    "efs",
+    "elb",
+    "nlb",
+    "ecs",
+    "eks",
+    "fargate",
+    "sqs",
+    "route 53",
+    "route53",
+    "elastic beanstalk",
+    "elasticache",
+    "sagemaker",
+    "amazon aurora",
+    "amazon bedrock",
+    "amazon kinesis",
+    "amazon redshift",
+    "amazon sns",
+    "step functions",
+    "api gateway",
+    "secrets manager",
+    "kms",
+    "boto3",
+    "security group",
+    "security groups",
+    "nat gateway",
+)
+
+ROUTING_EXAMPLES: dict[Route, tuple[str, ...]] = {
+    "aws_docs": (
+        "How do I configure an S3 bucket?",
+        "What is AWS Lambda and how does it work?",
+        "How to set up EC2 instances?",
+        "How do I attach a policy to an IAM role?",
+        "What are security groups in a VPC?",
+        "How do I create a CloudWatch alarm?",
+        "How do I take a snapshot of an RDS database?",
+        "How does Lambda concurrency work?",
+        "What instance types are available for compute workloads?",
+        "How do I deploy a CloudFormation stack?",
+        "How do I make a bucket public?",
+        "How do I increase the timeout of my function?",
+    ),
+    "direct_response": (
+        "What's the weather today?",
+        "How to cook pasta?",
+        "What is Python programming?",
+        "Explain machine learning concepts",
+        "What is the capital of France?",
+        "Write a poem about the sea",
+        "What is a lambda function in Python?",
+        "How do I reverse a list in JavaScript?",
+        "Who wrote Pride and Prejudice?",
+        "What is the difference between TCP and UDP?",
+        "Recommend a good book to read",
+        "How many days are in a leap year?",
+    ),
+}
+
+_AWS_PATTERN = re.compile(
+    r"\b(?:" + "|".join(re.escape(term) for term in AWS_TERMS) + r")\b",
+    re.IGNORECASE,
+)
+
+
+def match_aws_terms(question: str) -> Route | None:
+    """Return ``aws_docs`` if ``question`` names an unambiguous AWS term."""
+    return "aws_docs" if _AWS_PATTERN.search(question) else None
+
+
+@dataclass
+class RouterStats:
+    """Counts and latency of routing decisions by the tier that made them."""
+
+    decisions: Counter[str] = field(default_factory=Counter)
+    latency: Counter[str] = field(default_factory=Counter)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def record(self, tier: str, seconds: float) -> None:
+        """Record a decision made by ``tier`` that took ``seconds``."""
+        with self._lock:
+            self.decisions[tier] += 1
+            self.latency[tier] += seconds
+
+    @property
+    def total(self) -> int:
+        """Return the number of routing decisions made."""
+        return sum(self.decisions.values())
+
+    @property
+    def fallback_rate(self) -> float:
+        """Return the fraction of decisions that needed the LLM."""
+        return self.decisions["llm"] / self.total if self.total else 0.0
+
+    def mean_latency(self, tier: str | None = None) -> float:
+        """Return the mean decision latency in seconds, overall or for one tier."""
+        if tier is None:
+            count, seconds = self.total, sum(self.latency.values())
+        else:
+            count, seconds = self.decisions[tier], self.latency[tier]
+        return seconds / count if count else 0.0
+
+
+class CentroidClassifier:
+    """Nearest-centroid classifier over question embeddings.
+
+    The centroids are the normalised mean embeddings of the labelled examples and
+    are computed on first use. A question is classified only when its cosine
+    similarity to the best centroid beats the runner-up by at least ``min_margin``.
+
+    Args:
+        embeddings: Embedding client used for the examples and the questions
+        examples: Labelled example questions per route
+        min_margin: Minimum similarity margin for a confident decision
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        examples: dict[Route, tuple[str, ...]] = ROUTING_EXAMPLES,
+        min_margin: float = 0.05,
+    ) -> None:
+        """Create a classifier; centroids are built lazily."""
+        self.embeddings = embeddings
+        self.examples = examples
+        self.min_margin = min_margin
+        self._labels: list[Route] = list(examples)
+        self._centroids: np.ndarray | None = None
+        self._lock = threading.Lock()
+
+    def _fit(self, vectors: list[list[float]]) -> np.ndarray:
+        matrix = np.asarray(vectors, dtype=np.float32)
+        centroids = []
+        offset = 0
+        for label in self._labels:
+            count = len(self.examples[label])
+            centroid = matrix[offset : offset + count].mean(axis=0)
+            centroids.append(centroid / (np.linalg.norm(centroid) or 1.0))
+            offset += count
+        return np.stack(centroids)
+
+    def _texts(self) -> list[str]:
+        return [text for label in self._labels for text in self.examples[label]]
+
+    def centroids(self) -> np.ndarray:
+        """Return the centroid matrix, embedding the examples on first use."""
+        if self._centroids is None:
+            with self._lock:
+                if self._centroids is None:
+                    vectors = self.embeddings.embed_documents(self._texts())
+                    self._centroids = self._fit(vectors)
+        return self._centroids
+
+    async def acentroids(self) -> np.ndarray:
+        """Async variant of :meth:`centroids`.
+
+        The first call fits the centroids in a worker thread under the same lock,
+        so concurrent first calls embed the examples once.
+        """
+        if self._centroids is None:
+            return await asyncio.to_thread(self.centroids)
+        return self._centroids
+
+    def _decide(self, centroids: np.ndarray, embedding: list[float]) -> Route | None:
+        vector = np.asarray(embedding, dtype=np.float32)
+        vector /= np.linalg.norm(vector) or 1.0
+        scores = centroids @ vector
+        order = np.argsort(scores)[::-1]
+        if scores[order[0]] - scores[order[1]] < self.min_margin:
+            return None
+        return self._labels[int(order[0])]
+
+    def classify(self, question: str) -> Route | None:
+        """Return the route for ``question``, or ``None`` if not confident."""
+        centroids = self.centroids()
+        return self._decide(centroids, self.embeddings.embed_query(question))
+
+    async def aclassify(self, question: str) -> Route | None:
+        """Async variant of :meth:`classify`."""
+        centroids, embedding = await asyncio.gather(
+            self.acentroids(), self.embeddings.aembed_query(question)
+        )
+        return self._decide(centroids, embedding)
+
+    async def aclassify_embedding(self, embedding: list[float]) -> Route | None:
+        """Return the route for an already embedded question."""
+        return self._decide(await self.acentroids(), embedding)
+
+
+class LocalRouter:
+    """Keyword matcher followed by a centroid classifier.
+
+    Args:
+        classifier: Centroid classifier, or ``None`` to only use keywords
+    """
+
+    def __init__(self, classifier: CentroidClassifier | None = None) -> None:
+        """Create a router and its statistics."""
+        self.classifier = classifier
+        self.stats = RouterStats()
+
+    def route(self, question: str) -> tuple[Route | None, str]:
+        """Return the local decision for ``question`` and the tier that made it.
+
+        Returns:
+            tuple: The route, or ``None`` when every local tier abstains, and the
+                tier name (``keyword``, ``centroid`` or ``llm`` on abstention)
+        """
+        decision = match_aws_terms(question)
+        if decision is not None:
+            return decision, "keyword"
+        if self.classifier is not None:
+            decision = self.classifier.classify(question)
+            if decision is not None:
+                return decision, "centroid"
+        return None, "llm"
+
+    async def aroute(self, question: str) -> tuple[Route | None, str]:
+        """Async variant of :meth:`route`."""
+        decision = match_aws_terms(question)
+        if decision is not None:
+            return decision, "keyword"
+        if self.classifier is not None:
+            decision = await self.classifier.aclassify(question)
+            if decision is not None:
+                return decision, "centroid"
+        return None, "llm"
+
+    async def aroute_embedded(
+        self, question: str, embedding: list[float]
+    ) -> tuple[Route | None, str]:
+        """Variant of :meth:`aroute` for a question that is already embedded."""
+        decision = match_aws_terms(question)
+        if decision is not None:
+            return decision, "keyword"
+        if self.classifier is not None:
+            decision = await self.classifier.aclassify_embedding(embedding)
+            if decision is not None:
+                return decision, "centroid"
+        return None, "llm"
@@ -11,16 +11,32 @@ from langchain_core.messages import AnyMessage
 from langgraph.graph.message import add_messages
 from pydantic import BaseModel
 
+from agent.chunks import ChunkRef
+
 
 class AgentState(BaseModel):
     """State model for the RAG agent workflow.
 
     Attributes:
-        messages: List of conversation messages with automatic message handling
+        messages: List of conversation messages with automatic message handling,
+            trimmed to a window once the thread grows long
+        question: Standalone form of the latest question, rewritten from a
+            follow-up when needed; the nodes answer this question
+        summary: Summary of the messages trimmed from the thread, if any
         documents: Retrieved documents from vector store, if any
+        chunk_refs: References to the retrieved chunks, stored instead of
+            ``documents`` when ``chunk_refs`` is enabled
         route_decision: Decision from routing node about whether to use RAG or direct response
+        cache_hit: Whether the answer for the latest question came from the answer cache
+        context_stats: Chunk and token counts of the RAG context before and after
+            context assembly, for the latest answer
     """
 
     messages: Annotated[list[AnyMessage], add_messages]
+    question: str | None = None
+    summary: str | None = None
     documents: list[Document] | None = None
+    chunk_refs: list[ChunkRef] | None = None
     route_decision: Literal["aws_docs", "direct_response"] | None = None
+    cache_hit: bool = False
+    context_stats: dict[str, int] | None = None
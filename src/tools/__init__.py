@@ -0,0 +1 @@
+"""Offline tools for building the agent's document index."""
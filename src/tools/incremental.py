@@ -0,0 +1,171 @@
+"""Incremental indexing with stable chunk IDs and a manifest of indexed content.
+
+Every chunk gets an ID derived from its source URL, ``start_index`` and a hash of
+its content, so re-splitting an unchanged page yields the same IDs. A manifest
+stored next to the Chroma collection records, per source, the hash of the page
+and the IDs of its chunks. An update then:
+
+* skips pages whose hash is unchanged without splitting or embedding them,
+* embeds and adds only chunks whose ID is not indexed yet,
+* deletes chunks whose page changed, and all chunks of sources that were removed.
+
+Sources whose fetch failed keep their existing chunks. The update itself is run
+by the indexing pipeline in ``tools.pipeline``.
+"""
+
+import hashlib
+import json
+import os
+from collections.abc import Iterable
+from dataclasses import dataclass, field
+
+from langchain_core.documents import Document
+
+MANIFEST_FILENAME = "index_manifest.json"
+MANIFEST_VERSION = 1
+
+
+def content_hash(text: str) -> str:
+    """Return the SHA-256 hex digest of ``text``."""
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def page_hash(page: Document) -> str:
+    """Return a hash of a page's text and metadata."""
+    return content_hash(
+        json.dumps([page.page_content, page.metadata], sort_keys=True, default=str)
+    )
+
+
+def chunk_id(source: str, start_index: int, content: str) -> str:
+    """Return the stable ID of a chunk."""
+    return content_hash(f"{source}\n{start_index}\n{content_hash(content)}")[:32]
+
+
+@dataclass
+class SourceEntry:
+    """What is indexed for one source URL."""
+
+    page_hash: str
+    chunk_ids: list[str] = field(default_factory=list)
+
+
+class IndexManifest:
+    """Record of the pages and chunks currently in the vector store.
+
+    Args:
+        path: JSON file the manifest is loaded from and saved to
+        sources: Indexed sources by URL
+    """
+
+    def __init__(self, path: str, sources: dict[str, SourceEntry] | None = None):
+        """Create a manifest backed by ``path``."""
+        self.path = path
+        self.sources = sources or {}
+
+    @classmethod
+    def for_directory(cls, persist_directory: str) -> "IndexManifest":
+        """Load the manifest stored in ``persist_directory``, or an empty one."""
+        path = os.path.join(persist_directory, MANIFEST_FILENAME)
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return cls(path)
+        if data.get("version") != MANIFEST_VERSION:
+            return cls(path)
+        return cls(
+            path,
+            {
+                source: SourceEntry(entry["page_hash"], entry["chunk_ids"])
+                for source, entry in data["sources"].items()
+            },
+        )
+
+    @property
+    def chunk_count(self) -> int:
+        """Return the number of indexed chunks."""
+        return sum(len(entry.chunk_ids) for entry in self.sources.values())
+
+    def save(self) -> None:
+        """Write the manifest atomically."""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        data = {
+            "version": MANIFEST_VERSION,
+            "sources": {
+                source: {"page_hash": entry.page_hash, "chunk_ids": entry.chunk_ids}
+                for source, entry in sorted(self.sources.items())
+            },
+        }
+        with open(f"{self.path}.tmp", "w") as f:
+            json.dump(data, f)
+        os.replace(f"{self.path}.tmp", self.path)
+
+
+def _id(chunk: Document) -> str:
+    if chunk.id is None:
+        raise ValueError("Chunk has no ID; call assign_chunk_ids first")
+    return chunk.id
+
+
+def assign_chunk_ids(chunks: Iterable[Document]) -> list[Document]:
+    """Set the stable ID of every chunk, dropping duplicates within a page."""
+    seen = set()
+    unique = []
+    for chunk in chunks:
+        chunk.id = chunk_id(
+            chunk.metadata.get("source", ""),
+            chunk.metadata.get("start_index", -1),
+            chunk.page_content,
+        )
+        if chunk.id not in seen:
+            seen.add(chunk.id)
+            unique.append(chunk)
+    return unique
+
+
+def diff_page(
+    entry: SourceEntry | None, digest: str, chunks: Iterable[Document]
+) -> tuple[list[Document], list[str], SourceEntry]:
+    """Compare the chunks of a changed page with what is indexed for its source.
+
+    Args:
+        entry: Manifest entry of the source, or ``None`` for a new source
+        digest: Hash of the page, see :func:`page_hash`
+        chunks: Chunks of the page
+
+    Returns:
+        tuple: Chunks to add, IDs to delete and the new manifest entry
+    """
+    chunks = assign_chunk_ids(chunks)
+    new_ids = [_id(chunk) for chunk in chunks]
+    old_ids = set(entry.chunk_ids) if entry is not None else set()
+    return (
+        [chunk for chunk in chunks if chunk.id not in old_ids],
+        sorted(old_ids.difference(new_ids)),
+        SourceEntry(digest, new_ids),
+    )
+
+
+def diff_sources(
+    manifest: IndexManifest,
+    seen: dict[str, SourceEntry],
+    sources: Iterable[str],
+    failed: Iterable[str] = (),
+) -> list[str]:
+    """Settle the indexed sources that were not seen in this run.
+
+    Sources that failed to fetch but are still wanted are copied into ``seen``;
+    the chunks of every other unseen source are returned for deletion.
+    """
+    sources = set(sources)
+    failed = set(failed)
+    to_delete = []
+    for source, entry in manifest.sources.items():
+        if source in seen:
+            continue
+        if source in failed and source in sources:
+            seen[source] = entry
+        else:
+            to_delete.extend(entry.chunk_ids)
+    return to_delete
@@ -2,13 +2,59 @@
 
 This script loads AWS documentation from predefined URLs, splits the content into chunks,
 and stores them in a ChromaDB vector store for retrieval by the RAG agent.
+
+Pages are fetched concurrently through a raw HTML cache (see ``tools.fetcher``), so
+reruns only download pages that changed and a URL that keeps failing is reported
+and skipped instead of aborting the run.
+
+Indexing is incremental (see ``tools.incremental``): chunks have stable IDs and a
+manifest records what is indexed, so only new or changed chunks are embedded and
+stale ones are deleted. Pass ``--full`` to rebuild the collection from scratch.
+Embeddings go through the persistent cache in ``agent.embedding_cache``, which the
+agent shares, so even a full rebuild only pays for text it has never embedded.
+
+Fetching, splitting, embedding and upserting run as a streaming pipeline of
+concurrent stages connected by bounded queues (see ``tools.pipeline``), and the
+time each stage spent working is reported at the end. A BM25 index of the chunks
+(see ``agent.lexical``) is rebuilt next to the Chroma data for hybrid retrieval.
+With ``--export-mmap`` the collection is also exported to the memory-mapped vector
+store of ``agent.mmap_store``, which the agent searches with ``VECTOR_STORE=mmap``;
+once an export exists, it is refreshed whenever the collection changes.
+Stage timings are also recorded as ``agent.metrics`` histograms; pass
+``--metrics-output`` to write them in Prometheus (e.g. for node_exporter's textfile
+collector), OpenMetrics or JSON lines format.
 """
 
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+import argparse
+import os
+
+import chromadb
 from langchain_chroma import Chroma
-from langchain_community.document_loaders import WebBaseLoader
 from langchain_openai import OpenAIEmbeddings
+from rich.console import Console
 from rich.progress import Progress
+from rich.table import Table
+
+from agent.answer_cache import write_index_version
+from agent.embedding_cache import (
+    DEFAULT_EMBEDDING_CACHE_PATH,
+    CachedEmbeddings,
+    EmbeddingStore,
+)
+from agent.lexical import LEXICAL_INDEX_FILENAME
+from agent.metrics import EXPORTERS, get_metrics, timed
+from agent.mmap_store import (
+    FORMAT_VERSION,
+    current_version,
+    export_chroma,
+    export_format,
+    mmap_store_path,
+)
+from tools.fetcher import DEFAULT_CACHE_DIR
+from tools.incremental import IndexManifest
+from tools.pipeline import build_lexical_index, run_pipeline
+
+PERSIST_DIRECTORY = "./data/chromadb"
 
 urls = [
     ## 1. AWS core concepts
@@ -95,40 +141,150 @@ urls = [
     "https://docs.aws.amazon.com/personalize/latest/dg/getting-started.html",
 ]
 
-docs = []
-with Progress() as progress:
-    load_task = progress.add_task("Loading documents from URLs...", total=len(urls))
 
-    for url in urls:
-        loader = WebBaseLoader(url)
-        docs.append(loader.load())
-        progress.update(load_task, advance=1)
+def parse_args() -> argparse.Namespace:
+    """Parse the indexer's command line options."""
+    parser = argparse.ArgumentParser(description="Build the AWS documentation index.")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument(
+        "--requests-per-second",
+        type=float,
+        default=4.0,
+        help="Maximum request rate per host",
+    )
+    parser.add_argument("--retries", type=int, default=3)
+    parser.add_argument(
+        "--max-age",
+        type=float,
+        default=0.0,
+        help="Reuse cached pages younger than this many seconds without revalidating",
+    )
+    parser.add_argument(
+        "--embedding-cache",
+        default=DEFAULT_EMBEDDING_CACHE_PATH,
+        help="SQLite file of the persistent embedding cache",
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=None,
+        help="Processes parsing and splitting pages (default: one per CPU)",
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=10, help="Chunks per embedding request"
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Drop the collection and re-embed every chunk",
+    )
+    parser.add_argument(
+        "--export-mmap",
+        action="store_true",
+        help="Also export the collection to the memory-mapped vector store "
+        "(an existing export is always kept up to date)",
+    )
+    parser.add_argument(
+        "--metrics-output", help="Write the indexer metrics to this file"
+    )
+    parser.add_argument(
+        "--metrics-format", choices=sorted(EXPORTERS), default="prometheus"
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    """Fetch, split and embed the documentation into the vector store."""
+    args = parse_args()
+    console = Console()
 
-docs_list = [item for sublist in docs for item in sublist]
+    embedding_model = CachedEmbeddings(
+        OpenAIEmbeddings(model="text-embedding-3-small"),
+        "text-embedding-3-small",
+        EmbeddingStore(args.embedding_cache),
+    )
+    client = chromadb.PersistentClient(PERSIST_DIRECTORY)
+    vector_store = Chroma(
+        collection_name="rag-chroma",
+        embedding_function=embedding_model,
+        client=client,
+    )
 
-splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
-    model_name="gpt-4o-mini",
-    chunk_size=1200,
-    chunk_overlap=200,
-    add_start_index=True,
-)
+    manifest = IndexManifest.for_directory(PERSIST_DIRECTORY)
+    # Chunks indexed without a manifest have random IDs and cannot be diffed
+    if args.full or (not manifest.sources and vector_store.get(limit=1)["ids"]):
+        vector_store.reset_collection()
+        manifest = IndexManifest(manifest.path)
 
-doc_splits = splitter.split_documents(docs_list)
+    with Progress(console=console) as progress:
+        tasks = {
+            "fetch": progress.add_task("Fetching pages...", total=len(urls)),
+            "split": progress.add_task("Splitting pages...", total=len(urls)),
+            "embed": progress.add_task("Embedding chunks...", total=None),
+            "upsert": progress.add_task("Adding chunks to vector store...", total=None),
+        }
+        result = run_pipeline(
+            urls,
+            # Looked up after any reset, which replaces the collection
+            client.get_collection("rag-chroma"),
+            embedding_model,
+            manifest,
+            fetch_options={
+                "cache_dir": args.cache_dir,
+                "concurrency": args.concurrency,
+                "requests_per_second": args.requests_per_second,
+                "retries": args.retries,
+                "max_age": args.max_age,
+            },
+            processes=args.processes,
+            batch_size=args.batch_size,
+            on_progress=lambda stage, count: (
+                progress.update(tasks[stage], advance=count) if stage in tasks else None
+            ),
+        )
 
-embedding_model = OpenAIEmbeddings(model="text-embedding-3-small")
-vector_store = Chroma(
-    collection_name="rag-chroma",
-    embedding_function=embedding_model,
-    persist_directory="./data/chromadb",
-)
+    for url, error in result.failed.items():
+        console.print(f"[red]Failed to fetch {url}: {error}")
 
-with Progress() as progress:
-    task = progress.add_task(
-        "Adding documents to vector store...", total=len(doc_splits)
+    table = Table("Stage", "Items", "Busy (s)", title="Indexer stages")
+    for stage, stats in result.stages.items():
+        table.add_row(stage, str(stats.items), f"{stats.busy:.2f}")
+    table.add_row("total", "", f"{result.seconds:.2f}", style="bold")
+    console.print(table)
+    console.print(
+        f"{result.unchanged} unchanged pages, {result.added} chunks added, "
+        f"{result.deleted} chunks deleted"
     )
+    console.print(f"Embedding cache: {embedding_model.summary()}")
+
+    lexical_path = os.path.join(PERSIST_DIRECTORY, LEXICAL_INDEX_FILENAME)
+    if result.changed or not os.path.exists(lexical_path):
+        with timed("build_lexical_index"):
+            lexical_index = build_lexical_index(vector_store, lexical_path)
+        console.print(f"BM25 index: {len(lexical_index)} chunks")
+
+    mmap_path = mmap_store_path(PERSIST_DIRECTORY, "rag-chroma")
+    # An existing export is refreshed even without --export-mmap, so replicas
+    # searching it never fall behind the collection and the BM25 index. An export
+    # in an older format is rewritten, since the agent can no longer open it
+    exported = current_version(mmap_path) is not None
+    outdated = export_format(mmap_path) != FORMAT_VERSION
+    if (args.export_mmap or exported) and (result.changed or outdated):
+        with timed("export_mmap"):
+            count = export_chroma(vector_store, mmap_path, "text-embedding-3-small")
+        console.print(f"Memory-mapped store: {count} chunks")
+
+    if result.changed:
+        # Let running agents know the index changed so cached answers are dropped
+        write_index_version(PERSIST_DIRECTORY)
+
+    if args.metrics_output:
+        exporter = EXPORTERS[args.metrics_format]()
+        with open(args.metrics_output, "w") as f:
+            f.write(exporter.render(get_metrics()))
+        console.print(f"Metrics written to {args.metrics_output}")
+
 
-    batch_size = 10
-    for i in range(0, len(doc_splits), batch_size):
-        batch = doc_splits[i : i + batch_size]
-        vector_store.add_documents(batch)
-        progress.update(task, advance=len(batch))
+if __name__ == "__main__":
+    main()
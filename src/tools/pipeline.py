@@ -0,0 +1,340 @@
+"""Streaming fetch → split → embed → upsert pipeline for the indexer.
+
+Each stage runs concurrently with the others and hands its output to the next one
+through a bounded queue, so a page is being embedded while later pages are still
+downloading and memory stays flat however many URLs are indexed:
+
+1. **fetch** downloads pages through :func:`tools.fetcher.aiter_pages`.
+2. **split** parses and splits pages in a process pool, because BeautifulSoup and
+   the tiktoken splitter are CPU-bound. Pages whose hash matches the manifest are
+   not split at all.
+3. **embed** diffs each page against the manifest (see ``tools.incremental``) and
+   embeds the new chunks in batches of ``batch_size``.
+4. **upsert** writes each batch and its vectors to the Chroma collection and
+   deletes the stale chunks, so writes overlap with the next embedding request.
+
+Once the collection changed, :func:`build_lexical_index` rebuilds the BM25 index
+stored next to it.
+
+Every stage records how many items it handled and how long it spent working, not
+counting time spent waiting on its neighbours, both in :class:`PipelineResult` and
+in the ``indexer_stage_*`` metrics of ``agent.metrics``.
+"""
+
+import asyncio
+import functools
+import os
+import time
+from collections.abc import Callable, Iterator, Sequence
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any
+
+from chromadb import Collection
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from agent.lexical import BM25Index
+from agent.metrics import record_stage
+from tools.fetcher import aiter_pages, parse_page
+from tools.incremental import (
+    IndexManifest,
+    diff_page,
+    diff_sources,
+    page_hash,
+)
+
+STAGES = ("fetch", "split", "embed", "upsert")
+
+
+@dataclass
+class StageStats:
+    """Work done by one pipeline stage.
+
+    Attributes:
+        stage: Name of the stage in the metrics
+        items: Number of items the stage produced
+        busy: Seconds spent working, summed over the stage's workers
+    """
+
+    stage: str = ""
+    items: int = 0
+    busy: float = 0.0
+
+    def count(self, items: int = 1) -> None:
+        """Count ``items`` produced outside a :meth:`timed` block."""
+        self.items += items
+        record_stage(self.stage, None, items)
+
+    @contextmanager
+    def timed(self, items: int = 1) -> Iterator[None]:
+        """Count ``items`` and add the time spent in the block to :attr:`busy`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.busy += elapsed
+            self.items += items
+            record_stage(self.stage, elapsed, items)
+
+
+@dataclass
+class PageChunks:
+    """A parsed page and its chunks, or ``chunks=None`` if it did not change."""
+
+    source: str
+    page_hash: str
+    chunks: list[Document] | None
+
+
+@dataclass
+class EmbeddedBatch:
+    """New chunks with their vectors, and the IDs of stale chunks to delete."""
+
+    chunks: list[Document]
+    vectors: list[list[float]]
+    to_delete: list[str]
+
+
+@dataclass
+class PipelineResult:
+    """Summary of a pipeline run.
+
+    Attributes:
+        manifest: Manifest of the updated index, already saved
+        stages: Statistics per stage
+        added: Chunks embedded and added
+        deleted: Chunks deleted
+        unchanged: Pages skipped because their hash did not change
+        failed: Error of each URL that could not be fetched
+        seconds: Wall time of the run
+    """
+
+    manifest: IndexManifest
+    stages: dict[str, StageStats] = field(
+        default_factory=lambda: {stage: StageStats(stage) for stage in STAGES}
+    )
+    added: int = 0
+    deleted: int = 0
+    unchanged: int = 0
+    failed: dict[str, str] = field(default_factory=dict)
+    seconds: float = 0.0
+
+    @property
+    def changed(self) -> bool:
+        """Return whether the index was modified."""
+        return bool(self.added or self.deleted)
+
+
+@functools.lru_cache
+def _tiktoken_splitter(
+    chunk_size: int, chunk_overlap: int
+) -> RecursiveCharacterTextSplitter:
+    return RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+        model_name="gpt-4o-mini",
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        add_start_index=True,
+    )
+
+
+def split_page(
+    url: str,
+    html: str,
+    known_hash: str | None,
+    chunk_size: int = 1200,
+    chunk_overlap: int = 200,
+) -> PageChunks:
+    """Parse and split a page unless its hash equals ``known_hash``.
+
+    Runs in a worker process; the splitter is built once per process.
+    """
+    page = parse_page(url, html)
+    digest = page_hash(page)
+    if digest == known_hash:
+        return PageChunks(url, digest, None)
+    splitter = _tiktoken_splitter(chunk_size, chunk_overlap)
+    return PageChunks(url, digest, splitter.split_documents([page]))
+
+
+async def arun_pipeline(
+    urls: Sequence[str],
+    collection: Collection,
+    embeddings: Embeddings,
+    manifest: IndexManifest,
+    fetch_options: dict[str, Any] | None = None,
+    split: Callable[[str, str, str | None], PageChunks] = split_page,
+    processes: int | None = None,
+    batch_size: int = 10,
+    queue_size: int = 16,
+    on_progress: Callable[[str, int], None] | None = None,
+) -> PipelineResult:
+    """Bring ``collection`` up to date with ``urls`` and save the new manifest.
+
+    Args:
+        urls: Every page that should be indexed
+        collection: Chroma collection to update
+        embeddings: Embedding model of the collection
+        manifest: What is indexed now
+        fetch_options: Keyword arguments for :func:`tools.fetcher.aiter_pages`
+        split: Parses and splits a page given its URL, HTML and indexed hash; must
+            be picklable when ``processes`` is not ``0``
+        processes: Size of the split process pool, ``None`` for one per CPU, or
+            ``0`` to split in threads
+        batch_size: Number of chunks embedded per request
+        queue_size: Capacity of the queues between stages
+        on_progress: Called with a stage name and item count as work completes
+    """
+    result = PipelineResult(manifest=IndexManifest(manifest.path))
+    stats = result.stages
+    pages: asyncio.Queue[tuple[str, str] | None] = asyncio.Queue(queue_size)
+    splits: asyncio.Queue[PageChunks | None] = asyncio.Queue(queue_size)
+    batches: asyncio.Queue[EmbeddedBatch | None] = asyncio.Queue(queue_size)
+    workers = processes if processes is not None else os.cpu_count() or 1
+    executor: Executor = (
+        ProcessPoolExecutor(workers)
+        if workers
+        else ThreadPoolExecutor(thread_name_prefix="indexer-split")
+    )
+    split_workers = max(workers, 1)
+    loop = asyncio.get_running_loop()
+
+    def progress(stage: str, count: int) -> None:
+        if on_progress is not None and count:
+            on_progress(stage, count)
+
+    async def fetch() -> None:
+        fetched = aiter_pages(urls, **(fetch_options or {}))
+        while True:
+            with stats["fetch"].timed(0):
+                page = await anext(fetched, None)
+            if page is None:
+                break
+            if page.html is None:
+                result.failed[page.url] = page.error or "unknown error"
+            else:
+                stats["fetch"].count()
+                await pages.put((page.url, page.html))
+            progress("fetch", 1)
+        for _ in range(split_workers):
+            await pages.put(None)
+
+    async def split_pages() -> None:
+        while (item := await pages.get()) is not None:
+            url, html = item
+            entry = manifest.sources.get(url)
+            with stats["split"].timed():
+                chunks = await loop.run_in_executor(
+                    executor, split, url, html, entry.page_hash if entry else None
+                )
+            await splits.put(chunks)
+            progress("split", 1)
+
+    async def split_all() -> None:
+        await asyncio.gather(*(split_pages() for _ in range(split_workers)))
+        await splits.put(None)
+
+    async def embed_batch(chunks: list[Document], to_delete: list[str]) -> None:
+        vectors = []
+        if chunks:
+            with stats["embed"].timed(len(chunks)):
+                vectors = await embeddings.aembed_documents(
+                    [chunk.page_content for chunk in chunks]
+                )
+            progress("embed", len(chunks))
+        await batches.put(EmbeddedBatch(chunks, vectors, to_delete))
+
+    async def embed() -> None:
+        pending: list[Document] = []
+        to_delete: list[str] = []
+        while (page := await splits.get()) is not None:
+            entry = manifest.sources.get(page.source)
+            if page.chunks is None and entry is not None:  # unchanged page
+                result.manifest.sources[page.source] = entry
+                result.unchanged += 1
+                continue
+            added, deleted, result.manifest.sources[page.source] = diff_page(
+                entry, page.page_hash, page.chunks or []
+            )
+            pending.extend(added)
+            to_delete.extend(deleted)
+            while len(pending) >= batch_size:
+                await embed_batch(pending[:batch_size], to_delete)
+                pending, to_delete = pending[batch_size:], []
+
+        to_delete.extend(
+            diff_sources(manifest, result.manifest.sources, urls, result.failed)
+        )
+        if pending or to_delete:
+            await embed_batch(pending, to_delete)
+        await batches.put(None)
+
+    def write(batch: EmbeddedBatch) -> None:
+        if batch.to_delete:
+            collection.delete(ids=batch.to_delete)
+        if batch.chunks:
+            collection.upsert(
+                ids=[str(chunk.id) for chunk in batch.chunks],
+                embeddings=batch.vectors,  # type: ignore[arg-type]
+                documents=[chunk.page_content for chunk in batch.chunks],
+                metadatas=[chunk.metadata for chunk in batch.chunks],
+            )
+
+    async def upsert() -> None:
+        while (batch := await batches.get()) is not None:
+            with stats["upsert"].timed(len(batch.chunks)):
+                await asyncio.to_thread(write, batch)
+            result.added += len(batch.chunks)
+            result.deleted += len(batch.to_delete)
+            progress("upsert", len(batch.chunks))
+
+    start = time.perf_counter()
+    try:
+        async with asyncio.TaskGroup() as group:
+            for stage in (fetch(), split_all(), embed(), upsert()):
+                group.create_task(stage)
+    finally:
+        executor.shutdown(cancel_futures=True)
+    result.seconds = time.perf_counter() - start
+
+    result.manifest.save()
+    return result
+
+
+def run_pipeline(
+    urls: Sequence[str],
+    collection: Collection,
+    embeddings: Embeddings,
+    manifest: IndexManifest,
+    **kwargs: Any,
+) -> PipelineResult:
+    """Sync wrapper around :func:`arun_pipeline`."""
+    return asyncio.run(arun_pipeline(urls, collection, embeddings, manifest, **kwargs))
+
+
+def build_lexical_index(
+    vector_store: Chroma, path: str, page_size: int = 1000
+) -> BM25Index:
+    """Build the BM25 index of every chunk in ``vector_store`` and save it to ``path``.
+
+    Chunks are read from the collection one page at a time.
+    """
+
+    def chunks() -> Iterator[tuple[str, str]]:
+        offset = 0
+        while True:
+            page = vector_store.get(
+                include=["documents"], limit=page_size, offset=offset
+            )
+            if not page["ids"]:
+                return
+            yield from zip(page["ids"], page["documents"], strict=True)
+            offset += len(page["ids"])
+
+    index = BM25Index.build(chunks())
+    index.save(path)
+    return index
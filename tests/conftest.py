@@ -1,6 +1,28 @@
 import pytest
 
+from agent.resources import ResourceRegistry, set_registry
+from benchmarks.fakes import FakeEmbeddings, build_synthetic_store, fake_registry
+
 
 @pytest.fixture(scope="session")
 def anyio_backend():
     return "asyncio"
+
+
+@pytest.fixture
+def fake_resources(tmp_path):
+    """Serve fake models and a small synthetic Chroma store to the graph nodes."""
+    persist_directory = str(tmp_path / "chromadb")
+    build_synthetic_store(persist_directory, FakeEmbeddings(), count=40)
+    registry = fake_registry(persist_directory)
+    previous = set_registry(registry)
+    yield registry
+    set_registry(previous)
+
+
+@pytest.fixture
+def empty_registry():
+    """Swap in a registry with no resources built, restoring the original after."""
+    previous = set_registry(ResourceRegistry())
+    yield
+    set_registry(previous)
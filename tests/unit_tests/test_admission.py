@@ -0,0 +1,149 @@
+import asyncio
+import threading
+import time
+from typing import ClassVar
+
+import pytest
+from langchain_core.messages import HumanMessage
+
+from agent.admission import (
+    AdmissionController,
+    AdmissionPolicy,
+    ConcurrencyLimit,
+    TokenBucket,
+)
+from agent.graph import build_graph
+from agent.metrics import MetricsRegistry, set_metrics
+from agent.resources import set_registry
+from benchmarks.fakes import FakeChatModel, fake_registry
+
+
+@pytest.fixture
+def metrics():
+    registry = MetricsRegistry()
+    previous = set_metrics(registry)
+    yield registry
+    set_metrics(previous)
+
+
+class CountingChatModel(FakeChatModel):
+    calls: ClassVar[list[str]] = []
+    release: ClassVar[asyncio.Event | None] = None
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls.append(str(messages[-1].content))
+        if self.release is not None:
+            await self.release.wait()
+        async for chunk in super()._astream(messages, stop, run_manager, **kwargs):
+            yield chunk
+
+
+def test_token_bucket_spaces_requests_after_the_burst() -> None:
+    now = [0.0]
+    bucket = TokenBucket(rate=10, burst=2, clock=lambda: now[0])
+
+    assert [bucket.reserve() for _ in range(4)] == pytest.approx([0, 0, 0.1, 0.2])
+    now[0] = 1.0
+    assert bucket.reserve() == 0
+
+
+@pytest.mark.anyio
+async def test_concurrency_limit_is_shared_by_threads_and_tasks() -> None:
+    limit = ConcurrencyLimit(2)
+    active = peak = 0
+    lock = threading.Lock()
+
+    def hold() -> None:
+        nonlocal active, peak
+        with lock:
+            active += 1
+            peak = max(peak, active)
+        time.sleep(0.02)
+        with lock:
+            active -= 1
+
+    def in_thread() -> None:
+        limit.acquire()
+        try:
+            hold()
+        finally:
+            limit.release()
+
+    async def in_task() -> None:
+        await limit.aacquire()
+        try:
+            await asyncio.to_thread(hold)
+        finally:
+            limit.release()
+
+    threads = [threading.Thread(target=in_thread) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    await asyncio.gather(*(in_task() for _ in range(4)))
+    for thread in threads:
+        thread.join()
+
+    assert peak == 2 and limit.active == 0
+
+
+@pytest.mark.anyio
+async def test_followers_fall_back_when_the_leader_is_cancelled(metrics) -> None:
+    admission = AdmissionController("llm", "fake", AdmissionPolicy())
+    started = asyncio.Event()
+
+    async def slow() -> str:
+        started.set()
+        await asyncio.sleep(0.05)
+        return "done"
+
+    leader = asyncio.create_task(admission.acall("key", slow))
+    await started.wait()
+    follower = asyncio.create_task(admission.acall("key", slow))
+    await asyncio.sleep(0)
+    leader.cancel()
+
+    assert await follower == "done"
+    assert len(admission.flights) == 0
+
+
+@pytest.mark.anyio
+async def test_identical_questions_share_one_generation(
+    tmp_path, fake_resources, metrics
+) -> None:
+    CountingChatModel.calls = []
+    CountingChatModel.release = asyncio.Event()
+    registry = fake_registry(
+        str(tmp_path / "chromadb"),
+        chat_model_factory=lambda latency: CountingChatModel(latency=latency),
+        admission=AdmissionPolicy(max_concurrency=4, requests_per_second=100),
+    )
+    coalesced = metrics.counter(
+        "agent_upstream_coalesced",
+        "Upstream model calls served by an identical call in flight",
+        ["kind", "model"],
+    )
+    previous = set_registry(registry)
+    try:
+        compiled = build_graph()
+        question = {"messages": [HumanMessage(content="How do I use AWS Lambda?")]}
+        runs = asyncio.gather(*(compiled.ainvoke(question) for _ in range(6)))
+        # Hold the leader's generation until every other run has joined its flight
+        async with asyncio.timeout(5):
+            while coalesced.value(kind="llm", model="gpt-4o-mini") < 5:
+                await asyncio.sleep(0.001)
+        CountingChatModel.release.set()
+        results = await runs
+    finally:
+        CountingChatModel.release = None
+        set_registry(previous)
+
+    answers = {result["messages"][-1].content for result in results}
+    assert len(answers) == 1 and "AWS Lambda" in answers.pop()
+    assert len(CountingChatModel.calls) == 1
+    assert coalesced.value(kind="llm", model="gpt-4o-mini") == 5
+    requests = metrics.gauge(
+        "agent_upstream_requests",
+        "Upstream model calls waiting for admission or in flight",
+        ["kind", "model", "state"],
+    )
+    assert requests.value(kind="llm", model="gpt-4o-mini", state="in_flight") == 0
@@ -0,0 +1,93 @@
+import pytest
+from langchain_core.messages import HumanMessage
+
+from agent.answer_cache import (
+    AnswerCache,
+    CachedAnswer,
+    normalise_question,
+    write_index_version,
+)
+from agent.graph import create_workflow
+from benchmarks.fakes import FakeEmbeddings
+
+
+def _answer(text: str = "Lambda runs code") -> CachedAnswer:
+    return CachedAnswer(answer=text, route_decision="direct_response")
+
+
+def test_normalised_questions_share_an_entry() -> None:
+    cache = AnswerCache()
+    cache.store("What is AWS Lambda?", _answer())
+
+    assert normalise_question("  what is aws lambda ") == "what is aws lambda"
+    assert cache.lookup("what is AWS lambda") is not None
+    assert cache.lookup("what is S3?") is None
+    assert (cache.stats.hits, cache.stats.misses) == (1, 1)
+
+
+def test_semantic_match_above_threshold() -> None:
+    embeddings = FakeEmbeddings()
+    cache = AnswerCache(similarity_threshold=0.7)
+    question = "What is AWS Lambda?"
+    cache.store(question, _answer(), embeddings.embed_query(question))
+
+    near = "what is lambda aws"
+    assert cache.lookup(near, embeddings.embed_query(near)) is not None
+    far = "How do I create an S3 bucket?"
+    assert cache.lookup(far, embeddings.embed_query(far)) is None
+    assert cache.stats.semantic_hits == 1
+
+
+def test_lru_eviction_and_ttl(monkeypatch) -> None:
+    now = [0.0]
+    monkeypatch.setattr("agent.answer_cache.time.monotonic", lambda: now[0])
+    cache = AnswerCache(max_size=2, ttl=10)
+    cache.store("a", _answer())
+    cache.store("b", _answer())
+    cache.lookup("a")
+    cache.store("c", _answer())
+
+    assert cache.lookup("b") is None
+    assert cache.stats.evictions == 1
+
+    now[0] = 11.0
+    assert cache.lookup("a") is None
+    assert cache.stats.expirations == 1
+
+
+def test_expired_nearest_entry_falls_back_to_the_next(monkeypatch) -> None:
+    now = [0.0]
+    monkeypatch.setattr("agent.answer_cache.time.monotonic", lambda: now[0])
+    cache = AnswerCache(ttl=10, similarity_threshold=0.8)
+    cache.store("old", _answer("old"), [1.0, 0.0])
+    now[0] = 8.0
+    cache.store("new", _answer("new"), [0.9, 0.3])
+
+    now[0] = 11.0
+    hit = cache.lookup("query", [1.0, 0.05])
+    assert hit is not None and hit.answer == "new"
+    assert cache.stats.expirations == 1
+
+
+def test_index_rebuild_invalidates(tmp_path) -> None:
+    write_index_version(str(tmp_path))
+    cache = AnswerCache(persist_directory=str(tmp_path), version_check_interval=0)
+    cache.store("a", _answer())
+    assert cache.lookup("a") is not None
+
+    write_index_version(str(tmp_path))
+    assert cache.lookup("a") is None
+    assert cache.stats.invalidations == 1
+
+
+@pytest.mark.anyio
+async def test_graph_serves_repeat_questions_from_cache(fake_resources) -> None:
+    graph = create_workflow(answer_cache=True).compile()
+
+    first = await graph.ainvoke({"messages": [HumanMessage(content="What is AWS S3?")]})
+    second = await graph.ainvoke({"messages": [HumanMessage(content="what is aws s3")]})
+
+    assert first["cache_hit"] is False
+    assert second["cache_hit"] is True
+    assert second["messages"][-1].content == first["messages"][-1].content
+    assert second["documents"] == first["documents"]
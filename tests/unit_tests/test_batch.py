@@ -0,0 +1,101 @@
+import pytest
+
+from agent.batch import abatch_answer, batch_answer
+from agent.metrics import MetricsRegistry, set_metrics
+from agent.resources import set_registry
+from benchmarks.fakes import FakeChatModel, _last_human_text, fake_registry
+
+QUESTIONS = [
+    "What is AWS Lambda?",
+    "How do I cook pasta?",
+    "How do I encrypt an S3 bucket?",
+    "Explain recursion",
+]
+
+
+class FailingChatModel(FakeChatModel):
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        if "boom" in _last_human_text(messages):
+            raise RuntimeError("model unavailable")
+        async for chunk in super()._astream(messages, stop, run_manager, **kwargs):
+            yield chunk
+
+
+def test_batch_answers_every_question(fake_resources) -> None:
+    metrics = MetricsRegistry()
+    previous = set_metrics(metrics)
+    try:
+        results = batch_answer(QUESTIONS, {"configurable": {"local_router": False}})
+    finally:
+        set_metrics(previous)
+
+    assert [result.question for result in results] == QUESTIONS
+    assert all(result.ok and result.answer for result in results)
+    assert [result.route_decision for result in results] == [
+        "aws_docs",
+        "direct_response",
+        "aws_docs",
+        "direct_response",
+    ]
+    assert len(results[0].documents) == 10 and results[1].documents is None
+    decisions = metrics.counter(
+        "agent_route_decisions", "Routing decisions", ["tier", "decision"]
+    )
+    assert decisions.value(tier="llm_batch", decision="aws_docs") == 2
+
+
+@pytest.mark.anyio
+async def test_failures_stay_with_their_item(tmp_path, fake_resources) -> None:
+    registry = fake_registry(
+        str(tmp_path / "chromadb"),
+        chat_model_factory=lambda latency: FailingChatModel(latency=latency),
+    )
+    previous = set_registry(registry)
+    try:
+        results = [
+            result
+            async for result in abatch_answer(
+                ["What is AWS Lambda? boom", *QUESTIONS], max_concurrency=2
+            )
+        ]
+    finally:
+        set_registry(previous)
+
+    failed = [result for result in results if not result.ok]
+    assert len(results) == 5
+    assert [result.index for result in failed] == [0]
+    assert failed[0].error == "RuntimeError: model unavailable"
+
+
+def test_batch_warms_the_answer_cache(fake_resources) -> None:
+    config = {"configurable": {"answer_cache": True}}
+
+    first = batch_answer(QUESTIONS, config)
+    second = batch_answer(QUESTIONS, config)
+
+    assert not any(result.cache_hit for result in first)
+    assert all(result.cache_hit for result in second)
+    assert [result.answer for result in second] == [result.answer for result in first]
+
+    # Answers from another chat model are not served from this model's cache
+    other = {"configurable": {"answer_cache": True, "chat_model": "openai:gpt-4o"}}
+    assert not any(result.cache_hit for result in batch_answer(QUESTIONS, other))
+
+
+def test_batch_routing_shows_in_the_router_stats(fake_resources) -> None:
+    batch_answer(QUESTIONS)
+
+    stats = fake_resources.get_local_router().stats
+    assert stats.total == len(QUESTIONS)
+
+
+def test_a_failing_cache_store_still_answers(fake_resources, monkeypatch) -> None:
+    from agent.answer_cache import AnswerCache
+
+    def broken_store(self, *args, **kwargs) -> None:
+        raise OSError("disk full")
+
+    monkeypatch.setattr(AnswerCache, "store", broken_store)
+    results = batch_answer(QUESTIONS, {"configurable": {"answer_cache": True}})
+
+    assert all(result.ok and result.answer for result in results)
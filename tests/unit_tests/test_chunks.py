@@ -0,0 +1,51 @@
+from dataclasses import replace
+
+from langchain_core.messages import HumanMessage
+
+from agent.chunks import ChunkRef, load_chunks, to_refs
+from agent.configuration import default_configuration
+from agent.context import RANK_KEY
+from agent.graph import build_graph
+
+QUESTION = {"messages": [HumanMessage(content="What is AWS Lambda?")]}
+
+
+def test_refs_round_trip_through_the_store(fake_resources) -> None:
+    vector_store = fake_resources.get_vector_store()
+    documents = vector_store.similarity_search("lambda", k=3)
+    documents[0].metadata[RANK_KEY] = 2
+
+    refs = to_refs(documents)
+    assert refs is not None
+    assert refs[0].rank == 2 and refs[0].source == documents[0].metadata["source"]
+
+    missing = ChunkRef(id="missing")
+    loaded = load_chunks(vector_store, [missing, *reversed(refs)])
+    assert [doc.id for doc in loaded] == [doc.id for doc in reversed(documents)]
+    assert loaded[-1].metadata[RANK_KEY] == 2
+
+
+def test_state_keeps_refs_and_generation_loads_content(fake_resources) -> None:
+    full = build_graph().invoke(QUESTION)
+    slim = build_graph(replace(default_configuration(), chunk_refs=True)).invoke(
+        QUESTION
+    )
+
+    assert slim["documents"] is None
+    assert [ref.id for ref in slim["chunk_refs"]] == [
+        doc.id for doc in full["documents"]
+    ]
+    assert slim["context_stats"] == full["context_stats"]
+
+
+def test_rerank_loads_referenced_candidates(fake_resources) -> None:
+    compiled = build_graph(
+        replace(default_configuration(), chunk_refs=True, rerank=True)
+    )
+
+    result = compiled.invoke(
+        QUESTION, {"configurable": {"rerank_candidates": 12, "rerank_top_n": 3}}
+    )
+
+    assert len(result["chunk_refs"]) == 3
+    assert result["context_stats"]["documents_before"] == 3
@@ -1,9 +1,127 @@
+import os
+import subprocess
+import sys
+from dataclasses import replace
+
+import pytest
+from langchain_core.messages import HumanMessage
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.graph.state import CompiledStateGraph
 from langgraph.pregel import Pregel
 
-from agent.graph import graph
+from agent.configuration import Configuration, default_configuration
+from agent.graph import build_graph, graph
 
 
 def test_placeholder() -> None:
     # TODO: You can add actual unit tests
     # for your graph and other logic here.
     assert isinstance(graph, Pregel)
+
+
+def test_configuration_is_read_from_env(monkeypatch) -> None:
+    monkeypatch.setenv("RETRIEVAL_K", "4")
+    monkeypatch.setenv("RERANK_ENABLED", "true")
+    monkeypatch.setenv("ANSWER_CACHE_SIMILARITY_THRESHOLD", "0.9")
+    monkeypatch.setenv("MAX_CONCURRENCY", "none")
+
+    configuration = Configuration.from_env()
+
+    assert configuration.retrieval_k == 4
+    assert configuration.rerank is True
+    assert configuration.answer_cache_similarity_threshold == 0.9
+    assert configuration.max_concurrency is None
+
+
+def test_configurable_overrides_defaults() -> None:
+    configuration = Configuration.from_runnable_config(
+        {"configurable": {"retrieval_k": "3", "retriever": "dense", "other": 1}}
+    )
+
+    assert configuration.retrieval_k == 3
+    assert configuration.retriever == "dense"
+    assert Configuration.from_runnable_config(None) is default_configuration()
+    assert "rerank" not in configuration.as_configurable()
+
+
+@pytest.mark.parametrize(
+    "changes",
+    [
+        {"context_token_budget": 1000},
+        {"rerank": True},
+        {"rerank_candidates": 20},
+        {"rerank_top_n": 3},
+        {"rerank_model": "cross-encoder/ms-marco-MiniLM-L-6-v2"},
+        {"vector_store": "mmap"},
+        {"chunk_refs": True},
+    ],
+)
+def test_answer_scope_separates_answer_settings(changes) -> None:
+    configuration = default_configuration()
+    assert replace(configuration, **changes).answer_scope != configuration.answer_scope
+
+
+def test_nodes_read_runtime_configuration(fake_resources) -> None:
+    compiled = build_graph(replace(default_configuration(), rerank=True))
+    inputs = {"messages": [HumanMessage(content="What is AWS Lambda?")]}
+
+    result = compiled.invoke(
+        inputs,
+        {"configurable": {"rerank_candidates": 12, "rerank_top_n": 3}},
+    )
+    assert len(result["documents"]) == 3
+
+    result = build_graph().invoke(inputs, {"configurable": {"retrieval_k": 4}})
+    assert len(result["documents"]) == 4
+
+
+def test_max_concurrency_keeps_the_compiled_graph(fake_resources) -> None:
+    compiled = build_graph(
+        replace(default_configuration(), max_concurrency=2),
+        checkpointer=InMemorySaver(),
+    )
+    assert isinstance(compiled, CompiledStateGraph)
+    assert compiled.config["max_concurrency"] == 2
+
+    config = {"configurable": {"thread_id": "limited"}}
+    compiled.invoke({"messages": [HumanMessage(content="What is AWS Lambda?")]}, config)
+    state = compiled.get_state(config)
+    assert state.values["messages"][-1].content
+    assert state.config["configurable"]["thread_id"] == "limited"
+
+
+def test_warm_up_uses_the_configured_resources(fake_resources, monkeypatch) -> None:
+    calls = []
+    monkeypatch.setattr(
+        fake_resources, "warm_up_in_background", lambda **kwargs: calls.append(kwargs)
+    )
+    configuration = replace(
+        default_configuration(),
+        warm_up=True,
+        chat_model="other-chat-model",
+        collection_name="other",
+        vector_store="mmap",
+    )
+
+    build_graph(configuration)
+
+    assert calls == [
+        {
+            "chat_models": ("other-chat-model",),
+            "embedding_model": configuration.embedding_model,
+            "collection_name": "other",
+            "persist_directory": configuration.persist_directory,
+            "backend": "mmap",
+            "nprobe": configuration.ann_nprobe,
+        }
+    ]
+
+
+def test_import_does_not_build_the_graph() -> None:
+    code = (
+        "import sys, agent.graph as g; "
+        "assert 'graph' not in vars(g); "
+        "assert 'numpy' not in sys.modules and 'dotenv' not in sys.modules"
+    )
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)}
+    subprocess.run([sys.executable, "-c", code], check=True, env=env)
@@ -0,0 +1,83 @@
+import pytest
+from langchain_core.documents import Document
+from langchain_core.messages import HumanMessage
+
+from agent.context import (
+    ApproximateTokenCounter,
+    assemble_context,
+    merge_chunks,
+    rank_documents,
+)
+from agent.graph import graph
+
+PAGE = " ".join(f"word{i}" for i in range(400))
+
+
+def _chunk(start: int, end: int, source: str = "page") -> Document:
+    return Document(
+        page_content=PAGE[start:end], metadata={"source": source, "start_index": start}
+    )
+
+
+def test_overlapping_and_adjacent_chunks_are_merged() -> None:
+    merged, folded = merge_chunks(
+        [_chunk(600, 900), _chunk(0, 300), _chunk(200, 500), _chunk(500, 600)]
+    )
+
+    assert folded == 3
+    assert [d.page_content for d in merged] == [PAGE[0:900]]
+
+
+def test_separate_pages_and_gaps_are_kept_apart() -> None:
+    merged, folded = merge_chunks(
+        [_chunk(0, 300), _chunk(400, 600), _chunk(0, 300, source="other")]
+    )
+
+    assert folded == 0
+    assert len(merged) == 3
+
+
+def test_near_duplicates_are_dropped() -> None:
+    documents = rank_documents(
+        [_chunk(0, 1000, "a"), _chunk(0, 1000, "b"), _chunk(1500, 2000, "c")]
+    )
+    packed, stats = assemble_context(documents, None, ApproximateTokenCounter())
+
+    assert [d.metadata["source"] for d in packed] == ["a", "c"]
+    assert stats.duplicates == 1
+
+
+def test_budget_keeps_best_ranked_chunks() -> None:
+    counter = ApproximateTokenCounter()
+    documents = [_chunk(0, 400, "a"), _chunk(0, 400, "b"), _chunk(1000, 1800, "c")]
+    documents[0].page_content = "alpha " * 20
+    documents[1].page_content = "beta " * 80
+    rank_documents([documents[2], documents[0], documents[1]])
+
+    packed, stats = assemble_context(documents, 300, counter)
+
+    assert [d.metadata["source"] for d in packed] == ["a", "b", "c"]
+    assert stats.truncated
+    assert stats.tokens_after <= 300 < stats.tokens_before
+    assert packed[2].page_content == documents[2].page_content
+    assert len(packed[1].page_content) < len(documents[1].page_content)
+
+
+@pytest.mark.anyio
+async def test_graph_records_context_stats(fake_resources) -> None:
+    res = await graph.ainvoke(
+        {"messages": [HumanMessage(content="What is AWS Lambda?")]}
+    )
+
+    stats = res["context_stats"]
+    assert stats["documents_before"] == len(res["documents"]) == 10
+    assert 0 < stats["tokens_after"] <= stats["tokens_before"]
+
+
+def test_truncation_keeps_the_best_ranked_part_of_a_merged_chunk() -> None:
+    documents = rank_documents([_chunk(1000, 1500), _chunk(0, 300), _chunk(300, 1000)])
+
+    packed, stats = assemble_context(documents, 100, ApproximateTokenCounter())
+
+    assert stats.merged == 2 and stats.truncated
+    assert packed[0].page_content == PAGE[1000:1400]
@@ -0,0 +1,84 @@
+import sqlite3
+
+import pytest
+
+from agent.embedding_cache import CachedEmbeddings, EmbeddingStore
+from agent.resources import ResourceRegistry
+from benchmarks.fakes import FakeEmbeddings
+
+
+class CountingEmbeddings(FakeEmbeddings):
+    def __init__(self) -> None:
+        super().__init__()
+        self.calls: list[list[str]] = []
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        self.calls.append(texts)
+        return super().embed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        self.calls.append([text])
+        return super().embed_query(text)
+
+
+def test_only_uncached_texts_are_embedded(tmp_path) -> None:
+    wrapped = CountingEmbeddings()
+    cached = CachedEmbeddings(wrapped, "fake", EmbeddingStore(str(tmp_path / "e.db")))
+
+    first = cached.embed_documents(["lambda", "s3", "lambda"])
+    second = cached.embed_documents(["s3", "ec2"])
+
+    assert wrapped.calls == [["lambda", "s3"], ["ec2"]]
+    assert first[0] == first[2] == cached.embed_query("lambda")
+    assert second[0] == first[1]
+    assert cached.stats.hit_rate == pytest.approx(2 / 5)
+    assert cached.stats.bytes_saved == len("s3") + len("lambda")
+
+
+def test_vectors_persist_as_float32(tmp_path) -> None:
+    path = str(tmp_path / "e.db")
+    vector = CachedEmbeddings(
+        FakeEmbeddings(), "fake", EmbeddingStore(path)
+    ).embed_query("What is AWS Lambda?")
+
+    wrapped = CountingEmbeddings()
+    reopened = CachedEmbeddings(wrapped, "fake", EmbeddingStore(path))
+    assert reopened.embed_query("What is AWS Lambda?") == vector
+    assert wrapped.calls == []
+    assert reopened.stats.disk_hits == 1
+
+    other_model = CachedEmbeddings(wrapped, "other", EmbeddingStore(path))
+    other_model.embed_query("What is AWS Lambda?")
+    assert len(wrapped.calls) == 1
+
+    (blob,) = sqlite3.connect(path).execute("SELECT vector FROM embeddings").fetchone()
+    assert len(blob) == 4 * len(vector)
+
+
+def test_memory_is_bounded() -> None:
+    cached = CachedEmbeddings(FakeEmbeddings(), "fake", max_entries=2)
+    cached.embed_documents(["a", "b", "c"])
+    assert len(cached) == 2
+
+
+@pytest.mark.anyio
+async def test_async_path_shares_the_cache(tmp_path) -> None:
+    wrapped = CountingEmbeddings()
+    cached = CachedEmbeddings(wrapped, "fake", EmbeddingStore(str(tmp_path / "e.db")))
+
+    vector = await cached.aembed_query("lambda")
+    assert await cached.aembed_documents(["lambda"]) == [vector]
+    assert cached.embed_query("lambda") == vector
+    assert cached.stats.hits == 2
+
+
+def test_registry_wraps_embeddings(tmp_path) -> None:
+    registry = ResourceRegistry(
+        embeddings_factory=lambda model: FakeEmbeddings(),
+        embedding_cache_path=str(tmp_path / "e.db"),
+    )
+    embeddings = registry.get_embeddings()
+    assert isinstance(embeddings, CachedEmbeddings)
+    embeddings.embed_query("lambda")
+    assert embeddings.summary()["disk_entries"] == 1
+    registry.shutdown()
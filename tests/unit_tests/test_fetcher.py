@@ -0,0 +1,144 @@
+import asyncio
+import hashlib
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+from tools.fetcher import FetchResult, HtmlCache, aiter_pages, parse_page
+
+PAGES = Path(__file__).parent / "fixtures" / "pages"
+
+
+def fetch_pages(urls: list[str], **kwargs) -> list[FetchResult]:
+    """Fetch ``urls`` and return their results in the order of ``urls``."""
+
+    async def fetch() -> dict[str, FetchResult]:
+        return {result.url: result async for result in aiter_pages(urls, **kwargs)}
+
+    results = asyncio.run(fetch())
+    return [results[url] for url in urls]
+
+
+class FixtureServer(ThreadingHTTPServer):
+    """Serve fixture pages with ETags, a flaky page and a missing page."""
+
+    def __init__(self) -> None:
+        super().__init__(("127.0.0.1", 0), FixtureHandler)
+        self.requests: Counter[tuple[str, int]] = Counter()
+        self.flaky_failures = 2
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    server: FixtureServer
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def _reply(self, status: int, body: bytes = b"", etag: str | None = None) -> None:
+        self.server.requests[(self.path, status)] += 1
+        self.send_response(status)
+        if etag:
+            self.send_header("ETag", etag)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        if self.path == "/flaky.html" and self.server.flaky_failures:
+            self.server.flaky_failures -= 1
+            return self._reply(503)
+        name = "lambda.html" if self.path == "/flaky.html" else self.path.lstrip("/")
+        page = PAGES / name
+        if not page.exists():
+            return self._reply(404)
+        body = page.read_bytes()
+        etag = f'"{hashlib.md5(body).hexdigest()}"'
+        if self.headers.get("If-None-Match") == etag:
+            return self._reply(304, etag=etag)
+        self._reply(200, body, etag)
+
+
+@pytest.fixture
+def server():
+    server = FixtureServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+
+
+def test_fetches_concurrently_and_reports_failures(server, tmp_path) -> None:
+    urls = [f"{server.base_url}/{name}" for name in ("lambda.html", "s3.html")]
+    urls += [f"{server.base_url}/flaky.html", f"{server.base_url}/missing.html"]
+
+    results = fetch_pages(
+        urls, cache_dir=str(tmp_path), backoff=0.01, requests_per_second=50
+    )
+
+    assert [result.status for result in results] == [
+        "fetched",
+        "fetched",
+        "fetched",
+        "failed",
+    ]
+    assert results[2].attempts == 3
+    assert results[3].error == "HTTP 404"
+    assert server.requests[("/missing.html", 404)] == 1
+
+
+def test_rerun_revalidates_with_etag(server, tmp_path) -> None:
+    urls = [f"{server.base_url}/lambda.html", f"{server.base_url}/s3.html"]
+    first = fetch_pages(urls, cache_dir=str(tmp_path))
+    second = fetch_pages(urls, cache_dir=str(tmp_path))
+
+    assert [result.status for result in second] == ["not_modified", "not_modified"]
+    assert [result.html for result in second] == [result.html for result in first]
+    assert server.requests[("/lambda.html", 200)] == 1
+    assert server.requests[("/lambda.html", 304)] == 1
+
+
+def test_max_age_skips_the_request(server, tmp_path) -> None:
+    url = f"{server.base_url}/s3.html"
+    fetch_pages([url], cache_dir=str(tmp_path))
+    result = fetch_pages([url], cache_dir=str(tmp_path), max_age=3600)[0]
+
+    assert result.status == "not_modified"
+    assert sum(count for (path, _), count in server.requests.items()) == 1
+
+
+def test_unexpected_error_fails_only_its_url(server, tmp_path, monkeypatch) -> None:
+    put = HtmlCache.put
+
+    def put_or_fail(self, url: str, *args) -> None:
+        if url.endswith("/s3.html"):
+            raise OSError("No space left on device")
+        put(self, url, *args)
+
+    monkeypatch.setattr(HtmlCache, "put", put_or_fail)
+    urls = [f"{server.base_url}/lambda.html", f"{server.base_url}/s3.html"]
+    results = fetch_pages(urls, cache_dir=str(tmp_path))
+
+    assert [result.status for result in results] == ["fetched", "failed"]
+    assert results[1].error == "OSError: No space left on device"
+    assert results[1].attempts == 1
+
+
+def test_parse_page_matches_web_base_loader_metadata() -> None:
+    html = (PAGES / "lambda.html").read_text()
+    document = parse_page("https://example.com/lambda", html)
+
+    assert document.metadata == {
+        "source": "https://example.com/lambda",
+        "title": "What is AWS Lambda? - AWS Lambda",
+        "description": "Run code without provisioning servers.",
+        "language": "en",
+    }
+    assert "high-availability compute" in document.page_content
@@ -0,0 +1,69 @@
+import pytest
+from langchain_core.messages import HumanMessage
+
+from agent.graph import graph, speculative_graph
+
+
+@pytest.mark.anyio
+async def test_async_rag_route(fake_resources) -> None:
+    res = await graph.ainvoke(
+        {"messages": [HumanMessage(content="What is AWS Lambda?")]}
+    )
+
+    assert res["route_decision"] == "aws_docs"
+    assert len(res["documents"]) == 10
+    assert res["messages"][-1].content == "Answer to: What is AWS Lambda?"
+
+
+@pytest.mark.anyio
+async def test_async_direct_route(fake_resources) -> None:
+    res = await graph.ainvoke(
+        {"messages": [HumanMessage(content="What is the capital of France?")]}
+    )
+
+    assert res["route_decision"] == "direct_response"
+    assert res.get("documents") is None
+
+
+def test_sync_and_async_nodes_agree(fake_resources) -> None:
+    res = graph.invoke({"messages": [HumanMessage(content="How do S3 buckets work?")]})
+
+    assert res["route_decision"] == "aws_docs"
+    starts = [doc.metadata["start_index"] for doc in res["documents"]]
+    assert starts == sorted(starts)
+
+
+@pytest.mark.anyio
+async def test_answer_tokens_are_streamed(fake_resources) -> None:
+    chunks = []
+    async for message, metadata in graph.astream(
+        {"messages": [HumanMessage(content="What is AWS Lambda?")]},
+        stream_mode="messages",
+    ):
+        chunks.append((metadata["langgraph_node"], message.content))
+
+    nodes = {node for node, _ in chunks}
+    assert nodes == {"generate_response"}
+    assert len(chunks) > 1
+    assert "".join(content for _, content in chunks) == "Answer to: What is AWS Lambda?"
+
+
+@pytest.mark.anyio
+async def test_speculative_graph_matches_sequential(fake_resources) -> None:
+    question = {"messages": [HumanMessage(content="How do IAM roles work?")]}
+
+    sequential = await graph.ainvoke(question)
+    speculative = await speculative_graph.ainvoke(question)
+
+    assert speculative["route_decision"] == "aws_docs"
+    assert speculative["documents"] == sequential["documents"]
+    assert speculative["messages"][-1].content == sequential["messages"][-1].content
+
+
+def test_speculative_prefetch_is_discarded_for_direct_answers(fake_resources) -> None:
+    res = speculative_graph.invoke(
+        {"messages": [HumanMessage(content="What is the capital of France?")]}
+    )
+
+    assert res["route_decision"] == "direct_response"
+    assert res.get("documents") is None
@@ -0,0 +1,74 @@
+from dataclasses import replace
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.checkpoint.memory import InMemorySaver
+
+from agent.configuration import default_configuration
+from agent.graph import build_graph
+from agent.history import QueryRewriteCache, split_history
+
+
+def _turns(count: int) -> list:
+    messages = []
+    for i in range(count):
+        messages += [HumanMessage(content=f"q{i}"), AIMessage(content=f"a{i}")]
+    return messages
+
+
+def test_split_history_keeps_recent_turns() -> None:
+    messages = _turns(6)
+
+    assert split_history(messages, 12) == ([], messages)
+    assert split_history(messages, 0) == ([], messages)
+    removed, kept = split_history(messages, 7)
+    assert kept == messages[-2:]
+    assert removed == messages[:-2]
+
+
+def test_rewrite_cache_evicts_least_recently_used() -> None:
+    cache = QueryRewriteCache(max_size=2)
+    keys = [QueryRewriteCache.key("m", None, "User: hi", q) for q in "abc"]
+    cache.put(keys[0], "A")
+    cache.put(keys[1], "B")
+    assert cache.get(keys[0]) == "A"
+    cache.put(keys[2], "C")
+
+    assert cache.get(keys[1]) is None
+    assert len(cache) == 2
+    assert cache.stats.hits == 1 and cache.stats.misses == 1
+
+
+def test_follow_ups_are_condensed_once(fake_resources) -> None:
+    compiled = build_graph(checkpointer=InMemorySaver())
+    cache = fake_resources.get_rewrite_cache()
+
+    for thread in ("a", "b"):
+        config = {"configurable": {"thread_id": thread}}
+        first = compiled.invoke(
+            {"messages": [HumanMessage(content="What is AWS Lambda?")]}, config
+        )
+        assert first["question"] == "What is AWS Lambda?"
+        follow_up = compiled.invoke(
+            {"messages": [HumanMessage(content="How is it priced?")]}, config
+        )
+        assert follow_up["question"] == "Answer to: How is it priced?"
+
+    assert cache.stats.misses == 1 and cache.stats.hits == 1
+
+
+def test_long_threads_are_trimmed_and_summarised(fake_resources) -> None:
+    compiled = build_graph(
+        replace(default_configuration(), history_max_messages=6),
+        checkpointer=InMemorySaver(),
+    )
+    config = {"configurable": {"thread_id": "long"}}
+
+    for i in range(10):
+        state = compiled.invoke(
+            {"messages": [HumanMessage(content=f"Tell me about EC2, part {i}")]},
+            config,
+        )
+        assert len(state["messages"]) <= 6
+
+    assert isinstance(state["messages"][0], HumanMessage)
+    assert state["summary"]
@@ -0,0 +1,126 @@
+from collections.abc import AsyncIterator
+
+import chromadb
+import pytest
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+
+import tools.pipeline
+from benchmarks.fakes import FakeEmbeddings
+from tools.fetcher import FetchResult
+from tools.incremental import IndexManifest, chunk_id, page_hash
+from tools.pipeline import PageChunks, run_pipeline
+
+splitter = RecursiveCharacterTextSplitter(
+    chunk_size=45, chunk_overlap=0, add_start_index=True
+)
+
+
+def text_split(url: str, text: str, known_hash: str | None) -> PageChunks:
+    page = Document(page_content=text, metadata={"source": url})
+    digest = page_hash(page)
+    if digest == known_hash:
+        return PageChunks(url, digest, None)
+    return PageChunks(url, digest, splitter.split_documents([page]))
+
+
+class CountingEmbeddings(FakeEmbeddings):
+    def __init__(self) -> None:
+        super().__init__()
+        self.embedded: list[str] = []
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        self.embedded.extend(texts)
+        return super().embed_documents(texts)
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        self.embedded.extend(texts)
+        return await super().aembed_documents(texts)
+
+
+LAMBDA = ["Lambda runs code without servers.", "Functions scale automatically."]
+S3 = ["S3 stores objects in buckets.", "Lifecycle rules move objects."]
+
+
+@pytest.fixture
+def site(monkeypatch):
+    pages: dict[str, list[str] | None] = {}
+
+    async def fake_aiter_pages(urls, **kwargs) -> AsyncIterator[FetchResult]:
+        for url in urls:
+            if (paragraphs := pages.get(url)) is None:
+                yield FetchResult(url, "failed", error="HTTP 503")
+            else:
+                yield FetchResult(url, "fetched", "\n\n".join(paragraphs))
+
+    monkeypatch.setattr(tools.pipeline, "aiter_pages", fake_aiter_pages)
+    return pages
+
+
+def _index(tmp_path, sources):
+    embeddings = CountingEmbeddings()
+    client = chromadb.PersistentClient(str(tmp_path / "chroma"))
+    store = Chroma(collection_name="test", embedding_function=embeddings, client=client)
+    manifest = IndexManifest.for_directory(str(tmp_path / "chroma"))
+    result = run_pipeline(
+        sources,
+        client.get_collection("test"),
+        embeddings,
+        manifest,
+        split=text_split,
+        processes=0,
+    )
+    return store, embeddings, result
+
+
+def test_chunk_ids_are_stable() -> None:
+    assert chunk_id("a", 0, "text") == chunk_id("a", 0, "text")
+    assert chunk_id("a", 0, "text") != chunk_id("a", 1, "text")
+    assert chunk_id("a", 0, "text") != chunk_id("b", 0, "text")
+
+
+def test_unchanged_rerun_embeds_nothing(tmp_path, site) -> None:
+    site.update({"lambda": LAMBDA, "s3": S3})
+    store, embeddings, result = _index(tmp_path, ["lambda", "s3"])
+    assert len(embeddings.embedded) == result.added == 4
+    assert len(store.get()["ids"]) == 4
+
+    store, embeddings, result = _index(tmp_path, ["lambda", "s3"])
+    assert not result.changed
+    assert result.unchanged == 2
+    assert embeddings.embedded == []
+    assert len(store.get()["ids"]) == 4
+
+
+def test_changed_page_only_embeds_new_chunks(tmp_path, site) -> None:
+    site.update({"lambda": LAMBDA, "s3": S3})
+    _index(tmp_path, ["lambda", "s3"])
+
+    edited = [LAMBDA[0], "Functions scale to thousands of requests."]
+    site["lambda"] = edited
+    store, embeddings, result = _index(tmp_path, ["lambda", "s3"])
+
+    assert embeddings.embedded == [edited[1]]
+    assert result.deleted == 1
+    contents = sorted(store.get()["documents"])
+    assert edited[1] in contents
+    assert LAMBDA[1] not in contents
+    assert len(contents) == 4
+
+
+def test_removed_source_is_deleted_and_failed_source_kept(tmp_path, site) -> None:
+    site.update({"lambda": LAMBDA, "s3": S3})
+    _index(tmp_path, ["lambda", "s3"])
+
+    site["s3"] = None
+    store, embeddings, result = _index(tmp_path, ["lambda", "s3"])
+    assert not result.changed
+    assert result.failed == {"s3": "HTTP 503"}
+    assert len(store.get()["ids"]) == 4
+
+    store, embeddings, result = _index(tmp_path, ["lambda"])
+    assert embeddings.embedded == []
+    assert result.deleted == 2
+    assert {m["source"] for m in store.get()["metadatas"]} == {"lambda"}
+    assert set(result.manifest.sources) == {"lambda"}
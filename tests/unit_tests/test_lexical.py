@@ -0,0 +1,81 @@
+import os
+
+import pytest
+from langchain_core.messages import HumanMessage
+
+from agent.graph import graph
+from agent.lexical import (
+    BM25Index,
+    LexicalIndexFile,
+    reciprocal_rank_fusion,
+    tokenize,
+)
+from tools.pipeline import build_lexical_index
+
+CHUNKS = [
+    ("a", "The m7g.large instance type has 2 vCPUs and 8 GiB of memory."),
+    ("b", "The c7g.large instance type has 2 vCPUs and 4 GiB of memory."),
+    ("c", "Grant s3:GetObject to read objects from a bucket."),
+    ("d", "Lambda functions scale with the number of requests."),
+]
+
+
+def test_compound_tokens_are_kept_and_split() -> None:
+    assert tokenize("Allow s3:GetObject on m7g.large") == [
+        "allow",
+        "s3:getobject",
+        "s3",
+        "getobject",
+        "on",
+        "m7g.large",
+        "m7g",
+        "large",
+    ]
+
+
+def test_exact_token_ranks_first(tmp_path) -> None:
+    index = BM25Index.build(CHUNKS)
+    assert index.search("How much memory does m7g.large have?", k=2)[0][0] == "a"
+    assert index.search("s3:GetObject permission", k=1)[0][0] == "c"
+    assert index.search("unrelated words", k=3) == []
+
+    path = str(tmp_path / "bm25.npz")
+    index.save(path)
+    loaded = BM25Index.load(path)
+    assert loaded.search("c7g.large memory", k=4) == index.search(
+        "c7g.large memory", k=4
+    )
+
+
+def test_index_file_reloads_after_rebuild(tmp_path) -> None:
+    path = str(tmp_path / "bm25.npz")
+    handle = LexicalIndexFile(path)
+    assert handle.get() is None
+
+    BM25Index.build(CHUNKS[:1]).save(path)
+    assert len(handle.get() or []) == 1
+
+    BM25Index.build(CHUNKS).save(path)
+    os.utime(path, ns=(0, 1))
+    assert len(handle.get() or []) == 4
+
+
+def test_reciprocal_rank_fusion_rewards_agreement() -> None:
+    assert reciprocal_rank_fusion([["a", "b", "c"], ["c", "a"]]) == ["a", "c", "b"]
+
+
+@pytest.mark.anyio
+async def test_graph_fuses_lexical_hits(fake_resources, tmp_path) -> None:
+    vector_store = fake_resources.get_vector_store()
+    path = str(tmp_path / "bm25.npz")
+    build_lexical_index(vector_store, path, page_size=7)
+    fake_resources.get_lexical_index().path = path
+
+    question = "Which guide section 37 covers S3?"
+    res = await graph.ainvoke({"messages": [HumanMessage(content=question)]})
+    sync_res = graph.invoke({"messages": [HumanMessage(content=question)]})
+
+    for result in (res, sync_res):
+        contents = [doc.page_content for doc in result["documents"]]
+        assert len(contents) == 10
+        assert any("section 37." in content for content in contents)
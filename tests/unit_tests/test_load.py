@@ -0,0 +1,41 @@
+import argparse
+
+import pytest
+
+from benchmarks.load import DEFAULT_QUESTIONS, percentiles, run
+
+
+def test_percentiles_are_in_milliseconds() -> None:
+    assert percentiles([]) == {}
+    assert percentiles([0.5]) == {"p50_ms": 500, "p95_ms": 500, "p99_ms": 500}
+    assert percentiles([i / 1000 for i in range(1, 102)])["p99_ms"] == 100
+
+
+@pytest.mark.anyio
+async def test_load_harness_reports_every_route() -> None:
+    args = argparse.Namespace(
+        levels=[1, 4],
+        requests=8,
+        questions=DEFAULT_QUESTIONS,
+        corpus_size=40,
+        llm_latency=0.0,
+        token_latency=0.0,
+        embedding_latency=0.0,
+        answer_cache=False,
+        speculative=False,
+        rerank=False,
+        trace_memory=True,
+        output=None,
+        baseline=None,
+    )
+
+    results = await run(args)
+
+    assert [level["concurrency"] for level in results["levels"]] == [1, 4]
+    for level in results["levels"]:
+        assert level["errors"] == {}
+        assert sum(r["requests"] for r in level["routes"].values()) == 8
+        assert level["latency"]["p50_ms"] <= level["latency"]["p99_ms"]
+        assert level["nodes"]["route_question"]["runs"] == 8
+        assert level["peak_heap_mb"] > 0
+    assert results["parameters"]["corpus_size"] == 40
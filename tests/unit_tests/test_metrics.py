@@ -0,0 +1,124 @@
+import json
+import urllib.request
+
+import pytest
+from langchain_core.messages import HumanMessage
+
+from agent.graph import graph
+from agent.metrics import (
+    LogExporter,
+    MetricsRegistry,
+    OpenMetricsExporter,
+    PrometheusExporter,
+    serve_metrics,
+    set_metrics,
+)
+from tools.pipeline import StageStats
+
+
+@pytest.fixture
+def metrics():
+    registry = MetricsRegistry()
+    previous = set_metrics(registry)
+    yield registry
+    set_metrics(previous)
+
+
+def test_histogram_renders_cumulative_buckets() -> None:
+    registry = MetricsRegistry()
+    latency = registry.histogram("op_seconds", "Op latency", ["op"], [0.1, 1])
+    for value in (0.05, 0.5, 0.5, 5):
+        latency.observe(value, op="a")
+    registry.counter("ops", "Ops", ["op"]).inc(2, op='say "hi"')
+
+    text = PrometheusExporter().render(registry)
+
+    assert "# TYPE op_seconds histogram" in text
+    assert 'op_seconds_bucket{op="a",le="0.1"} 1' in text
+    assert 'op_seconds_bucket{op="a",le="1"} 3' in text
+    assert 'op_seconds_bucket{op="a",le="+Inf"} 4' in text
+    assert 'op_seconds_count{op="a"} 4' in text
+    assert "# TYPE ops_total counter" in text
+    assert 'ops_total{op="say \\"hi\\""} 2' in text
+    assert latency.quantile(0.5, op="a") == pytest.approx(0.55)
+
+    openmetrics = OpenMetricsExporter().render(registry)
+    assert "# TYPE ops counter" in openmetrics
+    assert openmetrics.endswith("# EOF\n")
+
+
+def test_labels_and_types_are_checked() -> None:
+    registry = MetricsRegistry()
+    counter = registry.counter("ops", "Ops", ["op"])
+
+    with pytest.raises(ValueError):
+        counter.inc(other="x")
+    with pytest.raises(ValueError):
+        registry.histogram("ops", "Ops")
+    assert registry.counter("ops", "Ops", ["op"]) is counter
+
+
+def test_log_exporter_summarises_histograms() -> None:
+    registry = MetricsRegistry()
+    registry.histogram("op_seconds", "Op latency").observe(0.2)
+
+    (line,) = LogExporter().render(registry).splitlines()
+    family = json.loads(line)
+
+    assert family["metric"] == "op_seconds"
+    assert family["series"][0]["count"] == 1
+    assert 0.1 < family["series"][0]["p50"] <= 0.25
+
+
+def test_metrics_are_served_over_http(metrics) -> None:
+    metrics.counter("ops", "Ops").inc()
+    server = serve_metrics(0, host="127.0.0.1")
+    try:
+        url = f"http://127.0.0.1:{server.server_port}/metrics"
+        with urllib.request.urlopen(url) as response:
+            body = response.read().decode()
+    finally:
+        server.shutdown()
+
+    assert "ops_total 1" in body
+
+
+def test_pipeline_stages_are_recorded(metrics) -> None:
+    stats = StageStats("embed")
+    with stats.timed(3):
+        pass
+    stats.count(2)
+
+    assert stats.items == 5
+    duration = metrics.histogram(
+        "indexer_stage_duration_seconds", "Wall time of indexer stage work", ["stage"]
+    )
+    assert duration.count(stage="embed") == 1
+    items = metrics.counter(
+        "indexer_stage_items", "Items produced by indexer stages", ["stage"]
+    )
+    assert items.value(stage="embed") == 5
+
+
+@pytest.mark.anyio
+async def test_graph_nodes_are_instrumented(fake_resources, metrics) -> None:
+    await graph.ainvoke({"messages": [HumanMessage(content="What is AWS Lambda?")]})
+    graph.invoke({"messages": [HumanMessage(content="What is AWS Lambda?")]})
+
+    text = PrometheusExporter().render(metrics)
+    for node in ("route_question", "retrieve_documents", "generate_response"):
+        assert f'agent_node_duration_seconds_count{{node="{node}"}} 2' in text
+    for operation in ("embed_query", "vector_search", "context_assembly"):
+        assert (
+            f'agent_operation_duration_seconds_count{{operation="{operation}"}} 2'
+            in text
+        )
+    assert 'agent_documents_sum{node="retrieve_documents"} 20' in text
+    assert 'agent_context_tokens_count{stage="prompt"} 2' in text
+    assert (
+        'agent_llm_tokens_count{node="generate_response",model="gpt-4o-mini",'
+        'type="completion"} 2' in text
+    )
+    assert (
+        'agent_llm_cost_usd_total{node="generate_response",model="gpt-4o-mini"}' in text
+    )
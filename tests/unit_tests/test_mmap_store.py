@@ -0,0 +1,135 @@
+import os
+
+import numpy as np
+import pytest
+from langchain_core.messages import HumanMessage
+
+from agent.graph import build_graph
+from agent.mmap_store import (
+    FORMAT_VERSION,
+    MmapVectorStore,
+    current_version,
+    export_chroma,
+    export_format,
+    mmap_store_path,
+    write_mmap_store,
+)
+from benchmarks.fakes import FakeEmbeddings
+
+
+def _write(directory: str, count: int, ann_min_vectors: int) -> np.ndarray:
+    vectors = np.random.default_rng(0).standard_normal((count, 16))
+    write_mmap_store(
+        directory,
+        [f"chunk-{i}" for i in range(count)],
+        [f"Chunk {i} ünïcode" for i in range(count)],
+        [
+            {"source": f"page-{i}", "title": "T" if i % 2 else None}
+            for i in range(count)
+        ],
+        vectors,
+        ann_min_vectors=ann_min_vectors,
+    )
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_exact_and_ivf_search_match_brute_force(tmp_path) -> None:
+    directory = str(tmp_path / "store")
+    vectors = _write(directory, 300, ann_min_vectors=100)
+    query = vectors[7] + 0.1
+    expected = [f"chunk-{i}" for i in np.argsort(-(vectors @ query))[:5]]
+
+    exact = MmapVectorStore(directory, FakeEmbeddings(16), nprobe=0)
+    assert not exact.uses_ann
+    assert [d.id for d in exact.similarity_search_by_vector(query, k=5)] == expected
+
+    # Probing every list visits every vector
+    lists = exact.manifest["ivf_lists"]
+    ivf = MmapVectorStore(directory, FakeEmbeddings(16), nprobe=lists)
+    assert ivf.uses_ann
+    assert [d.id for d in ivf.similarity_search_by_vector(query, k=5)] == expected
+    assert [
+        [d.id for d in documents]
+        for documents in exact.similarity_search_by_vectors([query, vectors[3]], k=5)
+    ][0] == expected
+
+
+def test_documents_round_trip_and_rewrite(tmp_path) -> None:
+    directory = str(tmp_path / "store")
+    _write(directory, 4, ann_min_vectors=100)
+    store = MmapVectorStore(directory, FakeEmbeddings(16))
+
+    first, second = store.get_by_ids(["chunk-1", "missing", "chunk-0"])
+    assert first.page_content == "Chunk 1 ünïcode"
+    assert first.metadata == {"source": "page-1", "title": "T"}
+    assert second.metadata == {"source": "page-0"}
+
+    # Everything but the manifest is in mmap-able files
+    version = os.path.join(directory, str(current_version(directory)))
+    assert [name for name in os.listdir(version) if name.endswith(".json")] == [
+        "manifest.json"
+    ]
+    assert export_format(directory) == FORMAT_VERSION
+
+    with pytest.raises(TypeError, match="read-only"):
+        store.add_texts(["new chunk"])
+
+    write_mmap_store(directory, [], [], [], np.zeros((0, 16)))
+    assert len(store) == 0 and store.similarity_search("lambda") == []
+
+
+def test_ids_and_metadata_values_are_looked_up_by_row(tmp_path) -> None:
+    directory = str(tmp_path / "store")
+    ids = ["b", "a", "é", "c-10", "c-9"]
+    metadatas = [{"start_index": i, "score": i / 2, "ok": i % 2 == 0} for i in range(5)]
+    write_mmap_store(directory, ids, ids, metadatas, np.eye(5))
+    store = MmapVectorStore(directory, FakeEmbeddings(5))
+
+    documents = store.get_by_ids(["é", "c-9", "b", "c"])
+    assert [d.id for d in documents] == [d.page_content for d in documents]
+    assert [d.id for d in documents] == ["é", "c-9", "b"]
+    assert documents[0].metadata == {"start_index": 2, "score": 1.0, "ok": True}
+
+
+def test_open_stores_follow_new_exports(tmp_path) -> None:
+    directory = str(tmp_path / "store")
+    _write(directory, 4, ann_min_vectors=100)
+    first = current_version(directory)
+    store = MmapVectorStore(directory, FakeEmbeddings(16))
+
+    for count in (3, 2):
+        _write(directory, count, ann_min_vectors=100)
+
+    # Only the current and the previous versions are kept
+    versions = {name for name in os.listdir(directory) if name.startswith("v-")}
+    assert first not in versions and current_version(directory) in versions
+    assert len(versions) == 2
+    assert store.version == current_version(directory) and len(store) == 2
+    assert [d.id for d in store.get_by_ids(["chunk-1", "chunk-3"])] == ["chunk-1"]
+
+
+def test_graph_retrieves_the_same_chunks_from_the_export(fake_resources) -> None:
+    chroma = fake_resources.get_vector_store()
+    persist_directory = chroma._persist_directory
+    export_chroma(chroma, mmap_store_path(persist_directory, "rag-chroma"))
+
+    compiled = build_graph()
+    question = {"messages": [HumanMessage(content="How do S3 buckets work?")]}
+    results = {
+        backend: compiled.invoke(
+            question,
+            {
+                "configurable": {
+                    "persist_directory": persist_directory,
+                    "retriever": "dense",
+                    "vector_store": backend,
+                    "ann_nprobe": 0,
+                }
+            },
+        )
+        for backend in ("chroma", "mmap")
+    }
+    # The synthetic chunks tie, so only the retrieved set is comparable
+    assert sorted(doc.id for doc in results["mmap"]["documents"]) == sorted(
+        doc.id for doc in results["chroma"]["documents"]
+    )
@@ -0,0 +1,115 @@
+from collections.abc import AsyncIterator
+
+import chromadb
+import pytest
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_chroma import Chroma
+
+import tools.pipeline
+from benchmarks.fakes import FakeEmbeddings
+from tools.fetcher import FetchResult, parse_page
+from tools.incremental import IndexManifest, page_hash
+from tools.pipeline import PageChunks, run_pipeline
+
+splitter = RecursiveCharacterTextSplitter(
+    chunk_size=80, chunk_overlap=0, add_start_index=True
+)
+
+
+def plain_split(url: str, html: str, known_hash: str | None) -> PageChunks:
+    page = parse_page(url, html)
+    digest = page_hash(page)
+    if digest == known_hash:
+        return PageChunks(url, digest, None)
+    return PageChunks(url, digest, splitter.split_documents([page]))
+
+
+class CountingEmbeddings(FakeEmbeddings):
+    def __init__(self) -> None:
+        super().__init__()
+        self.embedded = 0
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        self.embedded += len(texts)
+        return super().embed_documents(texts)
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        self.embedded += len(texts)
+        return await super().aembed_documents(texts)
+
+
+def _html(title: str, paragraphs: int) -> str:
+    body = "".join(
+        f"<p>{title} paragraph {i} explains one more detail of the service.</p>\n\n"
+        for i in range(paragraphs)
+    )
+    return f"<html><head><title>{title}</title></head><body>{body}</body></html>"
+
+
+@pytest.fixture
+def site(monkeypatch):
+    pages: dict[str, str | None] = {
+        f"https://docs/{i}": _html(f"Page {i}", 6) for i in range(12)
+    }
+
+    async def fake_aiter_pages(urls, **kwargs) -> AsyncIterator[FetchResult]:
+        for url in urls:
+            html = pages.get(url)
+            if html is None:
+                yield FetchResult(url, "failed", error="HTTP 503")
+            else:
+                yield FetchResult(url, "fetched", html)
+
+    monkeypatch.setattr(tools.pipeline, "aiter_pages", fake_aiter_pages)
+    return pages
+
+
+def _run(tmp_path, urls, processes=0):
+    embeddings = CountingEmbeddings()
+    client = chromadb.PersistentClient(str(tmp_path / "chroma"))
+    store = Chroma(collection_name="test", embedding_function=embeddings, client=client)
+    manifest = IndexManifest.for_directory(str(tmp_path / "chroma"))
+    result = run_pipeline(
+        urls,
+        client.get_collection("test"),
+        embeddings,
+        manifest,
+        split=plain_split,
+        processes=processes,
+        queue_size=2,
+    )
+    return store, embeddings, result
+
+
+@pytest.mark.parametrize("processes", [0, 2])
+def test_pipeline_indexes_every_page(tmp_path, site, processes) -> None:
+    store, embeddings, result = _run(tmp_path, list(site), processes)
+
+    chunks = len(store.get()["ids"])
+    assert chunks > len(site)
+    assert result.added == embeddings.embedded == chunks
+    assert result.stages["fetch"].items == result.stages["split"].items == len(site)
+    assert result.stages["embed"].items == result.stages["upsert"].items == chunks
+    assert all(stats.busy >= 0 for stats in result.stages.values())
+    assert result.manifest.chunk_count == chunks
+
+
+def test_rerun_only_touches_changed_pages(tmp_path, site) -> None:
+    urls = list(site)
+    store, _, first = _run(tmp_path, urls)
+
+    site[urls[0]] = _html("Page 0 rewritten", 6)
+    site[urls[1]] = None
+    store, embeddings, result = _run(tmp_path, urls[:-1])
+
+    assert result.unchanged == len(urls) - 3
+    assert result.failed == {urls[1]: "HTTP 503"}
+    assert embeddings.embedded == result.added > 0
+    old = first.manifest.sources
+    assert result.deleted == len(old[urls[0]].chunk_ids) + len(old[urls[-1]].chunk_ids)
+    assert {m["source"] for m in store.get()["metadatas"]} == set(urls[:-1])
+    assert len(store.get()["ids"]) == result.manifest.chunk_count
+
+    _, embeddings, result = _run(tmp_path, urls[:-1])
+    assert embeddings.embedded == 0
+    assert not result.changed
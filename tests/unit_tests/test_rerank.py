@@ -0,0 +1,84 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+from langchain_core.messages import HumanMessage
+
+from agent.context import RANK_KEY
+from agent.graph import create_workflow
+from agent.rerank import BoundedReranker, LexicalReranker
+
+CANDIDATES = [
+    Document(page_content="Lambda functions scale with the number of requests."),
+    Document(page_content="The m7g.large instance type has 2 vCPUs."),
+    Document(page_content="Amazon S3 stores objects in buckets."),
+    Document(page_content="Grant s3:GetObject to read objects from a bucket."),
+]
+
+
+class SlowReranker:
+    def __init__(self) -> None:
+        self.release = threading.Event()
+
+    def score(self, question, documents) -> np.ndarray:
+        self.release.wait(5)
+        return np.arange(len(documents), dtype=np.float32)
+
+
+def test_lexical_scores_favour_matching_terms() -> None:
+    scores = LexicalReranker().score("How do I grant s3:GetObject?", CANDIDATES)
+
+    assert scores.shape == (4,)
+    assert int(np.argmax(scores)) == 3
+    assert scores[3] > scores[2] > scores[1]
+
+
+def test_rerank_keeps_top_n_by_score() -> None:
+    reranker = BoundedReranker(LexicalReranker(), timeout=5)
+
+    kept = reranker.rerank("How many vCPUs does m7g.large have?", CANDIDATES, 2)
+
+    assert kept[0] is CANDIDATES[1]
+    assert len(kept) == 2
+    assert reranker.stats.calls == 1 and reranker.stats.fallbacks == 0
+
+
+@pytest.mark.anyio
+async def test_slow_rerank_falls_back_to_retrieval_order() -> None:
+    slow = SlowReranker()
+    reranker = BoundedReranker(slow, timeout=0.01, workers=1)
+    try:
+        assert reranker.rerank("q", CANDIDATES, 2) == CANDIDATES[:2]
+        assert await reranker.arerank("q", CANDIDATES, 3) == CANDIDATES[:3]
+        # The late score still holds the only worker, so the second call skipped
+        assert reranker.stats.fallbacks == 2 and reranker.stats.skipped == 1
+
+        slow.release.set()
+        reranker.timeout = 5
+        deadline = time.monotonic() + 5
+        while reranker.stats.skipped == reranker.stats.calls - 1:
+            kept = reranker.rerank("q", CANDIDATES, 1)
+            assert time.monotonic() < deadline
+        # Once the late score lands, calls are scored again
+        assert kept == [CANDIDATES[3]]
+    finally:
+        slow.release.set()
+        reranker.close()
+
+
+@pytest.mark.anyio
+async def test_graph_reranks_candidates(fake_resources) -> None:
+    graph = create_workflow(rerank=True).compile()
+    question = "Which guide section 37 covers S3?"
+
+    res = await graph.ainvoke({"messages": [HumanMessage(content=question)]})
+    sync_res = graph.invoke({"messages": [HumanMessage(content=question)]})
+
+    for result in (res, sync_res):
+        documents = result["documents"]
+        assert len(documents) == 10
+        assert sorted(d.metadata[RANK_KEY] for d in documents) == list(range(10))
+        best = min(documents, key=lambda d: d.metadata[RANK_KEY])
+        assert "section 37." in best.page_content
@@ -0,0 +1,106 @@
+import logging
+import threading
+
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models import FakeListChatModel
+
+from agent.admission import AdmissionPolicy
+from agent.configuration import Configuration
+from agent.resources import ResourceRegistry, get_registry, set_registry
+
+
+def _registry(calls: list[str]) -> ResourceRegistry:
+    def chat_model_factory(model: str, temperature: float):
+        calls.append(f"chat:{model}:{temperature}")
+        return FakeListChatModel(responses=["ok"])
+
+    def embeddings_factory(model: str):
+        calls.append(f"embeddings:{model}")
+        return DeterministicFakeEmbedding(size=8)
+
+    def vector_store_factory(collection_name, embedding_function, persist_directory):
+        calls.append(f"store:{collection_name}:{persist_directory}")
+        return object()
+
+    return ResourceRegistry(
+        chat_model_factory=chat_model_factory,
+        embeddings_factory=embeddings_factory,
+        vector_store_factory=vector_store_factory,
+    )
+
+
+def test_resources_are_shared_per_configuration() -> None:
+    calls: list[str] = []
+    registry = _registry(calls)
+
+    assert registry.get_chat_model("a") is registry.get_chat_model("a")
+    assert registry.get_chat_model("a") is not registry.get_chat_model("b")
+    assert registry.get_vector_store() is registry.get_vector_store()
+
+    assert calls.count("chat:a:0") == 1
+    assert calls.count("embeddings:text-embedding-3-small") == 1
+    assert len([c for c in calls if c.startswith("store:")]) == 1
+
+
+def test_concurrent_first_use_builds_once() -> None:
+    calls: list[str] = []
+    registry = _registry(calls)
+    barrier = threading.Barrier(8)
+    results = []
+
+    def worker() -> None:
+        barrier.wait()
+        results.append(registry.get_embeddings())
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert calls == ["embeddings:text-embedding-3-small"]
+    assert all(result is results[0] for result in results)
+
+
+@pytest.mark.anyio
+async def test_async_accessors_share_instances() -> None:
+    calls: list[str] = []
+    registry = _registry(calls)
+
+    model = await registry.aget_chat_model()
+    assert model is registry.get_chat_model()
+    assert await registry.aget_vector_store() is registry.get_vector_store()
+
+    await registry.ashutdown()
+    assert len(registry) == 0
+
+
+def test_registry_settings_come_from_the_configuration() -> None:
+    registry = ResourceRegistry.from_configuration(
+        Configuration(
+            embedding_cache_path=None, llm_max_concurrency=2, request_coalescing=False
+        )
+    )
+
+    admission = registry.get_admission("llm", "gpt-4o-mini")
+    assert admission is not None
+    assert admission.policy == AdmissionPolicy(max_concurrency=2, coalesce=False)
+    assert registry.get_admission("embeddings", "text-embedding-3-small") is None
+    assert registry._embedding_cache_path is None
+
+
+def test_process_registry_is_created_on_first_use() -> None:
+    previous = set_registry(None)
+    try:
+        registry = get_registry()
+        assert registry is get_registry() and len(registry) == 0
+    finally:
+        set_registry(previous)
+
+
+def test_warm_up_counts_the_chunks(fake_resources, caplog) -> None:
+    with caplog.at_level(logging.INFO, logger="agent.resources"):
+        fake_resources.warm_up(chat_models=())
+
+    assert "with 40 chunks" in caplog.text
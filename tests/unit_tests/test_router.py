@@ -0,0 +1,97 @@
+import asyncio
+import threading
+
+import pytest
+
+from agent.router import CentroidClassifier, LocalRouter, RouterStats, match_aws_terms
+from benchmarks.fakes import FakeEmbeddings
+
+
+def test_keyword_matcher_skips_ambiguous_terms() -> None:
+    assert match_aws_terms("How do I configure an S3 bucket?") == "aws_docs"
+    assert match_aws_terms("What are security groups?") == "aws_docs"
+    assert match_aws_terms("What is a lambda function in Python?") is None
+    assert match_aws_terms("Where is Amsterdam?") is None
+    assert match_aws_terms("Did my Amazon order ship?") is None
+    assert match_aws_terms("What does ami mean in French?") is None
+    for question in (
+        "When is the best time to see the aurora borealis?",
+        "What causes redshift in astronomy?",
+        "How deep is the bedrock under Manhattan?",
+        "Which SNS is most popular in Japan?",
+        "What is kinesis in biology?",
+    ):
+        assert match_aws_terms(question) is None
+    assert match_aws_terms("What is Amazon Aurora Serverless?") == "aws_docs"
+    assert match_aws_terms("How do I publish to an AWS SNS topic?") == "aws_docs"
+
+
+def test_centroid_classifier_recognises_its_examples() -> None:
+    examples = {
+        "aws_docs": ("lambda concurrency limits", "bucket lifecycle policy"),
+        "direct_response": ("bake sourdough bread", "poem about the sea"),
+    }
+    classifier = CentroidClassifier(FakeEmbeddings(), examples, min_margin=0.05)
+
+    assert classifier.classify("bucket lifecycle policy") == "aws_docs"
+    assert classifier.classify("bake bread") == "direct_response"
+
+
+def test_router_abstains_when_unsure() -> None:
+    examples = {"aws_docs": ("same words",), "direct_response": ("same words",)}
+    router = LocalRouter(CentroidClassifier(FakeEmbeddings(), examples))
+
+    assert router.route("same words") == (None, "llm")
+    assert router.route("Describe an EC2 instance") == ("aws_docs", "keyword")
+
+
+@pytest.mark.anyio
+async def test_async_route_matches_sync() -> None:
+    router = LocalRouter(CentroidClassifier(FakeEmbeddings()))
+
+    for question in ("What is AWS Lambda?", "How to cook pasta?"):
+        assert await router.aroute(question) == router.route(question)
+
+
+@pytest.mark.anyio
+async def test_concurrent_first_calls_fit_the_centroids_once() -> None:
+    calls = []
+
+    class CountingEmbeddings(FakeEmbeddings):
+        def embed_documents(self, texts: list[str]) -> list[list[float]]:
+            calls.append(len(texts))
+            return super().embed_documents(texts)
+
+    classifier = CentroidClassifier(CountingEmbeddings(latency=0.02))
+    results = await asyncio.gather(*(classifier.acentroids() for _ in range(4)))
+
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+
+
+def test_stats_report_fallback_rate_and_latency() -> None:
+    stats = RouterStats()
+    stats.record("keyword", 0.001)
+    stats.record("centroid", 0.003)
+    stats.record("llm", 0.4)
+    stats.record("llm", 0.6)
+
+    assert stats.fallback_rate == 0.5
+    assert stats.mean_latency("llm") == pytest.approx(0.5)
+    assert stats.mean_latency() == pytest.approx(0.251)
+
+
+def test_stats_are_safe_to_record_from_threads() -> None:
+    stats = RouterStats()
+
+    def record() -> None:
+        for _ in range(1000):
+            stats.record("keyword", 0.001)
+
+    threads = [threading.Thread(target=record) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert stats.total == 4000